@@ -245,7 +245,7 @@ DEFAULT_GROUPS = [
         'stats': [
             {
                 'model': 'Activity',
-                'filters': { 'c_tags__icontains': '"staff"' },
+                'filters': { 'indexed_tags__tag': 'staff' },
                 'template': _('Posted {total} news'),
             },
         ],
@@ -377,7 +377,7 @@ DEFAULT_GROUPS = [
         'stats': [
             {
                 'model': 'Activity',
-                'filters': { 'c_tags__icontains': '"news"' },
+                'filters': { 'indexed_tags__tag': 'news' },
                 'template': _('Organized and posted about {total} community events'),
             },
         ],
@@ -1419,3 +1419,19 @@ DEFAULT_HOMEPAGE_ART_POSITION = {
     'y': 'center',
     'x': 'center',
 }
+
+############################################################
+# Default retention policies
+# Old items deleted by the purge_old_items command (also called by cron_notifications).
+# Other models can be added, ex:
+# ('privatemessage', { 'model': 'magi.PrivateMessage', 'filters': { 'seen': True }, 'days': 365 })
+# Filters should be covered by an index that ends with the date field.
+
+DEFAULT_RETENTION_POLICIES = OrderedDict([
+    ('notification', {
+        'model': 'magi.Notification',
+        'filters': { 'seen': True },
+        'date_field': 'creation',
+        'days': 30 * 6,
+    }),
+])
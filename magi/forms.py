@@ -120,6 +120,7 @@ from magi.utils import (
     isCharacterModelClass,
 )
 from magi.magidisplay import MagiDisplay, _MagiDisplayMultiple, MagiDisplayLink
+from magi.search import getSearchBackend, getSearchIndexFields, getSearchTerms
 from versions_utils import sortByRelevantVersions
 
 forms.Form.form_title = None
@@ -1470,9 +1471,22 @@ class MagiFiltersForm(AutoForm):
 
     def _search_to_queryset(self, queryset, request, value):
         terms = value.split(' ')
+        # Fields in SEARCH_INDEX_FIELDS of the model are searched with the search backend
+        indexed_fields = getSearchIndexFields(queryset.model)
+        search_backend = getSearchBackend() if indexed_fields else None
+        indexed_words = []
         for term in terms:
             condition = Q()
+            words = getSearchTerms(term) if indexed_fields else []
+            if words:
+                index_condition = Q()
+                for word in words:
+                    index_condition &= search_backend.condition(queryset.model, word)
+                condition |= index_condition
+                indexed_words += words
             for field_name in getattr(self, 'search_fields', []):
+                if words and field_name in indexed_fields:
+                    continue
                 # Translated fields
                 if field_name.startswith('d_') and field_name[2:-1] in (
                         getattr(self, 'search_fields', []) + getattr(self, 'search_fields_exact', [])):
@@ -1497,6 +1511,8 @@ class MagiFiltersForm(AutoForm):
                 else:
                     condition |= Q(**{ '{}__iexact'.format(field_name): term })
             queryset = queryset.filter(condition)
+        if indexed_words:
+            queryset = search_backend.rank(queryset, listUnique(indexed_words))
         if self.search_filter.distinct or any(
             '__' in _term for _term in (
                 getattr(self, 'search_fields', [])
@@ -3699,10 +3715,13 @@ class FilterActivities(MagiFiltersForm):
 
     show_more = FormShowMore(cutoff='is_popular')
 
-    c_tags_filter = MagiFilter(selector=u'c_tags', operator_for_multiple=MagiFilterOperator.And)
+    def _tags_to_queryset(self, queryset, request, value):
+        return models.filterActivitiesWithTags(queryset, value if isinstance(value, list) else [value])
+
+    c_tags_filter = MagiFilter(to_queryset=_tags_to_queryset)
 
     c_past_tags = forms.MultipleChoiceField(required=False, widget=forms.CheckboxSelectMultiple, label=_('Past tags'))
-    c_past_tags_filter = MagiFilter(selector=u'c_tags', operator_for_multiple=MagiFilterOperator.And)
+    c_past_tags_filter = MagiFilter(to_queryset=_tags_to_queryset)
 
     with_image = forms.NullBooleanField(label=_('Image'))
     with_image_filter = MagiFilter(selector='image__isnull')
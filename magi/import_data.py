@@ -1,9 +1,13 @@
 from __future__ import print_function
-import requests, json, os.path
+import requests, json, os.path, hashlib, threading, time
+from collections import OrderedDict
+from urlparse import urlparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from django.core.files.base import ContentFile
 from django.conf import settings as django_settings
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q, ImageField, Model
-from django.db import connections
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db.models import Q, ImageField, Model, ManyToManyField
+from django.db import connections, transaction
 from magi.utils import (
     addParametersToURL,
     AttrDict,
@@ -12,11 +16,15 @@ from magi.utils import (
     getIndex,
     hasValue,
     join_data,
+    modelGetField,
     modelHasField,
     matchesTemplate,
     saveImageURLToModel,
+    clearProcessedImages,
 )
 from magi.models import StaffConfiguration, MagiModel
+from magi.item_model import get_indexed_translated_fields, update_translation_index
+from magi.search import getSearchIndexFields, updateSearchIndex
 from magi.tools import get_default_owner
 
 ############################################################
@@ -239,6 +247,127 @@ def loadLocalJson(path, log_function=print):
     f.close()
     return result
 
+class _JsonStreamReader(object):
+    """
+    Reads a JSON file chunk by chunk, one value at a time.
+    """
+    def __init__(self, f, chunk_size=64 * 1024):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size=None):
+        data = self.f.read(size or self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buffer = self.buffer[self.position:] + data
+        self.position = 0
+
+    def peek(self):
+        """Returns the next character that is not a whitespace, or None at the end of the file."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\n\r':
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if self.eof:
+                return None
+            self.fill()
+
+    def next(self):
+        character = self.peek()
+        self.position += 1
+        return character
+
+    def decode(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A number at the end of the buffer might not be complete
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill(size)
+            size *= 2
+
+    def go_to(self, location):
+        """
+        Moves to the value at the given location (list of keys or indexes, see getSubField).
+        Returns False if it doesn't exist.
+        """
+        for key in location:
+            opening = self.next()
+            if opening not in ['{', '[']:
+                return False
+            closing = '}' if opening == '{' else ']'
+            index = 0
+            while True:
+                if self.peek() == closing:
+                    return False
+                if opening == '{':
+                    current_key = self.decode()
+                    self.next() # :
+                else:
+                    current_key = index
+                if current_key == key:
+                    break
+                self.decode()
+                if self.next() != ',':
+                    return False
+                index += 1
+        return True
+
+    def iter_values(self):
+        """
+        Iterates over the values of the list or dictionary at the current position.
+        """
+        opening = self.next()
+        if opening not in ['{', '[']:
+            return
+        closing = '}' if opening == '{' else ']'
+        while self.peek() not in [closing, None]:
+            if opening == '{':
+                self.decode()
+                self.next() # :
+            yield self.decode()
+            if self.next() != ',':
+                return
+
+def streamLocalJson(path, results_location=None, log_function=print, chunk_size=64 * 1024):
+    """
+    Like loadLocalJson, but iterates over the items of the list (or the values of the dictionary)
+    without loading the whole file in memory.
+    results_location = list of keys or indexes (see getSubField)
+    """
+    try:
+        f = open(path, 'r')
+    except IOError:
+        log_function('File not found: {}'.format(path))
+        return
+    try:
+        reader = _JsonStreamReader(f, chunk_size=chunk_size)
+        if reader.go_to(results_location or []):
+            for item in reader.iter_values():
+                yield item
+    finally:
+        f.close()
+
+def log_peak_memory(log_function=print):
+    try:
+        import resource
+    except ImportError:
+        return
+    # Linux returns kilobytes
+    log_function(u'Peak memory: {:.1f} MB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.))
+
 ############################################################
 # Import data utils
 
@@ -408,7 +537,11 @@ def default_find_existing_item(model, unique_together, unique_data, all_items):
 
 def save_item(
         details, unique_data, data, log_function=print, json_item=None, update=True,
-        verbose=False, download_images=False, force_reload_images=False, all_items=None):
+        verbose=False, download_images=False, force_reload_images=False, all_items=None,
+        image_downloader=None):
+    """
+    image_downloader: when specified, images get downloaded by the ImageDownloader instead of right away
+    """
     model = details['model']
     unique_together = details.get('unique_together', False)
     download_images = details.get('download_images', download_images)
@@ -486,6 +619,9 @@ def save_item(
             saved_images = []
             for field_name, url in images.items():
                 if not getattr(item, field_name, None) or force_reload_images:
+                    if image_downloader:
+                        image_downloader.add(item, field_name, url)
+                        continue
                     image = saveImageURLToModel(item, field_name, url)
                     saved_images.append(field_name)
             if saved_images:
@@ -521,15 +657,588 @@ def save_item(
         return item
     return None
 
+############################################################
+# Concurrent image downloads
+
+DEFAULT_IMAGE_TIMEOUT = 30
+
+class ImageDownloader(object):
+    """
+    Downloads the images of the imported items in a thread pool, instead of one by one when saving each item.
+    - Images are downloaded in parallel, with at most workers_per_host at the same time per host
+    - Failed downloads (connection errors, 5xx) are retried with an exponential delay
+    - Images with the same content are only uploaded once
+    - At most max_pending downloads are kept: items get their images and get saved as their downloads
+      complete, so the downloaded images don't stay in memory until the end
+    Items that are still waiting for their images get saved when calling finish.
+    request_options are passed to requests, with a timeout of DEFAULT_IMAGE_TIMEOUT seconds unless specified.
+    """
+    def __init__(
+            self, workers=8, workers_per_host=2, retries=2, retry_delay=1,
+            request_options=None, log_function=print, max_pending=None):
+        self.workers_per_host = workers_per_host
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.request_options = dict(request_options or {})
+        # Without a timeout, a host that hangs keeps its slot and the import stalls
+        self.request_options.setdefault('timeout', DEFAULT_IMAGE_TIMEOUT)
+        self.log_function = log_function
+        self.max_pending = max_pending or workers * 4
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.hosts_semaphores = {}
+        # { url: future }, only the downloads that haven't been attached yet
+        self.downloads = {}
+        # { url: [(item, field_name)] }
+        self.waiting_per_url = {}
+        # { id(item): (item, [field names still downloading], [(field_name, url, data, data_hash)]) }
+        self.images_per_item = OrderedDict()
+        self.current_item = None
+        # { url: data_hash }, for the urls already downloaded
+        self.hash_per_url = {}
+        self.stored_per_hash = {}
+        self.total_downloaded = 0
+        self.total_uploaded = 0
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts_semaphores:
+                self.hosts_semaphores[host] = threading.BoundedSemaphore(self.workers_per_host)
+            return self.hosts_semaphores[host]
+
+    def download(self, url):
+        """
+        Called in a thread.
+        Returns (data, hash of data, error).
+        """
+        if url.startswith('//'):
+            url = (u'http:' if 'localhost:' in url else u'https:') + url
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * (2 ** (attempt - 1)))
+            try:
+                with self._host_semaphore(url):
+                    r = requests.get(url, **self.request_options)
+            except requests.RequestException, e:
+                error = e
+                continue
+            if r.status_code == 200:
+                return r.content, hashlib.sha1(r.content).hexdigest(), None
+            error = u'HTTP {}'.format(r.status_code)
+            if r.status_code < 500 and r.status_code != 429:
+                break
+        return None, None, error
+
+    def add(self, item, field_name, url):
+        """
+        The item doesn't get saved while it's the last item added, since it might still be changed.
+        """
+        if not url:
+            return
+        self.current_item = item
+        images = self.images_per_item.setdefault(id(item), (item, [], []))
+        data_hash = self.hash_per_url.get(url, None)
+        if data_hash in self.stored_per_hash:
+            # Already downloaded and uploaded
+            images[2].append((field_name, url, None, data_hash))
+            self.process_completed()
+            return
+        if url not in self.downloads:
+            if len(self.downloads) >= self.max_pending:
+                wait(self.downloads.values(), return_when=FIRST_COMPLETED)
+            self.downloads[url] = self.pool.submit(self.download, url)
+        self.waiting_per_url.setdefault(url, []).append((item, field_name))
+        images[1].append(field_name)
+        self.process_completed()
+
+    def process_completed(self):
+        """
+        Gives the completed downloads to their items, then saves the items that have all their images.
+        """
+        for url, future in self.downloads.items():
+            if not future.done():
+                continue
+            del(self.downloads[url])
+            data, data_hash, error = future.result()
+            if data is None:
+                self.log_function(u'!! Failed to download {}: {}'.format(url, error))
+            else:
+                self.total_downloaded += 1
+                self.hash_per_url[url] = data_hash
+            for item, field_name in self.waiting_per_url.pop(url):
+                _item, downloading, downloaded = self.images_per_item[id(item)]
+                downloading.remove(field_name)
+                if data is not None:
+                    downloaded.append((field_name, url, data, data_hash))
+        for key, (item, downloading, downloaded) in self.images_per_item.items():
+            if not downloading and item is not self.current_item:
+                del(self.images_per_item[key])
+                self.save(item, downloaded)
+
+    def attach(self, item, field_name, url, data, data_hash):
+        if data_hash in self.stored_per_hash:
+            setattr(item, field_name, self.stored_per_hash[data_hash])
+            clearProcessedImages(item, field_name)
+        else:
+            saveImageURLToModel(item, field_name, url, image=ContentFile(data))
+
+    def save(self, item, downloaded):
+        if not downloaded:
+            return
+        for field_name, url, data, data_hash in downloaded:
+            self.attach(item, field_name, url, data, data_hash)
+        item.save()
+        for field_name, _url, _data, data_hash in downloaded:
+            if data_hash not in self.stored_per_hash:
+                self.stored_per_hash[data_hash] = getattr(item, field_name).name
+                self.total_uploaded += 1
+        item.update_all_related_caches()
+        self.log_function(u'{} #{}'.format(type(item).__name__, item.pk))
+        self.log_function(u'- Uploaded images: {}'.format(', '.join([
+            field_name for field_name, _url, _data, _data_hash in downloaded])))
+
+    def finish(self):
+        """
+        Waits for the remaining downloads, then saves the items that are still waiting for their images.
+        Returns the number of uploaded images.
+        """
+        try:
+            self.current_item = None
+            for _future in as_completed(self.downloads.values()):
+                self.process_completed()
+            self.process_completed()
+        finally:
+            self.pool.shutdown(wait=True)
+        self.log_function(u'Images: {} downloaded, {} uploaded'.format(self.total_downloaded, self.total_uploaded))
+        total_uploaded = self.total_uploaded
+        self.downloads, self.waiting_per_url, self.images_per_item = {}, {}, OrderedDict()
+        self.total_downloaded, self.total_uploaded = 0, 0
+        return total_uploaded
+
+def get_image_downloader(image_workers=None, **kwargs):
+    """
+    Returns an ImageDownloader when image_workers is specified, None otherwise.
+    """
+    if not image_workers:
+        return None
+    return ImageDownloader(workers=image_workers, **kwargs)
+
+############################################################
+# Batched import
+
+class BulkImporter(object):
+    """
+    Saves the imported items in batches, instead of one by one like save_item.
+    - Existing items are loaded once and found with a hash index on the unique fields
+    - New items get created with bulk_create
+    - Changed items get updated in one transaction, only with the fields that changed
+    - Many to many get added with bulk inserts in the through tables
+    - Related caches get updated at the end, once per item (see finish)
+    Items are only saved when calling flush or finish.
+    Doesn't support find_existing_item.
+    stream: instead of loading all the existing items, only loads the ones matching the unique
+    values of each batch, and updates the related caches after each batch, so the memory used
+    stays bounded by the batch size.
+    """
+    def __init__(
+            self, details, log_function=print, update=True, verbose=False,
+            download_images=False, force_reload_images=False, batch_size=500, all_items=None,
+            image_downloader=None, stream=False):
+        self.details = details
+        self.model = details['model']
+        self.unique_together = details.get('unique_together', False)
+        self.download_images = details.get('download_images', download_images)
+        self.dont_erase_existing_value_fields = details.get('dont_erase_existing_value_fields', [])
+        self.log_function = log_function
+        self.update = update
+        self.verbose = verbose
+        self.force_reload_images = force_reload_images
+        self.image_downloader = image_downloader
+        self.batch_size = batch_size
+        self.stream = stream
+        if stream:
+            # Loaded per batch, see _load_existing_items
+            all_items = []
+        elif all_items is None:
+            all_items = list(self._get_queryset())
+        self.all_items = all_items
+        self.to_add = []
+        self.default_owner = None
+        self.indexes = {}
+        self.pending = OrderedDict()
+        self.to_update_caches = OrderedDict()
+        self.total_created = 0
+        self.total_updated = 0
+        self.total_caches_updated = 0
+
+    def _get_queryset(self):
+        return self.details['queryset'] if self.details.get('queryset', None) is not None else self.model.objects.all()
+
+    ############################################################
+    # Index
+
+    def _item_value(self, item, field_name):
+        field = modelGetField(self.model, field_name)
+        if field and field.rel and not isinstance(field, ManyToManyField):
+            return getattr(item, u'{}_id'.format(field_name), None)
+        return getattr(item, field_name, None)
+
+    def _value(self, value):
+        return value.pk if isinstance(value, Model) else value
+
+    def _normalize(self, field_name, value):
+        """
+        Returns the value the way the database would compare it, so '1' and 1 find the same item.
+        """
+        value = self._value(value)
+        if value is None:
+            return None
+        field = modelGetField(self.model, field_name)
+        if not field or isinstance(field, ManyToManyField):
+            return value
+        if field.rel:
+            field = field.rel.get_related_field()
+        try:
+            return field.get_prep_value(field.to_python(value))
+        except (ValidationError, ValueError, TypeError):
+            return value
+
+    def _key(self, field_names, values):
+        return tuple(self._normalize(field_name, value) for field_name, value in zip(field_names, values))
+
+    def _item_key(self, item, field_names):
+        return self._key(field_names, [self._item_value(item, field_name) for field_name in field_names])
+
+    def _index_item(self, item, field_names, index):
+        index.setdefault(self._item_key(item, field_names), item)
+
+    def get_index(self, field_names):
+        if field_names not in self.indexes:
+            index = {}
+            for item in self.all_items:
+                self._index_item(item, field_names, index)
+            self.indexes[field_names] = index
+        return self.indexes[field_names]
+
+    def find_existing_item(self, unique_data):
+        if self.unique_together:
+            field_names = tuple(sorted(unique_data.keys()))
+            return self.get_index(field_names).get(self._key(
+                field_names, [unique_data[field_name] for field_name in field_names]))
+        for field_name, value in unique_data.items():
+            if value is None:
+                continue
+            item = self.get_index((field_name, )).get(self._key((field_name, ), [value]))
+            if item:
+                return item
+        return None
+
+    def _reindex_item(self, item):
+        for field_names, index in self.indexes.items():
+            self._index_item(item, field_names, index)
+
+    def _load_existing_items(self, list_of_unique_data):
+        """
+        Returns the existing items that may match the unique data of a batch, with one query.
+        The exact match is done with the index (see find_existing_item).
+        """
+        values_per_field = OrderedDict()
+        for unique_data in list_of_unique_data:
+            for field_name, value in unique_data.items():
+                if value is not None:
+                    values_per_field.setdefault(field_name, set()).add(self._value(value))
+        if not values_per_field:
+            return []
+        conditions = [Q(**{ u'{}__in'.format(field_name): list(values) }) for field_name, values in values_per_field.items()]
+        return list(self._get_queryset().filter(reduce(
+            (lambda a, b: a & b) if self.unique_together else (lambda a, b: a | b), conditions)))
+
+    ############################################################
+    # Add items
+
+    def _pending(self, item, created=False, unique_fields=()):
+        if id(item) not in self.pending:
+            self.pending[id(item)] = {
+                'item': item,
+                'created': created,
+                'unique_fields': unique_fields,
+                'changed_fields': set(),
+                'manytomany': OrderedDict(),
+                'images': {},
+                'json_items': [],
+            }
+        return self.pending[id(item)]
+
+    def add(self, unique_data, data, json_item=None):
+        """
+        Same parameters as save_item.
+        """
+        if not data and not unique_data:
+            return
+        model = self.model
+        unique_data = prepare_data(unique_data, model, unique=True, download_images=self.download_images)
+        data, manytomany, dictionaries, images = prepare_data(
+            data, model, unique=False, download_images=self.download_images,
+        )
+        if self.verbose:
+            self.log_function(model.__name__)
+            self.log_function('- Unique data:')
+            self.log_function(unique_data)
+            self.log_function('- Data:')
+            self.log_function(data)
+        data.update(unique_data)
+        if self.stream:
+            # Existing items get loaded when the batch is full
+            self.to_add.append((unique_data, data, manytomany, dictionaries, images, json_item))
+            if len(self.to_add) >= self.batch_size:
+                self.flush()
+            return
+        self._add(unique_data, data, manytomany, dictionaries, images, json_item)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _add(self, unique_data, data, manytomany, dictionaries, images, json_item):
+        model = self.model
+        item = self.find_existing_item(unique_data)
+        if item:
+            pending = self._pending(item)
+            for k, v in data.items():
+                if not self.update:
+                    if v and isinstance(v, Model):
+                        if getattr(item, u'{}_id'.format(k), None):
+                            continue
+                    elif not hasValue(v) or hasValue(getattr(item, k, None)):
+                        continue
+                elif not v and k in self.dont_erase_existing_value_fields:
+                    continue
+                if isinstance(v, Model):
+                    if getattr(item, u'{}_id'.format(k), None) == v.pk:
+                        continue
+                elif getattr(item, k, None) == v:
+                    continue
+                setattr(item, k, v)
+                pending['changed_fields'].add(k)
+            if pending['changed_fields']:
+                self._reindex_item(item)
+        else:
+            if modelHasField(model, 'owner') and 'owner' not in data and 'owner_id' not in data:
+                if self.default_owner is None:
+                    self.default_owner = get_default_owner()
+                data['owner'] = self.default_owner
+            item = model(**data)
+            pending = self._pending(item, created=True, unique_fields=tuple(sorted(
+                field_name for field_name, value in unique_data.items()
+                if value is not None and modelGetField(model, field_name))))
+            self.all_items.append(item)
+            self._reindex_item(item)
+
+        for field_name, list_of_items in manytomany.items():
+            pending['manytomany'].setdefault(field_name, []).extend(list_of_items)
+        for field_name, dictionary in dictionaries.items():
+            previous = getattr(item, field_name[2:])
+            for k, v in dictionary.items():
+                if hasValue(previous.get(k, None)) and not self.update:
+                    continue
+                item.add_d(field_name[2:], k, v)
+            if previous != getattr(item, field_name[2:]):
+                pending['changed_fields'].add(field_name)
+        pending['images'].update(images)
+        if json_item is not None:
+            pending['json_items'].append(json_item)
+
+    ############################################################
+    # Save
+
+    def _bulk_create(self, created):
+        """
+        created is a list of pending items, see _pending.
+        """
+        model = self.model
+        items = [pending['item'] for pending in created]
+        claimed_pks = set(item.pk for item in items if item.pk is not None)
+        # Items without unique fields last, they get the new rows that no other item claimed
+        without_pk = sorted([
+            pending for pending in created if pending['item'].pk is None
+        ], key=lambda pending: not pending['unique_fields'])
+        last_pk = model.objects.order_by('-pk').values_list('pk', flat=True)[:1]
+        last_pk = last_pk[0] if last_pk else None
+        model.objects.bulk_create(items, batch_size=self.batch_size)
+        if without_pk:
+            # bulk_create doesn't set the primary keys, so the new rows are found with their unique fields
+            queryset = model.objects.order_by('pk')
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            pks_per_fields = {}
+            for pending in without_pk:
+                field_names = pending['unique_fields']
+                if field_names not in pks_per_fields:
+                    pks_per_fields[field_names] = OrderedDict()
+                    for values in queryset.values_list('pk', *field_names):
+                        if values[0] not in claimed_pks:
+                            pks_per_fields[field_names].setdefault(
+                                self._key(field_names, values[1:]), []).append(values[0])
+                pks = pks_per_fields[field_names].get(self._item_key(pending['item'], field_names), None)
+                if not pks:
+                    raise ValueError(u'{}: primary key of the created item {} not found'.format(
+                        model.__name__, dict(zip(field_names, self._item_key(pending['item'], field_names)))))
+                # Items without unique fields share the same empty key, created in the same order
+                pending['item'].pk = pks.pop(0)
+                claimed_pks.add(pending['item'].pk)
+        for item in items:
+            item._state.adding = False
+            item._state.db = model.objects.db
+
+    def _bulk_add_manytomany(self, field_name, items_and_related):
+        field = modelGetField(self.model, field_name)
+        if not isinstance(field, ManyToManyField) or not field.rel.through._meta.auto_created:
+            for item, list_of_items in items_and_related:
+                getattr(item, field_name).add(*list_of_items)
+            return
+        through = field.rel.through
+        source = u'{}_id'.format(field.m2m_field_name())
+        target = u'{}_id'.format(field.m2m_reverse_field_name())
+        existing = set(through.objects.filter(**{
+            u'{}__in'.format(source): [item.pk for item, _list_of_items in items_and_related],
+        }).values_list(source, target))
+        to_create = OrderedDict()
+        for item, list_of_items in items_and_related:
+            for related_item in list_of_items:
+                key = (item.pk, self._value(related_item))
+                if key not in existing:
+                    to_create[key] = through(**{ source: key[0], target: key[1] })
+        through.objects.bulk_create(to_create.values(), batch_size=self.batch_size)
+
+    def flush(self):
+        """
+        Saves all the pending items.
+        """
+        if self.to_add:
+            to_add, self.to_add = self.to_add, []
+            self.all_items = self._load_existing_items([unique_data for unique_data, _d, _m, _di, _i, _j in to_add])
+            self.indexes = {}
+            for added in to_add:
+                self._add(*added)
+        if not self.pending:
+            return
+        model = self.model
+        pending_items = self.pending.values()
+        self.pending = OrderedDict()
+        created = [pending for pending in pending_items if pending['created']]
+        updated = [pending for pending in pending_items if not pending['created'] and pending['changed_fields']]
+        manytomany = OrderedDict()
+        for pending in pending_items:
+            for field_name, list_of_items in pending['manytomany'].items():
+                manytomany.setdefault(field_name, []).append((pending['item'], list_of_items))
+        if created or updated or manytomany:
+            with transaction.atomic():
+                if created:
+                    self._bulk_create(created)
+                for pending in updated:
+                    model.objects.filter(pk=pending['item'].pk).update(**{
+                        field_name: getattr(pending['item'], field_name)
+                        for field_name in pending['changed_fields']
+                    })
+                for field_name, items_and_related in manytomany.items():
+                    self._bulk_add_manytomany(field_name, items_and_related)
+                # Not saved with save, so the translation and search indexes have to be updated here
+                indexed_fields = [u'd_{}s'.format(field_name) for field_name in get_indexed_translated_fields(model)]
+                if indexed_fields:
+                    update_translation_index([
+                        pending['item'] for pending in created + updated
+                        if pending['created'] or set(indexed_fields) & set(pending['changed_fields'])
+                    ])
+                search_fields = getSearchIndexFields(model)
+                if search_fields:
+                    updateSearchIndex([
+                        pending['item'] for pending in created + updated
+                        if pending['created'] or set(search_fields) & set(pending['changed_fields'])
+                    ])
+        self.total_created += len(created)
+        self.total_updated += len(updated)
+        self.log_function(u'{}: {} created, {} updated, {} unchanged'.format(
+            model.__name__, len(created), len(updated), len(pending_items) - len(created) - len(updated)))
+
+        for pending in pending_items:
+            item = pending['item']
+            need_save = False
+            need_cache_update = pending['created'] or pending['changed_fields'] or pending['manytomany']
+            saved_images = []
+            for field_name, url in pending['images'].items():
+                if not getattr(item, field_name, None) or self.force_reload_images:
+                    if self.image_downloader:
+                        self.image_downloader.add(item, field_name, url)
+                        continue
+                    saveImageURLToModel(item, field_name, url)
+                    saved_images.append(field_name)
+            if saved_images:
+                self.log_function(u'{} #{}'.format(model.__name__, item.pk))
+                self.log_function(u'- Uploaded images: {}'.format(', '.join(saved_images)))
+                need_save = True
+            if 'callback_after_save' in self.details:
+                for json_item in pending['json_items'] or [None]:
+                    result = self.details['callback_after_save'](self.details, item, json_item)
+                    if isinstance(result, tuple):
+                        new_need_save, new_need_cache_update = result
+                    else:
+                        new_need_save = new_need_cache_update = bool(result)
+                    need_save = need_save or new_need_save
+                    need_cache_update = need_cache_update or new_need_cache_update
+            if need_save:
+                item.save()
+                if self.verbose:
+                    self.log_function(u'Updated {} #{}'.format(model.__name__, item.pk))
+            if need_save or need_cache_update:
+                self.to_update_caches[item.pk] = item
+
+        if self.stream:
+            # Nothing from this batch is kept
+            self.update_caches()
+            self.all_items = []
+            self.indexes = {}
+
+    def update_caches(self):
+        for item in self.to_update_caches.values():
+            item.update_all_related_caches()
+            if self.verbose:
+                self.log_function(u'Updated caches for {} #{}'.format(self.model.__name__, item.pk))
+        self.total_caches_updated += len(self.to_update_caches)
+        self.to_update_caches = OrderedDict()
+
+    def finish(self):
+        """
+        Saves all the pending items, then updates the related caches of all the items
+        that have been created or changed.
+        """
+        self.flush()
+        self.update_caches()
+        self.log_function(u'{}: {} created, {} updated, {} caches updated'.format(
+            self.model.__name__, self.total_created, self.total_updated, self.total_caches_updated))
+
+def get_bulk_importer(details, batched=False, batch_size=500, **kwargs):
+    """
+    Returns a BulkImporter when the import is batched (batched parameter or batched in details), None otherwise.
+    """
+    if not details.get('batched', batched) or details.get('find_existing_item', None):
+        return None
+    return BulkImporter(details, batch_size=details.get('batch_size', batch_size), **kwargs)
+
 def api_pages(
         url, name, details, local=False, results_location=None,
         log_function=print, request_options={},
         verbose=False, download_images=False,
         force_reload_images=False,
-        request_call=None,
+        request_call=None, batched=False, batch_size=500, image_workers=None,
 ):
     log_function('Downloading list of {}...'.format(name))
     details.get('callback_before', lambda: None)()
+    image_downloader = get_image_downloader(image_workers, log_function=log_function)
+    bulk_importer = get_bulk_importer(
+        details, batched=batched, batch_size=batch_size, log_function=log_function, verbose=verbose,
+        download_images=download_images, force_reload_images=force_reload_images,
+        image_downloader=image_downloader,
+    )
     url = addParametersToURL(
         u'{}{}'.format(
             details.get('url', url),
@@ -566,11 +1275,15 @@ def api_pages(
                 unique_data, data = details['callback_per_item'](details, item)
             else:
                 unique_data, data, not_in_fields = import_generic_item(details, item, verbose=verbose, log_function=log_function)
-            save_item(
-                details, unique_data, data, log_function, json_item=item,
-                verbose=verbose, download_images=download_images,
-                force_reload_images=force_reload_images,
-            )
+            if bulk_importer:
+                bulk_importer.add(unique_data, data, json_item=item)
+            else:
+                save_item(
+                    details, unique_data, data, log_function, json_item=item,
+                    verbose=verbose, download_images=download_images,
+                    force_reload_images=force_reload_images,
+                    image_downloader=image_downloader,
+                )
             if not_in_fields and verbose:
                 log_function('- Ignored:')
                 log_function(not_in_fields)
@@ -583,6 +1296,10 @@ def api_pages(
                 url = result['next']
             else:
                 url = None
+    if bulk_importer:
+        bulk_importer.finish()
+    if image_downloader:
+        image_downloader.finish()
     details.get('callback_end', lambda: None)()
     log_function('Total {}'.format(total))
     log_function('Done.')
@@ -592,22 +1309,39 @@ def import_from_json(
         log_function=print,
         verbose=False, download_images=False,
         force_reload_images=False,
-        results_location=None,
+        results_location=None, batched=False, batch_size=500, image_workers=None,
+        stream=False,
 ):
+    """
+    stream: will read the JSON file item by item instead of loading it all in memory
+    (not possible with callback_before_page)
+    """
     log_function('Downloading list of {}...'.format(name))
     details.get('callback_before', lambda: None)()
+    image_downloader = get_image_downloader(image_workers, log_function=log_function)
+    bulk_importer = get_bulk_importer(
+        details, batched=batched, batch_size=batch_size, log_function=log_function, verbose=verbose,
+        download_images=download_images, force_reload_images=force_reload_images,
+        image_downloader=image_downloader, stream=stream,
+    )
     path = folder + details.get('filename', name) + '.json'
     if verbose:
         log_function(path)
     total = 0
-    result = loadLocalJson(path, log_function=log_function)
-    if 'callback_before_page' in details:
-        result = details['callback_before_page'](result)
-    results = result
-    if 'results_location' in details:
-        results = getSubField(results, details['results_location'], default=[])
-    elif results_location is not None:
-        results = getSubField(results, results_location, default=[])
+    if stream and 'callback_before_page' not in details:
+        results = streamLocalJson(
+            path, results_location=details.get('results_location', results_location),
+            log_function=log_function,
+        )
+    else:
+        result = loadLocalJson(path, log_function=log_function)
+        if 'callback_before_page' in details:
+            result = details['callback_before_page'](result)
+        results = result
+        if 'results_location' in details:
+            results = getSubField(results, details['results_location'], default=[])
+        elif results_location is not None:
+            results = getSubField(results, results_location, default=[])
     for item in (results.values() if isinstance(results, dict) else results):
         not_in_fields = {}
         if (details.get('callback_should_import', None)
@@ -618,17 +1352,26 @@ def import_from_json(
         else:
             unique_data, data, not_in_fields = import_generic_item(
                 details, item, verbose=verbose, log_function=log_function)
-        save_item(
-            details, unique_data, data, log_function, json_item=item,
-            verbose=verbose, download_images=download_images,
-            force_reload_images=force_reload_images,
-        )
+        if bulk_importer:
+            bulk_importer.add(unique_data, data, json_item=item)
+        else:
+            save_item(
+                details, unique_data, data, log_function, json_item=item,
+                verbose=verbose, download_images=download_images,
+                force_reload_images=force_reload_images,
+                image_downloader=image_downloader,
+            )
         if not_in_fields and verbose:
             log_function('- Ignored:')
             log_function(not_in_fields)
         total += 1
+    if bulk_importer:
+        bulk_importer.finish()
+    if image_downloader:
+        image_downloader.finish()
     details.get('callback_end', lambda: None)()
     log_function('Total {}'.format(total))
+    log_peak_memory(log_function=log_function)
     log_function('Done.')
 
 
@@ -640,21 +1383,45 @@ def dictfetchall(cursor):
         for row in cursor.fetchall()
     ]
 
+def dictfetchmany(cursor, size=1000):
+    "Iterate over all rows from a cursor as dicts, fetching them {size} rows at a time"
+    columns = [col[0] for col in cursor.description]
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(zip(columns, row))
+
 def import_from_sqlite(
         db_name, name, details,
         log_function=print,
         verbose=False, download_images=False,
         force_reload_images=False,
-        results_location=None, update=True,
+        results_location=None, update=True, batched=False, batch_size=500, image_workers=None,
+        stream=False,
 ):
+    """
+    stream: will fetch the rows batch_size at a time instead of loading them all in memory,
+    and existing items get looked up per batch (batched) or per item instead of all loaded
+    """
     log_function('Downloading list of {}...'.format(name))
     details.get('callback_before', lambda: None)()
     total = 0
 
-    if details.get('queryset', None):
+    if stream:
+        all_items = None
+    elif details.get('queryset', None):
         all_items = list(details['queryset'])
     else:
         all_items = list(details['model'].objects.all())
+    image_downloader = get_image_downloader(image_workers, log_function=log_function)
+    bulk_importer = get_bulk_importer(
+        details, batched=batched, batch_size=batch_size, log_function=log_function, verbose=verbose,
+        download_images=download_images, force_reload_images=force_reload_images,
+        image_downloader=image_downloader,
+        update=update, all_items=all_items, stream=stream,
+    )
 
     with connections[db_name].cursor() as cursor:
 
@@ -668,7 +1435,7 @@ def import_from_sqlite(
         if verbose:
             log_function(query)
         cursor.execute(query)
-        for item in dictfetchall(cursor):
+        for item in (dictfetchmany(cursor, size=batch_size) if stream else dictfetchall(cursor)):
             not_in_fields = {}
             if (details.get('callback_should_import', None)
                 and not details['callback_should_import'](details, item)):
@@ -678,19 +1445,27 @@ def import_from_sqlite(
             else:
                 unique_data, data, not_in_fields = import_generic_item(
                     details, item, verbose=verbose, log_function=log_function)
-            save_item(
-                details, unique_data, data, log_function, json_item=item,
-                verbose=verbose, download_images=download_images,
-                force_reload_images=force_reload_images, update=update,
-                all_items=all_items,
-            )
+            if bulk_importer:
+                bulk_importer.add(unique_data, data, json_item=item)
+            else:
+                save_item(
+                    details, unique_data, data, log_function, json_item=item,
+                    verbose=verbose, download_images=download_images,
+                    force_reload_images=force_reload_images, update=update,
+                    all_items=all_items, image_downloader=image_downloader,
+                )
             if not_in_fields and verbose:
                 log_function('- Ignored:')
                 log_function(not_in_fields)
             total += 1
+        if bulk_importer:
+            bulk_importer.finish()
+        if image_downloader:
+            image_downloader.finish()
         details.get('callback_end', lambda: None)()
 
     log_function('Total {}'.format(total))
+    log_peak_memory(log_function=log_function)
     log_function('Done.')
 
 ############################################################
@@ -701,7 +1476,7 @@ def import_data(
         local=False, to_import=None, log_function=print,
         request_options={}, verbose=False, download_images=False,
         force_reload_images=False,
-        request_call=None,
+        request_call=None, batched=False, batch_size=500, image_workers=None,
 ):
     """
     url: must end with a /. Example: https://schoolido.lu/api/. can be overriden per conf
@@ -712,6 +1487,8 @@ def import_data(
     log_function: where to log
     request_options: dict of options passed to requests in python
     download_images: will download the image instead of just inserting the URL in the database
+    batched: will save the items in batches of batch_size with BulkImporter instead of one by one
+    image_workers: when download_images, will download that many images at the same time with ImageDownloader
 
     import_configuration must be a dictionary with:
     - key: name of the items
@@ -736,6 +1513,8 @@ def import_data(
         ignored_fields (list): list of explicitely ignored fields, no warning printed
         find_existing_item (function(model, unique_data, data): retrieve the item to update, or None to create
         request_options: dict of options passed to requests in python
+        batched (bool): defaults to batched global setting, ignored when find_existing_item is specified
+        batch_size (int): defaults to batch_size global setting
 
     mapping must be a dictionary with:
     key: field name in the result object
@@ -759,6 +1538,7 @@ def import_data(
                 verbose=verbose, download_images=download_images,
                 force_reload_images=force_reload_images,
                 request_call=request_call,
+                batched=batched, batch_size=batch_size, image_workers=image_workers,
             )
 
 def import_data_from_local_json(
@@ -766,7 +1546,8 @@ def import_data_from_local_json(
         to_import=None, log_function=print,
         verbose=False, download_images=False,
         force_reload_images=False,
-        results_location=None,
+        results_location=None, batched=False, batch_size=500, image_workers=None,
+        stream=False,
 ):
     """
     Assumes name in import is the name of the file .json (can specify filename in import config)
@@ -781,6 +1562,8 @@ def import_data_from_local_json(
                 log_function=log_function,
                 verbose=verbose, download_images=download_images,
                 force_reload_images=force_reload_images,
+                batched=batched, batch_size=batch_size, image_workers=image_workers,
+                stream=stream,
             )
 
 def import_data_from_local_sqlite(
@@ -788,7 +1571,8 @@ def import_data_from_local_sqlite(
         to_import=None, log_function=print,
         verbose=False, download_images=False,
         force_reload_images=False,
-        results_location=None, update=True,
+        results_location=None, update=True, batched=False, batch_size=500, image_workers=None,
+        stream=False,
 ):
     """
     db_name = db key in your ${PROJECT}_project/import_settings.py
@@ -802,4 +1586,6 @@ def import_data_from_local_sqlite(
                 log_function=log_function,
                 verbose=verbose, download_images=download_images,
                 force_reload_images=force_reload_images, update=update,
+                batched=batched, batch_size=batch_size, image_workers=image_workers,
+                stream=stream,
             )
@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
-import json, datetime, hashlib, urllib
+import json, datetime, hashlib, urllib, multiprocessing, threading
 from collections import OrderedDict
+from django.apps import apps
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction, connections
 from django.db.models.fields import FieldDoesNotExist
 from django.db.models.fields.files import ImageFieldFile
 from django.conf import settings as django_settings
 from django.utils.translation import ugettext_lazy as _, get_language, activate as translation_activate
 from django.utils import timezone
 from magi.raw import KNOWN_ITEM_PROPERTIES
+from magi.search import updateSearchIndex, deleteSearchIndex
 from magi.utils import (
     tourldash,
     getMagiCollection,
@@ -42,6 +44,7 @@ from magi.utils import (
     getModelOfRelatedItem,
     getFilterFieldNameOfRelatedItem,
     getQuerysetFromModel,
+    getRelatedCachesOfItems,
 )
 
 ############################################################
@@ -202,6 +205,262 @@ def has_item_view_permissions(instance, context={}):
 def unicodes(instance):
     return getAllTranslations(instance, include_en=False, unique=True)
 
+############################################################
+# Utils for __getattr__
+
+# What a name like t_rarity, cached_idol or image_url corresponds to only depends on the class,
+# so it's resolved once per class and name.
+# { model class: { name: function that takes an instance and returns the value, or None } }
+_attribute_resolvers = {}
+
+def get_attribute_resolver(cls, name):
+    """
+    Returns the function used by __getattr__ to get the value of "name",
+    or None when instances of cls don't have this attribute.
+    """
+    resolvers = _attribute_resolvers.get(cls, None)
+    if resolvers is None:
+        resolvers = _attribute_resolvers[cls] = {}
+    try:
+        return resolvers[name]
+    except KeyError:
+        resolver = resolvers[name] = cls._resolve_attribute(name)
+        return resolver
+
+def reset_attribute_resolvers(cls=None):
+    """
+    Only needed if fields or class attributes get added to a model class after it has been used.
+    """
+    if cls is None:
+        _attribute_resolvers.clear()
+        CachedItem._attribute_resolvers.clear()
+    else:
+        _attribute_resolvers.pop(cls, None)
+        CachedItem._attribute_resolvers.pop(cls, None)
+
+############################################################
+# Utils for async updates
+
+# Fields that get updated by the async_db_updates script, resolved once per class.
+# { model class: [(field name, modified field name, boolean on change)] }
+_async_update_fields = {}
+
+def get_async_update_fields(cls):
+    """
+    Returns a list of (field name, modified field name, boolean on change):
+    - Images with a _original_, _tthumbnail_ or _thumbnail_ version
+    - m_something with a _cache_something
+    - something_changed with a SOMETHING_ON_CHANGE callback
+    Same rules as the async_db_updates script.
+    """
+    try:
+        return _async_update_fields[cls]
+    except KeyError:
+        pass
+    fields = []
+    tinypng_api_key = getattr(django_settings, 'TINYPNG_API_KEY', None)
+    for field in cls._meta.fields:
+        if isinstance(field, models.ImageField) and not field.name.startswith('_'):
+            for prefix, needs_tinypng in [
+                    ('_original_', True),
+                    ('_tthumbnail_', True),
+                    ('_thumbnail_', False),
+            ]:
+                if ((tinypng_api_key or not needs_tinypng)
+                    and modelHasField(cls, u'{}{}'.format(prefix, field.name))):
+                    fields.append((field.name, u'{}{}'.format(prefix, field.name), None))
+        if field.name.startswith('m_') and modelHasField(cls, u'_cache_{}'.format(field.name[2:])):
+            fields.append((field.name, u'_cache_{}'.format(field.name[2:]), None))
+        if (field.name.endswith('_changed') and isinstance(field, models.BooleanField)
+            and hasattr(cls, u'{}_ON_CHANGE'.format(field.name[:8].upper()))):
+            fields.append((field.name, field.name[:8], True))
+    _async_update_fields[cls] = fields
+    return fields
+
+def is_async_update_pending(item, field_name, modified_field_name, boolean_on_change=None):
+    if boolean_on_change is not None:
+        return (getattr(item, field_name) == boolean_on_change
+                and bool(getattr(item, modified_field_name)))
+    return bool(getattr(item, field_name)) and not getattr(item, modified_field_name)
+
+############################################################
+# Utils for related caches
+
+# Reverse related caches to update, collected per thread while deferred (see deferred_related_caches).
+_deferred_related_caches = threading.local()
+
+# Field name of the updates added to the queue of the async_db_updates script for related caches
+RELATED_CACHE_ASYNC_UPDATE_PREFIX = u'related_cache:'
+
+def is_deferring_related_caches():
+    return getattr(_deferred_related_caches, 'depth', 0) > 0
+
+def defer_related_cache_update(model, pk, cache_name):
+    _deferred_related_caches.pending[(model, pk, cache_name)] = True
+
+def get_pending_related_cache_updates():
+    """
+    Returns the list of (model, pk, cache name) that will get updated when the
+    outermost deferred_related_caches block ends.
+    """
+    return getattr(_deferred_related_caches, 'pending', {}).keys()
+
+def start_deferring_related_caches():
+    if not is_deferring_related_caches():
+        _deferred_related_caches.depth = 0
+        _deferred_related_caches.pending = OrderedDict()
+    _deferred_related_caches.depth += 1
+
+def stop_deferring_related_caches(asynchronous=None, discard=False):
+    """
+    Flushes the pending updates when it's the outermost deferred_related_caches block.
+    discard: forgets all the pending updates instead, after an error (the saved items may have
+    been rolled back, and the transaction may not accept queries anymore).
+    Returns the number of caches updated or added to the queue.
+    """
+    _deferred_related_caches.depth = max(getattr(_deferred_related_caches, 'depth', 0) - 1, 0)
+    if discard:
+        _deferred_related_caches.pending = OrderedDict()
+        return 0
+    if is_deferring_related_caches():
+        return 0
+    return flush_related_cache_updates(asynchronous=asynchronous)
+
+def flush_related_cache_updates(asynchronous=None):
+    """
+    Updates the pending reverse related caches, grouped per model and cache name so each
+    group gets updated with update_related_caches_of_items.
+    When asynchronous (default: DEFERRED_RELATED_CACHES == 'async' in settings), they get
+    added to the queue of the async_db_updates script instead.
+    Returns the number of caches updated or added to the queue.
+    """
+    pending = get_pending_related_cache_updates()
+    # Cleared before updating, so nothing stays on the thread when an update fails
+    _deferred_related_caches.pending = OrderedDict()
+    if asynchronous is None:
+        asynchronous = getattr(django_settings, 'DEFERRED_RELATED_CACHES', None) == 'async'
+    pks_per_cache = OrderedDict()
+    for model, pk, cache_name in pending:
+        pks_per_cache.setdefault((model, cache_name), []).append(pk)
+    total = 0
+    for (model, cache_name), pks in pks_per_cache.items():
+        if asynchronous:
+            from magi.models import AsyncUpdate
+            for pk in pks:
+                AsyncUpdate.enqueue_pk(
+                    model, pk, RELATED_CACHE_ASYNC_UPDATE_PREFIX + cache_name,
+                    priority=model.ASYNC_UPDATE_PRIORITY,
+                )
+            total += len(pks)
+        else:
+            total += model.update_related_caches_of_items(list(
+                model._related_caches_queryset(batched=True).filter(pk__in=pks)), cache_names=[cache_name])
+    return total
+
+class deferred_related_caches(object):
+    """
+    Within this block, the caches of the items that have a cache of a saved item
+    (REVERSE_RELATED_CACHES) don't get updated right away: they're deduplicated and
+    updated once when the outermost block ends. Without it, they get updated right away.
+    See also magi.middleware.deferredRelatedCaches.
+    """
+    def __init__(self, asynchronous=None):
+        self.asynchronous = asynchronous
+
+    def __enter__(self):
+        start_deferring_related_caches()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Returns None so the exception, if any, gets raised
+        stop_deferring_related_caches(asynchronous=self.asynchronous, discard=exc_type is not None)
+
+def _update_related_caches_of_chunk(chunk):
+    """
+    Takes (app label, model name, first pk, last pk) so it can be called in another process.
+    """
+    app_label, model_name, first_pk, last_pk = chunk
+    model = apps.get_model(app_label, model_name)
+    return model.update_related_caches_of_items(list(
+        model._related_caches_queryset(batched=True).filter(pk__gte=first_pk, pk__lte=last_pk)))
+
+############################################################
+# Utils for translation index
+
+def get_indexed_translated_fields(model):
+    return getattr(model, 'INDEXED_TRANSLATED_FIELDS', [])
+
+def _translation_index_values(item):
+    """
+    Returns { (field name, language): value } for the translations in d_{field name}s.
+    """
+    values = {}
+    for field_name in get_indexed_translated_fields(type(item)):
+        d = getattr(item, u'd_{}s'.format(field_name), None)
+        for language, value in (json.loads(d) if d else {}).items():
+            if isinstance(value, basestring) and value:
+                values[(field_name, language)] = value
+    return values
+
+def update_translation_index(items):
+    """
+    Updates the rows of the translation index (magi.models.TranslationIndex) of a list
+    of items of the same model. Only the translations that changed get deleted or added.
+    Returns the number of rows added and the number of rows deleted.
+    """
+    if not items or not get_indexed_translated_fields(type(items[0])):
+        return 0, 0
+    from magi.models import TranslationIndex
+    model = type(items[0])
+    model_name = TranslationIndex.get_model_name(model)
+    existing = {
+        (row.item_id, row.field_name, row.language): row
+        for row in TranslationIndex.objects_of_model(model).filter(item_id__in=[item.pk for item in items])
+    }
+    to_delete, to_create = [], []
+    for item in items:
+        for (field_name, language), value in _translation_index_values(item).items():
+            row = existing.pop((item.pk, field_name, language), None)
+            if row and row.value == value:
+                continue
+            if row:
+                to_delete.append(row.pk)
+            to_create.append(TranslationIndex(
+                model_name=model_name, item_id=item.pk, field_name=field_name, language=language,
+                value=value, normalized_value=TranslationIndex.normalize(value),
+            ))
+    to_delete += [row.pk for row in existing.values()]
+    if to_delete:
+        TranslationIndex.objects.filter(pk__in=to_delete).delete()
+    if to_create:
+        TranslationIndex.objects.bulk_create(to_create)
+    return len(to_create), len(to_delete)
+
+def delete_translation_index(model, pks):
+    if not get_indexed_translated_fields(model):
+        return
+    from magi.models import TranslationIndex
+    TranslationIndex.objects_of_model(model).filter(item_id__in=pks).delete()
+
+def rebuild_translation_index(model, chunk_size=1000):
+    """
+    Deletes and adds again all the rows of the translation index of a model, chunk by chunk.
+    Returns the number of rows added.
+    """
+    from magi.models import TranslationIndex
+    TranslationIndex.objects_of_model(model).delete()
+    fields = [u'd_{}s'.format(field_name) for field_name in get_indexed_translated_fields(model)]
+    if not fields:
+        return 0
+    total, last_pk = 0, 0
+    while True:
+        items = list(model.objects.filter(pk__gt=last_pk).order_by('pk').only(*fields)[:chunk_size])
+        if not items:
+            break
+        total += update_translation_index(items)[0]
+        last_pk = items[-1].pk
+    return total
+
 ############################################################
 # BaseMagiModel
 
@@ -218,6 +477,11 @@ class BaseMagiModel(models.Model):
     - helpers for images
       - image_url, http_image_url where "image" is the name of the image field
     - tinypng_settings
+    - ASYNC_UPDATE_PRIORITY: higher gets updated first by the async_db_updates script
+    - INDEXED_TRANSLATED_FIELDS: fields with translations in d_{field name}s searched by
+      filterByTranslatedValue with the translation index (see rebuild_translation_index command)
+    - SEARCH_INDEX_FIELDS: fields searched with the search backend in list views (see magi.search
+      and rebuild_search_index command)
     - helpers for CSV values
       - c_something: raw string
       - something: list of CSV values
@@ -229,6 +493,9 @@ class BaseMagiModel(models.Model):
     tinypng_settings = {}
     request = None
     IS_PERSON = False
+    ASYNC_UPDATE_PRIORITY = 0
+    INDEXED_TRANSLATED_FIELDS = []
+    SEARCH_INDEX_FIELDS = []
 
     fk_as_owner = None
     selector_to_owner = classmethod(get_selector_to_owner)
@@ -547,7 +814,49 @@ class BaseMagiModel(models.Model):
             and getattr(self, u'{}_id'.format(field_name), None) is not None):
             self.force_update_cache(field_name)
 
+    def get_pending_async_updates(self):
+        """
+        Returns the names of the fields that need to be updated by the async_db_updates script.
+        """
+        field_names = []
+        for field_name, modified_field_name, boolean_on_change in get_async_update_fields(type(self)):
+            if (field_name not in field_names
+                and is_async_update_pending(self, field_name, modified_field_name, boolean_on_change)):
+                field_names.append(field_name)
+        return field_names
+
+    def enqueue_async_updates(self):
+        """
+        Adds the pending updates of this item to the queue of the async_db_updates script.
+        Doesn't do any query when there's nothing to update.
+        """
+        if not self.pk or not get_async_update_fields(type(self)):
+            return
+        from magi.models import AsyncUpdate
+        enqueued = self.__dict__.setdefault('_async_updates_enqueued', {})
+        for field_name, modified_field_name, boolean_on_change in get_async_update_fields(type(self)):
+            if not is_async_update_pending(self, field_name, modified_field_name, boolean_on_change):
+                continue
+            # Avoid adding it again when both save and update_all_related_caches are called
+            value = (unicode(getattr(self, field_name)), unicode(getattr(self, modified_field_name)))
+            if enqueued.get(field_name, None) != value:
+                AsyncUpdate.enqueue(self, field_name, priority=self.ASYNC_UPDATE_PRIORITY)
+                enqueued[field_name] = value
+
+    def save(self, *args, **kwargs):
+        super(BaseMagiModel, self).save(*args, **kwargs)
+        self.enqueue_async_updates()
+        update_translation_index([self])
+        updateSearchIndex([self])
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        super(BaseMagiModel, self).delete(*args, **kwargs)
+        delete_translation_index(type(self), [pk])
+        deleteSearchIndex(type(self), [pk])
+
     def update_all_related_caches(self, reload_m2m=True, update_reverse_related_caches=True, previous_related_caches={}):
+        self.enqueue_async_updates()
         related_caches = getattr(self, 'RELATED_CACHES', [])
         if related_caches:
             if reload_m2m:
@@ -558,74 +867,178 @@ class BaseMagiModel(models.Model):
             if django_settings.DEBUG and caches_that_changed:
                 print '  UPDATED CACHE', caches_that_changed
         if update_reverse_related_caches:
-            for rel_field_name, rel_cache_name, is_m2m in getattr(
-                    self, 'REVERSE_RELATED_CACHES', []):
-                if modelHasField(type(self), rel_field_name):
-                    if is_m2m:
-                        flag = False
-                        getattr(self, rel_field_name).all()._result_cache = None
-                        rel_items = list(getattr(self, rel_field_name).all())
-                        for rel_item in rel_items:
-                            changed = rel_item.update_cache_if_changed(rel_cache_name)
+            self.update_reverse_related_caches(previous_related_caches=previous_related_caches)
+
+    def _update_reverse_related_cache(self, rel_item, rel_cache_name):
+        if is_deferring_related_caches():
+            defer_related_cache_update(type(rel_item), rel_item.pk, rel_cache_name)
+            return False
+        return rel_item.update_cache_if_changed(rel_cache_name)
+
+    def update_reverse_related_caches(self, previous_related_caches={}):
+        """
+        Updates the caches of the items that have a cache of this item.
+        Deferred within deferred_related_caches.
+        """
+        for rel_field_name, rel_cache_name, is_m2m in getattr(
+                self, 'REVERSE_RELATED_CACHES', []):
+            if modelHasField(type(self), rel_field_name):
+                if is_m2m:
+                    flag = False
+                    getattr(self, rel_field_name).all()._result_cache = None
+                    rel_items = list(getattr(self, rel_field_name).all())
+                    for rel_item in rel_items:
+                        changed = self._update_reverse_related_cache(rel_item, rel_cache_name)
+                        if django_settings.DEBUG and changed:
+                            if not flag:
+                                print '  UPDATE M2M CACHE REV', rel_field_name
+                                flag = True
+                            print '    ', failSafe(lambda: unicode(rel_item), default=rel_item.id)
+                    flag = False
+                    for previous_rel_item in previous_related_caches.get(rel_field_name, []):
+                        if previous_rel_item not in rel_items:
+                            changed = self._update_reverse_related_cache(previous_rel_item, rel_cache_name)
                             if django_settings.DEBUG and changed:
                                 if not flag:
-                                    print '  UPDATE M2M CACHE REV', rel_field_name
+                                    print '  UPDATE M2M CACHE REV OF REMOVED', rel_field_name
                                     flag = True
-                                print '    ', failSafe(lambda: unicode(rel_item), default=rel_item.id)
-                        flag = False
-                        for previous_rel_item in previous_related_caches.get(rel_field_name, []):
-                            if previous_rel_item not in rel_items:
-                                changed = previous_rel_item.update_cache_if_changed(rel_cache_name)
-                                if django_settings.DEBUG and changed:
-                                    if not flag:
-                                        print '  UPDATE M2M CACHE REV OF REMOVED', rel_field_name
-                                        flag = True
-                                    print '    ', failSafe(lambda: unicode(previous_rel_item), default=previous_rel_item.id)
-                    else:
-                        rel_item = getattr(self, rel_field_name)
-                        if rel_item:
-                            changed = rel_item.update_cache_if_changed(rel_cache_name)
-                            if django_settings.DEBUG and changed:
-                                print '  UPDATE CACHE REV', rel_field_name
-                                print '    ', failSafe(lambda: unicode(rel_item), default=rel_item.id)
-                        previous_rel_item = previous_related_caches.get(rel_field_name, None)
-                        if previous_rel_item and previous_rel_item != rel_item:
-                            changed = previous_rel_item.update_cache_if_changed(rel_cache_name)
-                            if django_settings.DEBUG and changed:
-                                print '  UPDATE CACHE REV OF REMOVED', rel_field_name
                                 print '    ', failSafe(lambda: unicode(previous_rel_item), default=previous_rel_item.id)
-
                 else:
-                    rel_queryset = getattr(self, rel_field_name).all()
-                    if is_m2m:
-                        rel_queryset = rel_queryset.prefetch_related(rel_cache_name)
-                    else:
-                        rel_queryset = rel_queryset.select_related(rel_cache_name)
-                    flag = False
-                    for rel_item in rel_queryset:
-                        changed = rel_item.update_cache_if_changed(rel_cache_name)
+                    rel_item = getattr(self, rel_field_name)
+                    if rel_item:
+                        changed = self._update_reverse_related_cache(rel_item, rel_cache_name)
                         if django_settings.DEBUG and changed:
-                            if not flag:
-                                print '  UPDATE CACHE REV', rel_field_name
-                                flag = True
+                            print '  UPDATE CACHE REV', rel_field_name
                             print '    ', failSafe(lambda: unicode(rel_item), default=rel_item.id)
+                    previous_rel_item = previous_related_caches.get(rel_field_name, None)
+                    if previous_rel_item and previous_rel_item != rel_item:
+                        changed = self._update_reverse_related_cache(previous_rel_item, rel_cache_name)
+                        if django_settings.DEBUG and changed:
+                            print '  UPDATE CACHE REV OF REMOVED', rel_field_name
+                            print '    ', failSafe(lambda: unicode(previous_rel_item), default=previous_rel_item.id)
+
+            else:
+                rel_queryset = getattr(self, rel_field_name).all()
+                if is_deferring_related_caches():
+                    for rel_item_pk in rel_queryset.values_list('pk', flat=True):
+                        defer_related_cache_update(rel_queryset.model, rel_item_pk, rel_cache_name)
+                    continue
+                if is_m2m:
+                    rel_queryset = rel_queryset.prefetch_related(rel_cache_name)
+                else:
+                    rel_queryset = rel_queryset.select_related(rel_cache_name)
+                flag = False
+                for rel_item in rel_queryset:
+                    changed = self._update_reverse_related_cache(rel_item, rel_cache_name)
+                    if django_settings.DEBUG and changed:
+                        if not flag:
+                            print '  UPDATE CACHE REV', rel_field_name
+                            flag = True
+                        print '    ', failSafe(lambda: unicode(rel_item), default=rel_item.id)
 
     @classmethod
-    def update_all_related_caches_of_model(self, update_reverse_related_caches=True):
+    def _related_caches_queryset(self, batched=False):
         queryset = self.objects.all()
-        related_caches = getattr(self, 'RELATED_CACHES', [])
-        if not related_caches:
-            return
-        for cache_name in related_caches:
+        for cache_name in getattr(self, 'RELATED_CACHES', []):
             field = modelGetField(self, cache_name)
             if isinstance(field, models.ManyToManyField):
+                # Retrieved by getRelatedCachesOfItems when batched
+                if batched and hasattr(getattr(self, u'to_cache_{}'.format(cache_name), None), 'to_rel_item_cache'):
+                    continue
                 queryset = queryset.prefetch_related(cache_name)
             else:
                 queryset = queryset.select_related(cache_name)
-        for item in queryset:
-            print self.__name__, failSafe(lambda: unicode(item), default=item.id)
-            item.update_all_related_caches(
-                reload_m2m=False, update_reverse_related_caches=update_reverse_related_caches)
+        return queryset
+
+    @classmethod
+    def update_related_caches_of_items(self, items, cache_names=None):
+        """
+        Bulk version of update_all_related_caches, without the reverse related caches.
+        The related items of all the items are retrieved with one query per relation when
+        possible (see getRelatedCachesOfItems), and only the items that changed get saved,
+        in one transaction.
+        cache_names defaults to all the related caches.
+        Returns the number of items that changed.
+        """
+        related_caches = cache_names if cache_names is not None else getattr(self, 'RELATED_CACHES', [])
+        bulk_values = {}
+        # Items of models that override _to_cache_queryset have to be done one by one
+        if self._to_cache_queryset.im_func is BaseMagiModel._to_cache_queryset.im_func:
+            for cache_name in related_caches:
+                values = getRelatedCachesOfItems(self, items, cache_name)
+                if values is not None:
+                    bulk_values[cache_name] = values
+        changed = []
+        for item in items:
+            item.enqueue_async_updates()
+            fields = {}
+            for cache_name in related_caches:
+                total_field_name = u'_cache_total_{}'.format(cache_name)
+                previous_total = getattr(item, total_field_name, None)
+                if cache_name in bulk_values:
+                    value, total = bulk_values[cache_name][item.pk]
+                    setattr(item, total_field_name, total)
+                else:
+                    # Also updates the total for many to many
+                    value = item._to_cache(cache_name)
+                if getattr(item, total_field_name, None) != previous_total:
+                    fields[total_field_name] = getattr(item, total_field_name)
+                cache_field_name, prepared_value = item._prepare_cache(cache_name, value)
+                current_value = getattr(item, cache_field_name)
+                if (current_value or prepared_value) and current_value != prepared_value:
+                    item._update_cache(cache_name, prepared_value, prepared=True, cache_field_name=cache_field_name)
+                    fields[cache_field_name] = prepared_value
+                    if modelHasField(self, u'_cache_{}_last_update'.format(cache_name)):
+                        fields[u'_cache_{}_last_update'.format(cache_name)] = getattr(
+                            item, u'_cache_{}_last_update'.format(cache_name))
+            if fields:
+                changed.append((item, fields))
+        if changed:
+            with transaction.atomic():
+                for item, fields in changed:
+                    type(item).objects.filter(pk=item.pk).update(**fields)
+        return len(changed)
+
+    @classmethod
+    def update_all_related_caches_of_model(
+            self, update_reverse_related_caches=True,
+            batched=False, chunk_size=500, workers=1,
+    ):
+        """
+        When batched is True, the items are updated chunk by chunk with update_related_caches_of_items.
+        The chunks can be spread over {workers} processes.
+        """
+        related_caches = getattr(self, 'RELATED_CACHES', [])
+        if not related_caches:
+            return
+        if not batched:
+            for item in self._related_caches_queryset():
+                print self.__name__, failSafe(lambda: unicode(item), default=item.id)
+                item.update_all_related_caches(
+                    reload_m2m=False, update_reverse_related_caches=update_reverse_related_caches)
+            return
+        pks = list(self.objects.order_by('pk').values_list('pk', flat=True))
+        chunks = [
+            (self._meta.app_label, self._meta.model_name, pks[i], pks[min(i + chunk_size, len(pks)) - 1])
+            for i in range(0, len(pks), chunk_size)
+        ]
+        if workers > 1 and len(chunks) > 1:
+            # Each process opens its own connection
+            for connection in connections.all():
+                connection.close()
+            pool = multiprocessing.Pool(workers)
+            try:
+                results = pool.map(_update_related_caches_of_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_update_related_caches_of_chunk(chunk) for chunk in chunks]
+        for (_app_label, _model_name, first_pk, last_pk), total_changed in zip(chunks, results):
+            print self.__name__, first_pk, '-', last_pk, total_changed, 'changed'
+        if update_reverse_related_caches and getattr(self, 'REVERSE_RELATED_CACHES', []):
+            for item in self.objects.all():
+                item.update_reverse_related_caches()
 
     def get_thumbnail(self, field_name):
         thumbnail = getattr(self, u'_tthumbnail_{}'.format(field_name), None)
@@ -895,12 +1308,34 @@ class BaseMagiModel(models.Model):
     def _attr_error(self, name):
         raise AttributeError("%r object has no attribute %r" % (self.__class__, name))
 
-    def __getattr__(self, name):
+    @classmethod
+    def _has_attribute(self, name):
+        """
+        Equivalent of hasattr on an instance, but resolved from the class:
+        model fields, class attributes, properties or names handled by __getattr__.
+        """
+        return (modelHasField(self, name)
+                or hasattr(self, name)
+                or get_attribute_resolver(self, name) is not None)
+
+    @classmethod
+    def _has_field(self, name):
+        """
+        Same as _has_attribute, but for prefixed names that are never resolved by __getattr__.
+        """
+        return modelHasField(self, name) or hasattr(self, name)
+
+    @classmethod
+    def _resolve_attribute(self, name):
+        """
+        Returns a function that takes an instance and returns the value of the attribute "name".
+        Called once per class and attribute, see get_attribute_resolver.
+        """
         original_name = name
 
         # Reserved names
         if original_name in KNOWN_ITEM_PROPERTIES:
-            return self._attr_error(original_name)
+            return None
 
         # PREFIX + SUFFIX
         ############################################################
@@ -908,9 +1343,9 @@ class BaseMagiModel(models.Model):
 
         if name.startswith('display_'):
             if name.endswith('_timezones'):
-                return type(self).get_displayed_timezones(name)
+                return lambda _s: type(_s).get_displayed_timezones(name)
             if name.endswith('_translation_sources'):
-                return self.get_display_translation_sources(name[8:-20])
+                return lambda _s: _s.get_display_translation_sources(name[8:-20])
 
         # PREFIXES
         ############################################################
@@ -920,62 +1355,82 @@ class BaseMagiModel(models.Model):
         if name.startswith('t_'):
             name = name[2:]
             # For a i_choice
-            if hasattr(self, 'i_{name}'.format(name=name)):
-                return type(self).get_verbose_i(name, getattr(self, 'i_{name}'.format(name=name)))
+            if self._has_field(u'i_{name}'.format(name=name)):
+                i_name = u'i_{name}'.format(name=name)
+                return lambda _s: self.get_verbose_i(name, getattr(_s, i_name))
             # For a CSV value: return dict {value: translated value}
-            elif hasattr(self, 'c_{name}'.format(name=name)):
-                return type(self).get_csv_values(name, getattr(self, name), translated=True)
+            elif self._has_field(u'c_{name}'.format(name=name)):
+                return lambda _s: self.get_csv_values(name, getattr(_s, name), translated=True)
             # For a markdown value: (True, HTML) or (False, Markdown)
-            elif hasattr(self, u'm_{name}'.format(name=name)) and hasattr(self, u'd_m_{name}s'.format(name=name)):
-                return self.get_translation(name)
+            elif (self._has_field(u'm_{name}'.format(name=name))
+                  and self._has_field(u'd_m_{name}s'.format(name=name))):
+                return lambda _s: _s.get_translation(name)
             # For a dict: return dict {key: {'value': value, 'verbose': translation}}
-            elif hasattr(self, u'd_{name}'.format(name=name)):
-                return type(self).get_dict_values(name, getattr(self, u'd_{name}'.format(name=name)), translated=True)
+            elif self._has_field(u'd_{name}'.format(name=name)):
+                d_name = u'd_{name}'.format(name=name)
+                return lambda _s: self.get_dict_values(name, getattr(_s, d_name), translated=True)
             # For a dict, if no _s exists: return value for language
-            elif hasattr(self, u'd_{}s'.format(name)) and hasattr(self, name):
-                return self.get_translation(name)
-            return self._attr_error(original_name)
+            elif self._has_field(u'd_{}s'.format(name)) and self._has_attribute(name):
+                return lambda _s: _s.get_translation(name)
+            return None
 
         # When accessing "has_something" and "i_something" exists
         if name.startswith('has_'):
             name = name[4:]
             # For a i_choice
-            if hasattr(self, 'i_{name}'.format(name=name)):
-                return getattr(self, 'i_{name}'.format(name=name)) is not None
-            return self._attr_error(original_name)
+            if self._has_field(u'i_{name}'.format(name=name)):
+                i_name = u'i_{name}'.format(name=name)
+                return lambda _s: getattr(_s, i_name) is not None
+            return None
 
         # Return cache
         elif name.startswith('cached_'):
             field_name = name[7:]
-            cache = getattr(self, u'_internal_cache_{}'.format(field_name), -1)
-            if cache != -1:
-                return cache
+            internal_cache_name = u'_internal_cache_{}'.format(field_name)
+            get_cache, keep_in_internal_cache = None, True
             # Accessing cached_something when _cache_j_something exists
-            if hasattr(self, '_cache_j_{}'.format(field_name)):
-                self._force_on_last_update_or_none(field_name, prefix='j_')
-                cache = type(self).get_cached_json(field_name, getattr(self, '_cache_j_{}'.format(field_name)))
+            if self._has_field(u'_cache_j_{}'.format(field_name)):
+                cache_field_name = u'_cache_j_{}'.format(field_name)
+                def get_cache(_s):
+                    _s._force_on_last_update_or_none(field_name, prefix='j_')
+                    return self.get_cached_json(field_name, getattr(_s, cache_field_name))
             # Accessing cached_something when _cache_c_something exists
-            elif hasattr(self, '_cache_c_{}'.format(field_name)):
-                self._force_on_last_update_or_none(field_name, prefix='j_')
-                cache = type(self).get_cached_csv(field_name, getattr(self, '_cache_c_{}'.format(field_name)))
+            elif self._has_field(u'_cache_c_{}'.format(field_name)):
+                cache_field_name = u'_cache_c_{}'.format(field_name)
+                def get_cache(_s):
+                    _s._force_on_last_update_or_none(field_name, prefix='j_')
+                    return self.get_cached_csv(field_name, getattr(_s, cache_field_name))
             # Accessing cached_something when _cache_i_something exists
-            elif hasattr(self, '_cache_i_{}'.format(field_name)):
-                return type(self).get_reverse_i(
-                    field_name, getattr(self, 'cached_i_{}'.format(field_name)),
+            elif self._has_field(u'_cache_i_{}'.format(field_name)):
+                keep_in_internal_cache = False
+                get_cache = lambda _s: self.get_reverse_i(
+                    field_name, getattr(_s, u'cached_i_{}'.format(field_name)),
                 )
             # Accessing cached_t_something when _cache_i_something exists
-            elif field_name.startswith('t_') and hasattr(self, '_cache_i_{}'.format(field_name[2:])):
-                return type(self).get_verbose_i(
-                    field_name[2:], getattr(self, 'cached_i_{}'.format(field_name[2:])),
+            elif field_name.startswith('t_') and self._has_field(u'_cache_i_{}'.format(field_name[2:])):
+                keep_in_internal_cache = False
+                get_cache = lambda _s: self.get_verbose_i(
+                    field_name[2:], getattr(_s, u'cached_i_{}'.format(field_name[2:])),
                 )
             # Accessing cached_something when _cache_something exists
-            elif hasattr(self, '_cache_{}'.format(field_name)):
-                self._force_on_last_update_or_none(field_name)
-                cache = getattr(self, '_cache_{}'.format(field_name))
-            if cache != -1:
-                setattr(self, u'_internal_cache_{}'.format(field_name), cache)
-                return cache
-            return self._attr_error(original_name)
+            elif self._has_field(u'_cache_{}'.format(field_name)):
+                cache_field_name = u'_cache_{}'.format(field_name)
+                def get_cache(_s):
+                    _s._force_on_last_update_or_none(field_name)
+                    return getattr(_s, cache_field_name)
+            def _get_cached(_s):
+                cache = _s.__dict__.get(internal_cache_name, -1)
+                if cache != -1:
+                    return cache
+                if get_cache:
+                    cache = get_cache(_s)
+                    if not keep_in_internal_cache:
+                        return cache
+                    if cache != -1:
+                        setattr(_s, internal_cache_name, cache)
+                        return cache
+                return _s._attr_error(original_name)
+            return _get_cached
 
         # SUFFIXES
         ############################################################
@@ -984,88 +1439,113 @@ class BaseMagiModel(models.Model):
         # When accessing "something_thumbnail"
         if name.endswith('_thumbnail'):
             field_name = name[:-10]
-            return self.get_thumbnail(field_name)
+            return lambda _s: _s.get_thumbnail(field_name)
 
         # When accessing "something_original"
         elif name.endswith('_original'):
             field_name = name[:-9]
-            return self.get_original(field_name)
+            return lambda _s: _s.get_original(field_name)
 
         # When accessing "something_force_2x"
         elif name.endswith('_force_2x'):
             field_name = name[:-9]
-            return self.get_force_2x(field_name)
+            return lambda _s: _s.get_force_2x(field_name)
 
         # When accessing "something_2x"
         elif name.endswith('_2x'):
             field_name = name[:-3]
-            return self.get_2x(field_name)
+            return lambda _s: _s.get_2x(field_name)
 
         # When accessing "something_image"
-        elif name.endswith('_image') and getattr(self, '{}_AUTO_IMAGES'.format(name[:-6].upper()), False):
-            return self.get_auto_image(name[:-6], getattr(self, name[:-6]), instance=self)
+        elif name.endswith('_image'):
+            auto_images = getattr(self, '{}_AUTO_IMAGES'.format(name[:-6].upper()), False)
+            if isinstance(auto_images, property):
+                # Can only be known from the instance
+                without_prefix = self._resolve_attribute_without_prefix(name)
+                return lambda _s: (
+                    _s.get_auto_image(name[:-6], getattr(_s, name[:-6]), instance=_s)
+                    if getattr(_s, '{}_AUTO_IMAGES'.format(name[:-6].upper()), False)
+                    else (without_prefix(_s) if without_prefix else _s._attr_error(original_name))
+                )
+            elif auto_images:
+                return lambda _s: _s.get_auto_image(name[:-6], getattr(_s, name[:-6]), instance=_s)
 
         # When accessing "something_url"
         elif name.endswith('_url'):
             field_name = name.replace('http_', '')[:-4]
-            try:
-                field = self._meta.get_field(field_name)
-            except FieldDoesNotExist:
-                field = None
+            field = modelGetField(self, field_name)
             if field:
                 # For an image, return the url
-                if isinstance(self._meta.get_field(field_name), models.ImageField):
-                    return (get_http_image_url(self, field_name)
+                if isinstance(field, models.ImageField):
+                    return ((lambda _s: get_http_image_url(_s, field_name))
                             if name.startswith('http_')
-                            else get_image_url(self, field_name))
+                            else (lambda _s: get_image_url(_s, field_name)))
                 # For a file, return the url
-                elif isinstance(self._meta.get_field(field_name), models.FileField):
-                    return (get_http_file_url(self, field_name)
+                elif isinstance(field, models.FileField):
+                    return ((lambda _s: get_http_file_url(_s, field_name))
                             if name.startswith('http_')
-                            else get_file_url(self, field_name))
-                return self._attr_error(original_name)
+                            else (lambda _s: get_file_url(_s, field_name)))
+                return None
             # If it's a string, just turn it into a path
-            value = getattr(self, field_name)
-            if (isinstance(value, basestring)
-                or isinstance(value, ImageFieldFile)):
-                return (get_http_file_url_from_path(unicode(value))
-                        if name.startswith('http_')
-                        else get_file_url_from_path(unicode(value)))
-            return self._attr_error(original_name)
+            get_file_url_from_value = (
+                get_http_file_url_from_path if name.startswith('http_')
+                else get_file_url_from_path)
+            def _path_url(_s):
+                value = getattr(_s, field_name)
+                if (isinstance(value, basestring)
+                    or isinstance(value, ImageFieldFile)):
+                    return get_file_url_from_value(unicode(value))
+                return _s._attr_error(original_name)
+            return _path_url
+
+        return self._resolve_attribute_without_prefix(name)
 
+    @classmethod
+    def _resolve_attribute_without_prefix(self, name):
         # WITHOUT PREFIX
         ############################################################
         # When accessing "something" and "X_something" exists where X is a MagiCircles prefix
 
         for prefix in ['_', 'i_', 'c_', 'd_', 'm_', 'j_']:
             if name.startswith(prefix):
-                return self._attr_error(original_name)
+                return None
 
         # When accessing "something" and "i_something exists, return the readable key for the choice
-        if hasattr(self, u'i_{name}'.format(name=name)):
-            return type(self).get_reverse_i(name, getattr(self, u'i_{name}'.format(name=name)))
+        if self._has_field(u'i_{name}'.format(name=name)):
+            i_name = u'i_{name}'.format(name=name)
+            return lambda _s: self.get_reverse_i(name, getattr(_s, i_name))
 
         # When accessing "something" and "c_something" exists, returns the list of CSV values
-        elif hasattr(self, 'c_{name}'.format(name=name)):
-            return type(self).get_csv_values(name, getattr(self, 'c_{name}'.format(name=name)), translated=False)
+        elif self._has_field(u'c_{name}'.format(name=name)):
+            c_name = u'c_{name}'.format(name=name)
+            return lambda _s: self.get_csv_values(name, getattr(_s, c_name), translated=False)
 
         # When accessing "something" and "d_m_something" exists, returns the dict
-        elif hasattr(self, 'd_m_{name}'.format(name=name)):
-            return type(self).get_markdown_dict_values(name, getattr(self, u'd_m_{name}'.format(name=name)), translated=False)
+        elif self._has_field(u'd_m_{name}'.format(name=name)):
+            d_m_name = u'd_m_{name}'.format(name=name)
+            return lambda _s: self.get_markdown_dict_values(name, getattr(_s, d_m_name), translated=False)
 
         # When accessing "something" and "d_something" exists, returns the dict
-        elif hasattr(self, 'd_{name}'.format(name=name)):
-            return type(self).get_dict_values(name, getattr(self, u'd_{name}'.format(name=name)), translated=False)
+        elif self._has_field(u'd_{name}'.format(name=name)):
+            d_name = u'd_{name}'.format(name=name)
+            return lambda _s: self.get_dict_values(name, getattr(_s, d_name), translated=False)
 
         # When accessing "something" and "m_something" exists, returns the html value if exists
-        elif hasattr(self, 'm_{name}'.format(name=name)):
-            return self._get_markdown_value(name)
+        elif self._has_field(u'm_{name}'.format(name=name)):
+            return lambda _s: _s._get_markdown_value(name)
 
         # When accessing "something" and "j_something" exists, return the python variable (dict, list, ...)
-        elif hasattr(self, u'j_{}'.format(name)):
-            return type(self).get_json_value(name, getattr(self, u'j_{}'.format(name)))
+        elif self._has_field(u'j_{}'.format(name)):
+            j_name = u'j_{}'.format(name)
+            return lambda _s: self.get_json_value(name, getattr(_s, j_name))
+
+        return None
 
-        return self._attr_error(original_name)
+    def __getattr__(self, name):
+        resolver = get_attribute_resolver(type(self), name)
+        if resolver is None:
+            return self._attr_error(name)
+        return resolver(self)
 
     def __unicode__(self):
         try:
@@ -1233,6 +1713,8 @@ class CachedItem(AttrDict):
     """This class mimics some features of MagiModel"""
     model_class = None
     collection_name = None
+    # { model class: { name: function that takes a cached item and returns the value, or None } }
+    _attribute_resolvers = {}
 
     def get_translation(
             self, field_name, language=None,
@@ -1269,69 +1751,98 @@ class CachedItem(AttrDict):
         # This ensures it doesn't fail on existing properties
         return getattr(self, name)
 
-    def __getattr__(self, name):
+    @classmethod
+    def _resolve_attribute(self, model_class, name):
+        """
+        Returns a function that takes a cached item and returns the value of the attribute "name".
+        Called once per model class and attribute, see CachedItem.__getattr__.
+        Whether a cached item contains a field depends on what was cached, so that's still checked on
+        the cached item itself, while what only depends on the model class is decided here.
+        """
         original_name = name
 
         # Reserved names
         if original_name in KNOWN_ITEM_PROPERTIES:
-            return self._attr_error(original_name)
+            return None
 
         # PROPERTIES IN MODEL CLASS
         # Some properties like item_url & co are set below with addMagiModelProperties
         # Properties + Classmethods retrieved with getValueIfNotProperty. ex: IS_PERSON, get_auto_image
-        if self.model_class:
-            value_from_model_class = getValueIfNotProperty(self.model_class, original_name, default=-1)
-            if value_from_model_class != -1:
-                return value_from_model_class
+        if model_class:
+            if getValueIfNotProperty(model_class, original_name, default=-1) != -1:
+                return lambda _s: getValueIfNotProperty(model_class, original_name, default=-1)
 
         # PREFIXES
         # When accessing "t_something", return the verbose value
         # Note: Markdown (d_m_) and Dicts (d_) are not supported at the moment.
         if name.startswith('t_'):
             name = name[2:]
-            # For a i_choice
-            if self.model_class and hasattr(self, 'i_{name}'.format(name=name)):
-                return self.model_class.get_verbose_i(name, getattr(self, 'i_{name}'.format(name=name)))
-            # For a CSV value: return dict {value: translated value}
-            elif self.model_class and hasattr(self, 'c_{name}'.format(name=name)):
-                return self.model_class.get_csv_values(name, getattr(self, name), translated=True)
-            # Regular fields translations
-            elif hasattr(self, name):
-                return self.get_translation(name)
-            return self._attr_error(original_name)
+            i_name, c_name = u'i_{name}'.format(name=name), u'c_{name}'.format(name=name)
+            def _get_translated(_s):
+                # For a i_choice
+                if model_class and i_name in _s.__dict__:
+                    return model_class.get_verbose_i(name, _s.__dict__[i_name])
+                # For a CSV value: return dict {value: translated value}
+                elif model_class and c_name in _s.__dict__:
+                    return model_class.get_csv_values(name, getattr(_s, name), translated=True)
+                # Regular fields translations
+                elif hasattr(_s, name):
+                    return _s.get_translation(name)
+                return _s._attr_error(original_name)
+            return _get_translated
         # When accessing "has_something" and "i_something" exists
         if name.startswith('has_'):
             name = name[4:]
+            i_name = u'i_{name}'.format(name=name)
             # For a i_choice
-            if hasattr(self, 'i_{name}'.format(name=name)):
-                return getattr(self, 'i_{name}'.format(name=name)) is not None
-            return self._attr_error(original_name)
+            return lambda _s: (
+                _s.__dict__[i_name] is not None
+                if i_name in _s.__dict__
+                else _s._attr_error(original_name)
+            )
 
         # SUFFIXES
         # When accessing "something_image"
-        if (self.model_class and name.endswith('_image')
-            and getattr(self, '{}_AUTO_IMAGES'.format(name[:-6].upper()), False)):
-            return self.model_class.get_auto_image(name[:-6], getattr(self, name[:-6]), instance=self)
+        if (model_class and name.endswith('_image')
+            and getValueIfNotProperty(model_class, '{}_AUTO_IMAGES'.format(name[:-6].upper()), default=False)):
+            return lambda _s: model_class.get_auto_image(name[:-6], getattr(_s, name[:-6]), instance=_s)
         # When accessing "something_url"
         elif name.endswith('_url'):
-            original_image_value = getattr(self, name.replace('http_', '')[:-4])
+            field_name = name.replace('http_', '')[:-4]
             if name.startswith('http_'):
-                return get_http_image_url_from_path(original_image_value)
-            return get_image_url_from_path(original_image_value)
+                return lambda _s: get_http_image_url_from_path(getattr(_s, field_name))
+            return lambda _s: get_image_url_from_path(getattr(_s, field_name))
 
         # WITHOUT PREFIX
         # Note: Markdown (m_) and Dicts (d_) are not supported at the moment.
         for prefix in ['_', 'i_', 'c_', 'd_', 'm_', 'j_']:
             if name.startswith(prefix):
-                return self._attr_error(original_name)
-        # When accessing "something" and "i_something exists, return the readable key for the choice
-        if self.model_class and hasattr(self, u'i_{name}'.format(name=name)):
-            return self.model_class.get_reverse_i(name, getattr(self, u'i_{name}'.format(name=name)))
-        # When accessing "something" and "c_something" exists, returns the list of CSV values
-        elif self.model_class and hasattr(self, 'c_{name}'.format(name=name)):
-            return self.model_class.get_csv_values(
-                name, getattr(self, 'c_{name}'.format(name=name)), translated=False)
-        return self._attr_error(original_name)
+                return None
+        if not model_class:
+            return None
+        i_name, c_name = u'i_{name}'.format(name=name), u'c_{name}'.format(name=name)
+        def _get_value(_s):
+            # When accessing "something" and "i_something exists, return the readable key for the choice
+            if i_name in _s.__dict__:
+                return model_class.get_reverse_i(name, _s.__dict__[i_name])
+            # When accessing "something" and "c_something" exists, returns the list of CSV values
+            elif c_name in _s.__dict__:
+                return model_class.get_csv_values(name, _s.__dict__[c_name], translated=False)
+            return _s._attr_error(original_name)
+        return _get_value
+
+    def __getattr__(self, name):
+        model_class = self.__dict__.get('model_class', None)
+        resolvers = CachedItem._attribute_resolvers.get(model_class, None)
+        if resolvers is None:
+            resolvers = CachedItem._attribute_resolvers[model_class] = {}
+        try:
+            resolver = resolvers[name]
+        except KeyError:
+            resolver = resolvers[name] = CachedItem._resolve_attribute(model_class, name)
+        if resolver is None:
+            return self._attr_error(name)
+        return resolver(self)
 
     def __unicode__(self):
         language = get_language()
@@ -8,7 +8,7 @@ from django.utils.safestring import mark_safe
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.middleware import csrf
 from django.http import Http404
-from django.db.models import Q, Prefetch, FieldDoesNotExist
+from django.db.models import Q, Prefetch, FieldDoesNotExist, Count
 from django.shortcuts import get_object_or_404
 from django.conf import settings as django_settings
 from magi.views import indexExtraContext
@@ -60,14 +60,15 @@ from magi.utils import (
     listUnique,
     getEnglish,
     newOrder,
-    getModelOfRelatedItem,
     selectRelatedDictToStrings,
+    getPreselectedPlan,
+    copyQueryset,
     displayQueryset,
     snakeToCamelCase,
     getListURL,
     getRelOptionsDict,
     getMaxShownForPrefetchedTogether,
-    getQuerysetFromModel,
+    getQuerysetOfRelatedItem,
     getFilterFieldNameOfRelatedItem,
     articleJsonLdFromActivity,
     modelGetField,
@@ -341,35 +342,18 @@ class MagiCollection(object):
             + selectRelatedDictToStrings(queryset.query.select_related)
         )
         if fields_preselected:
-            new_fields_preselected = []
+            new_fields_preselected, new_fields_prefetched = [], []
             for preselected in fields_preselected:
-                model_of_preselected = getModelOfRelatedItem(queryset.model, preselected)
-                queryset_of_preselected = getQuerysetFromModel(model_of_preselected, request=request)
-                new_fields_preselected += [ preselected ]
-                if queryset_of_preselected is not None:
-                    new_fields_preselected += [
-                        u'{}__{}'.format(preselected, other_preselected)
-                        for other_preselected in selectRelatedDictToStrings(queryset_of_preselected.query.select_related)
-                    ]
-                    for other_prefetched in queryset_of_preselected._prefetch_related_lookups:
-                        queryset_of_other_prefetched = None
-                        if isinstance(other_prefetched, Prefetch):
-                            queryset_of_other_prefetched = other_prefetched.queryset
-                            other_prefetched = other_prefetched.prefetch_to
-                        if queryset_of_other_prefetched is None:
-                            model_of_other_prefetched = getModelOfRelatedItem(model_of_preselected, other_prefetched)
-                            queryset_of_other_prefetched = getQuerysetFromModel(model_of_other_prefetched, request=request)
-                        if queryset_of_other_prefetched is not None:
-                            queryset = queryset.prefetch_related(Prefetch(
-                                u'{}__{}'.format(preselected, other_prefetched),
-                                queryset=queryset_of_other_prefetched.distinct(),
-                            ))
-                        else:
-                            queryset = queryset.prefetch_related( u'{}__{}'.format(preselected, other_prefetched))
-            # select_related modifies the queryset in place, so we need to make a copy
-            queryset = copy.deepcopy(queryset)
-            queryset.query.select_related = False
-            queryset = queryset.select_related(*new_fields_preselected)
+                other_preselected, other_prefetched = getPreselectedPlan(queryset.model, preselected)
+                new_fields_preselected += other_preselected
+                new_fields_prefetched += [
+                    Prefetch(lookup, queryset=copyQueryset(queryset_of_other_prefetched))
+                    if queryset_of_other_prefetched is not None else lookup
+                    for lookup, queryset_of_other_prefetched in other_prefetched
+                ]
+            if new_fields_prefetched:
+                queryset = queryset.prefetch_related(*new_fields_prefetched)
+            queryset = queryset.select_related(None).select_related(*new_fields_preselected)
 
         # Prefetched
 
@@ -394,9 +378,8 @@ class MagiCollection(object):
                     to_attr = prefetched.prefetch_to
                 prefetched = prefetched.prefetch_through
             if queryset_of_prefetched is None:
-                model_of_prefetched = getModelOfRelatedItem(queryset.model, prefetched)
-                collection_of_prefetched, queryset_of_prefetched = getQuerysetFromModel(
-                    model_of_prefetched, request=request, return_collection=True)
+                collection_of_prefetched, queryset_of_prefetched = getQuerysetOfRelatedItem(
+                    queryset.model, prefetched)
                 # For item view, if the site is in high traffic mode and the current user
                 # is not authenticated, don't prefetch at all.
                 if (getattr(django_settings, 'HIGH_TRAFFIC', False)
@@ -474,80 +457,118 @@ class MagiCollection(object):
                 prefixes.append(header_prefix)
         return prefixes
 
+    def _collectibles_to_count(self, view, request):
+        """
+        Returns the list of (collectible collection, item field name, fk owner, fk owner ids)
+        to count the collected items of the authenticated user.
+        Also sets add_to_{} in request for quick add. Computed once per request.
+        """
+        cache_name = u'_collectibles_to_count_{}_{}'.format(self.name, view.view)
+        if hasattr(request, cache_name):
+            return getattr(request, cache_name)
+        to_count = []
+        setattr(request, cache_name, to_count)
+        if (not request.user.is_authenticated()
+            or not self.collectible_collections
+            or not getattr(request, 'show_collect_button', False)):
+            return to_count
+        for name, collection in self.collectible_collections.items():
+            if (not collection.add_view.enabled
+                or (isinstance(request.show_collect_button, dict)
+                    and not request.show_collect_button.get(name, True))
+                or not collection.add_view.has_permissions(request, {})):
+                continue
+            item_field_name = getattr(collection.queryset.model, 'selector_to_collected_item',
+                                      self.model_name)
+            fk_owner = collection.queryset.model.fk_as_owner if collection.queryset.model.fk_as_owner else 'owner'
+            quick_add_to_collection = collection.add_view.quick_add_to_collection(request)
+            if quick_add_to_collection:
+                # Quick add
+                if not collection.queryset.model.fk_as_owner:
+                    # With owner
+                    fk_owner_ids = request.user.id
+                else:
+                    # With fk_as_owner
+                    fk_owner_ids = request.GET.get(u'add_to_{}'.format(name))
+                    if fk_owner_ids:
+                        # Get from request
+                        fk_owner_ids = int(fk_owner_ids)
+                    else:
+                        # Get the first one in the list
+                        if collection.queryset.model.fk_as_owner == 'account':
+                            if collection.collectible_limit_to_account_types is not None:
+                                all_fk_owner_ids = [
+                                    account_id for account_id, type_ in getAccountTypesFromSession(request).items()
+                                    if type_ in collection.collectible_limit_to_account_types
+                                ]
+                            else:
+                                all_fk_owner_ids = getAccountIdsFromSession(request)
+                        else:
+                            all_fk_owner_ids = collection.queryset.model.owner_ids(request.user)
+                        try:
+                            fk_owner_ids = all_fk_owner_ids[0]
+                        except IndexError:
+                            fk_owner_ids = None
+                        setattr(request, u'total_fk_owner_ids_{}'.format(name), len(all_fk_owner_ids))
+                setattr(request, u'add_to_{}'.format(name), fk_owner_ids)
+                fk_owner_ids = [ fk_owner_ids ] if fk_owner_ids else []
+            else:
+                fk_owner_ids = list(
+                    getAccountIdsFromSession(request)
+                    if fk_owner == 'account'
+                    else collection.queryset.model.owner_ids(request.user))
+            if not fk_owner_ids:
+                continue
+            # Only count if show_collect_total is on OR quick add is on
+            if (not quick_add_to_collection
+                and (not view.show_collect_total
+                     or (isinstance(view.show_collect_total, dict)
+                         and not view.show_collect_total.get(name, True)))):
+                continue
+            to_count.append((collection, item_field_name, fk_owner, fk_owner_ids))
+        return to_count
+
     def _collectibles_queryset(self, view, queryset, request=None):
         if queryset is None:
             queryset = self.queryset
         if not request:
             return queryset
         # Select related total collectible for authenticated user
-        if request.user.is_authenticated() and self.collectible_collections:
-            if not getattr(request, 'show_collect_button', False):
-                return queryset
-            for name, collection in self.collectible_collections.items():
-                if (not collection.add_view.enabled
-                    or (isinstance(request.show_collect_button, dict)
-                        and not request.show_collect_button.get(name, True))
-                    or not collection.add_view.has_permissions(request, {})):
-                    continue
-                item_field_name = getattr(collection.queryset.model, 'selector_to_collected_item',
-                                          self.model_name)
-                fk_owner = collection.queryset.model.fk_as_owner if collection.queryset.model.fk_as_owner else 'owner'
-                if collection.add_view.enabled and collection.add_view.quick_add_to_collection(request):
-                    # Quick add
-                    if not collection.queryset.model.fk_as_owner:
-                        # With owner
-                        fk_owner_ids = request.user.id
-                    else:
-                        # With fk_as_owner
-                        fk_owner_ids = request.GET.get(u'add_to_{}'.format(name))
-                        if fk_owner_ids:
-                            # Get from request
-                            fk_owner_ids = int(fk_owner_ids)
-                        else:
-                            # Get the first one in the list
-                            if collection.queryset.model.fk_as_owner == 'account':
-                                if collection.collectible_limit_to_account_types is not None:
-                                    all_fk_owner_ids = [
-                                        account_id for account_id, type_ in getAccountTypesFromSession(request).items()
-                                        if type_ in collection.collectible_limit_to_account_types
-                                    ]
-                                else:
-                                    all_fk_owner_ids = getAccountIdsFromSession(request)
-                            else:
-                                all_fk_owner_ids = collection.queryset.model.owner_ids(request.user)
-                            try:
-                                fk_owner_ids = all_fk_owner_ids[0]
-                            except IndexError:
-                                fk_owner_ids = None
-                            setattr(request, u'total_fk_owner_ids_{}'.format(name), len(all_fk_owner_ids))
-                    setattr(request, u'add_to_{}'.format(name), fk_owner_ids)
-                else:
-                    fk_owner_ids = ','.join(unicode(i) for i in (
-                        getAccountIdsFromSession(request)
-                        if fk_owner == 'account'
-                        else collection.queryset.model.owner_ids(request.user)))
-                if not fk_owner_ids:
-                    continue
-                # Only join the total if show_collect_total is on OR quick add is on
-                if (not collection.add_view.quick_add_to_collection(request)
-                    and (not view.show_collect_total
-                         or (isinstance(view.show_collect_total, dict)
-                             and not view.show_collect_total.get(name, True)))):
-                    pass
-                else:
-                    a = {
-                        u'total_{}'.format(collection.name):
-                        'SELECT COUNT(*) FROM {db_table} WHERE {item_field_name}_id = {item_db_table}.{item_pk_name} AND {fk_owner}_id IN ({fk_owner_ids})'.format(
-                            db_table=collection.queryset.model._meta.db_table,
-                            item_field_name=item_field_name,
-                            item_db_table=self.queryset.model._meta.db_table,
-                            item_pk_name=self.queryset.model._meta.pk.column,
-                            fk_owner=fk_owner, fk_owner_ids=fk_owner_ids,
-                        )
-                    }
-                    queryset = queryset.extra(select=a)
+        to_count = self._collectibles_to_count(view, request)
+        # List views count them for the items of the page only, see set_collectibles_totals
+        if getattr(view, 'collectibles_totals_per_page', False):
+            return queryset
+        for collection, item_field_name, fk_owner, fk_owner_ids in to_count:
+            a = {
+                u'total_{}'.format(collection.name):
+                'SELECT COUNT(*) FROM {db_table} WHERE {item_field_name}_id = {item_db_table}.{item_pk_name} AND {fk_owner}_id IN ({fk_owner_ids})'.format(
+                    db_table=collection.queryset.model._meta.db_table,
+                    item_field_name=item_field_name,
+                    item_db_table=self.queryset.model._meta.db_table,
+                    item_pk_name=self.queryset.model._meta.pk.column,
+                    fk_owner=fk_owner, fk_owner_ids=','.join(unicode(i) for i in fk_owner_ids),
+                )
+            }
+            queryset = queryset.extra(select=a)
         return queryset
 
+    def set_collectibles_totals(self, view, request, items):
+        """
+        Sets total_{} in the items of a page, with one grouped query per collectible collection.
+        """
+        if not request or not items:
+            return
+        for collection, item_field_name, fk_owner, fk_owner_ids in self._collectibles_to_count(view, request):
+            totals = {
+                total[item_field_name]: total['total']
+                for total in collection.queryset.model.objects.filter(**{
+                    u'{}__in'.format(item_field_name): [ item.pk for item in items ],
+                    u'{}__in'.format(fk_owner): fk_owner_ids,
+                }).order_by().values(item_field_name).annotate(total=Count('pk'))
+            }
+            for item in items:
+                setattr(item, u'total_{}'.format(collection.name), totals.get(item.pk, 0))
+
     def to_form_class(self):
         """Used in urls.py"""
         class _Form(forms.AutoForm):
@@ -1839,6 +1860,81 @@ class MagiCollection(object):
     show_collect_button = True # Can also be a dictionary when multiple collectibles
     show_collect_total = True
 
+    def _collectible_buttons_per_request(self, view, request, context):
+        """
+        What the collectible buttons of buttons_per_item have in common for all the items
+        of a page. Computed once per request.
+        """
+        cache_name = u'_collectible_buttons_{}_{}'.format(self.name, view.view)
+        if hasattr(request, cache_name):
+            return getattr(request, cache_name)
+        per_request = OrderedDict()
+        for name, collectible_collection in self.collectible_collections.items():
+            if (not request.show_collect_button
+                or (isinstance(request.show_collect_button, dict)
+                    and not request.show_collect_button.get(name, True))
+                or not collectible_collection.add_view.enabled):
+                continue
+            details = {
+                'collection': collectible_collection,
+                'extra_attributes': {},
+                'edit_sentence': None,
+                'delete_sentence': None,
+                'total_accounts': 0,
+            }
+            extra_attributes = details['extra_attributes']
+            quick_add_to_collection = collectible_collection.add_view.quick_add_to_collection(request) if request.user.is_authenticated() else False
+            details['show'] = (
+                request.show_collect_button[name]
+                if isinstance(request.show_collect_button, dict) else request.show_collect_button)
+            details['title'] = unicode(collectible_collection.add_sentence)
+            show_total = view.show_collect_total.get(name, True) if isinstance(view.show_collect_total, dict) else view.show_collect_total
+            if quick_add_to_collection:
+                show_total = True
+            details['show_total'] = show_total
+            details['icon'] = (
+                collectible_collection.icon
+                if collectible_collection.list_view.add_button_use_collection_icon
+                else collectible_collection.add_view.view_icon
+            )
+            if collectible_collection.add_view.unique_per_owner:
+                extra_attributes['unique-per-owner'] = 'true'
+            if quick_add_to_collection:
+                extra_attributes['quick-add-to-collection'] = 'true'
+                extra_attributes['parent-item-field-name-id'] = collectible_collection.item_field_name_id
+                if collectible_collection.queryset.model.fk_as_owner:
+                    add_to_id_from_request = getattr(request, u'add_to_{}'.format(collectible_collection.name), None)
+                    if not add_to_id_from_request:
+                        quick_add_to_collection = False
+                        del(extra_attributes['quick-add-to-collection'])
+                        del(extra_attributes['parent-item-field-name-id'])
+                    else:
+                        extra_attributes['quick-add-to-id'] = add_to_id_from_request
+                        extra_attributes['quick-add-to-fk-as-owner'] = collectible_collection.queryset.model.fk_as_owner or 'owner'
+            details['quick_add_to_collection'] = quick_add_to_collection
+            if show_total and collectible_collection.add_view.unique_per_owner and not quick_add_to_collection:
+                if collectible_collection.queryset.model.fk_as_owner == 'account':
+                    details['total_accounts'] = len(getAccountIdsFromSession(request))
+                    details['edit_sentence'] = unicode(_('Edit your {thing}')).format(
+                        thing=unicode(collectible_collection.title
+                                      if details['total_accounts'] == 1
+                                      else collectible_collection.plural_title).lower())
+            if show_total and collectible_collection.add_view.unique_per_owner and quick_add_to_collection:
+                details['delete_sentence'] = unicode(_('Delete {thing}')).format(thing=unicode(collectible_collection.title).lower())
+            details['signup'] = (
+                collectible_collection.add_view.authentication_required
+                and not collectible_collection.add_view.requires_permissions()
+                and not request.user.is_authenticated()
+            )
+            details['add_url'] = collectible_collection.get_add_url()
+            if not details['signup']:
+                details['has_permissions'] = collectible_collection.add_view.has_permissions(request, context)
+                details['ajax_add_url'] = collectible_collection.get_add_url(ajax=True)
+                details['staff_only'] = collectible_collection.add_view.staff_required and not view.staff_required
+            per_request[name] = details
+        setattr(request, cache_name, per_request)
+        return per_request
+
     def buttons_per_item(self, view, request, context, item):
         """
         Used to display buttons below item, only for ItemView and ListView.
@@ -1871,14 +1967,9 @@ class MagiCollection(object):
                 and not view.staff_required):
                 buttons['open']['classes'].append('staff-only')
         # Collectible buttons
-        for name, collectible_collection in self.collectible_collections.items():
-            if (not request.show_collect_button
-                or (isinstance(request.show_collect_button, dict)
-                    and not request.show_collect_button.get(name, True))
-                or not collectible_collection.add_view.enabled):
-                continue
-            extra_attributes = {}
-            quick_add_to_collection = collectible_collection.add_view.quick_add_to_collection(request) if request.user.is_authenticated() else False
+        for name, details in self._collectible_buttons_per_request(view, request, context).items():
+            collectible_collection = details['collection']
+            extra_attributes = details['extra_attributes'].copy()
             url_to_collectible_add_with_item = lambda url: (
                 u'{url}?{item_field_name_id}={item_pk}&{variables}'.format(
                     url=url, item_field_name_id=collectible_collection.item_field_name_id,
@@ -1892,69 +1983,38 @@ class MagiCollection(object):
                 ))
             set_base_button(name)
             buttons[name]['has_permissions'] = False
-            buttons[name]['show'] = (
-                request.show_collect_button[name]
-                if isinstance(request.show_collect_button, dict) else request.show_collect_button)
-            buttons[name]['title'] = collectible_collection.add_sentence
-            show_total = view.show_collect_total.get(name, True) if isinstance(view.show_collect_total, dict) else view.show_collect_total
-            if quick_add_to_collection:
-                show_total = True
-            if show_total:
+            buttons[name]['show'] = details['show']
+            buttons[name]['title'] = details['title']
+            if details['show_total']:
                 buttons[name]['badge'] = getattr(item, u'total_{}'.format(name), 0)
-            buttons[name]['icon'] = (
-                collectible_collection.icon
-                if collectible_collection.list_view.add_button_use_collection_icon
-                else collectible_collection.add_view.view_icon
-            )
+            buttons[name]['icon'] = details['icon']
             buttons[name]['image'] = collectible_collection.image
-            buttons[name]['ajax_title'] = u'{}: {}'.format(collectible_collection.add_sentence, unicode(item))
-            if collectible_collection.add_view.unique_per_owner:
-                extra_attributes['unique-per-owner'] = 'true'
-            if quick_add_to_collection:
-                extra_attributes['quick-add-to-collection'] = 'true'
-                extra_attributes['parent-item-field-name-id'] = collectible_collection.item_field_name_id
+            buttons[name]['ajax_title'] = u'{}: {}'.format(details['title'], unicode(item))
+            if details['quick_add_to_collection']:
                 extra_attributes['parent-item-id'] = item.pk
-                if collectible_collection.queryset.model.fk_as_owner:
-                    add_to_id_from_request = getattr(request, u'add_to_{}'.format(collectible_collection.name), None)
-                    if not add_to_id_from_request:
-                        quick_add_to_collection = False
-                        del(extra_attributes['quick-add-to-collection'])
-                        del(extra_attributes['parent-item-field-name-id'])
-                        del(extra_attributes['parent-item-id'])
-                    else:
-                        extra_attributes['quick-add-to-id'] = add_to_id_from_request
-                        extra_attributes['quick-add-to-fk-as-owner'] = collectible_collection.queryset.model.fk_as_owner or 'owner'
-            if show_total and collectible_collection.add_view.unique_per_owner and not quick_add_to_collection:
-                if collectible_collection.queryset.model.fk_as_owner == 'account' and buttons[name]['badge'] >= len(getAccountIdsFromSession(request)):
-                    edit_sentence = unicode(_('Edit your {thing}')).format(
-                        thing=unicode(collectible_collection.title
-                                      if len(getAccountIdsFromSession(request)) == 1
-                                      else collectible_collection.plural_title).lower())
-                    if buttons[name]['badge'] > 0:
-                        extra_attributes['alt-message'] = buttons[name]['title']
-                        buttons[name]['title'] = edit_sentence
-                    else:
-                        extra_attributes['alt-message'] = edit_sentence
-            if show_total and collectible_collection.add_view.unique_per_owner and quick_add_to_collection:
-                delete_sentence = unicode(_('Delete {thing}')).format(thing=unicode(collectible_collection.title).lower())
+            if details['edit_sentence'] and buttons[name]['badge'] >= details['total_accounts']:
                 if buttons[name]['badge'] > 0:
                     extra_attributes['alt-message'] = buttons[name]['title']
-                    buttons[name]['title'] = delete_sentence
+                    buttons[name]['title'] = details['edit_sentence']
                 else:
-                    extra_attributes['alt-message'] = delete_sentence
-            if (collectible_collection.add_view.authentication_required
-                and not collectible_collection.add_view.requires_permissions()
-                and not request.user.is_authenticated()):
+                    extra_attributes['alt-message'] = details['edit_sentence']
+            if details['delete_sentence']:
+                if buttons[name]['badge'] > 0:
+                    extra_attributes['alt-message'] = buttons[name]['title']
+                    buttons[name]['title'] = details['delete_sentence']
+                else:
+                    extra_attributes['alt-message'] = details['delete_sentence']
+            if details['signup']:
                 buttons[name]['has_permissions'] = True
                 buttons[name]['url'] = u'/signup/?next={url}&next_title={title}'.format(
-                    url=url_to_collectible_add_with_item(collectible_collection.get_add_url()),
+                    url=url_to_collectible_add_with_item(details['add_url']),
                     title=item.edit_sentence,
                 )
             else:
-                buttons[name]['has_permissions'] = collectible_collection.add_view.has_permissions(request, context)
-                buttons[name]['url'] = url_to_collectible_add_with_item(collectible_collection.get_add_url())
-                buttons[name]['ajax_url'] = url_to_collectible_add_with_item(collectible_collection.get_add_url(ajax=True))
-                if collectible_collection.add_view.staff_required and not view.staff_required:
+                buttons[name]['has_permissions'] = details['has_permissions']
+                buttons[name]['url'] = url_to_collectible_add_with_item(details['add_url'])
+                buttons[name]['ajax_url'] = url_to_collectible_add_with_item(details['ajax_add_url'])
+                if details['staff_only']:
                     buttons[name]['classes'].append('staff-only')
             buttons[name]['extra_attributes'] = extra_attributes
         # Set as background button
@@ -2301,9 +2361,26 @@ class MagiCollection(object):
         prefetched_per_line = property(lambda _s: _s.per_line)
         prefetched_page_size = property(lambda _s: _s.page_size)
 
+        # How total_results is known:
+        # - 'exact': count
+        # - 'cached': count kept in Django's cache per filters for count_cache_timeout seconds,
+        #   shown as an estimate when it comes from the cache
+        # - 'has_next_page': no count, retrieves page_size + 1 items to know if there's a next page
+        count_strategy = 'exact'
+        count_cache_timeout = 300 # seconds
+        # Fields that can be used for keyset pagination (ordering on indexed fields only):
+        # the next pages loaded with ajax start after the last item instead of an offset
+        keyset_pagination_fields = []
+        # Totals of items collected by the user (total_{}) are counted with one query for all
+        # the items of the page instead of a sub-query per item, see set_collectibles_totals
+        collectibles_totals_per_page = True
+
         ajax_item_popover = False
         hide_icons = False
         allow_random = True
+        # Pks of random items kept in memory to pick from in the random view (per filters)
+        random_pool_size = None
+        random_pool_timeout = 3600 # seconds
         as_profile_tab = False
         profile_tab_name = property(lambda _s: _s.get_page_title())
 
@@ -4432,15 +4509,18 @@ class ActivityCollection(MagiCollection):
         ('Spam activity', 'This activity has been detected as spam. We do not tolerate such behavior and kindly ask you not to re-iterate your actions or your entire profile might get deleted next time.'),
     ])
 
-    def _get_queryset_for_list_and_item(self, queryset, request=None):
-        if request and request.user.is_authenticated():
-            queryset = queryset.extra(select={
-                'liked': 'SELECT COUNT(*) FROM {activity_table_name}_likes WHERE activity_id = {activity_table_name}.id AND user_id = {user_id}'.format(
-                    activity_table_name=models.Activity._meta.db_table,
-                    user_id=request.user.id,
-                ),
-            })
-        return queryset
+    def _set_liked(self, request, activities):
+        """
+        Sets liked in the activities of the page, with one query for all of them.
+        """
+        liked = set()
+        if activities and request.user.is_authenticated():
+            liked = set(models.Activity.likes.through.objects.filter(
+                user_id=request.user.id,
+                activity_id__in=[activity.pk for activity in activities],
+            ).values_list('activity_id', flat=True))
+        for activity in activities:
+            activity.liked = activity.pk in liked
 
     filter_cuteform = {
         'i_language': {
@@ -4568,12 +4648,16 @@ class ActivityCollection(MagiCollection):
         }
         context['js_variables']['site_url'] = context['site_url']
         context['buttons_classes'] = u' '.join(view.get_item_buttons_classes(request, context, item=item))
+        self._set_liked(request, [item] if item else context.get('items', []))
 
     class ListView(MagiCollection.ListView):
         item_template = custom_item_template
         header_template = None
         per_line = 1
         distinct = False
+        # The feed only needs to know if there are more activities to load
+        count_strategy = 'has_next_page'
+        keyset_pagination_fields = ['last_bump', 'creation', '_cache_total_likes']
         add_button_subtitle = _('Share your adventures!')
         ajax_pagination_callback = 'updateActivities'
         before_template = 'include/homePage'
@@ -4599,12 +4683,12 @@ class ActivityCollection(MagiCollection):
         def get_queryset(self, queryset=None, parameters={}, request=None):
             queryset = super(ActivityCollection.ListView, self).get_queryset(
                 queryset=queryset, parameters=parameters, request=request)
-            queryset = self.collection._get_queryset_for_list_and_item(queryset, request=request)
             # Exclude hidden tags
             if request and request.user.is_authenticated() and request.user.preferences.hidden_tags:
-                for tag, hidden in request.user.preferences.hidden_tags.items():
-                    if hidden:
-                        queryset = queryset.exclude(c_tags__contains=u'"{}"'.format(tag))
+                queryset = models.excludeActivitiesWithTags(queryset, [
+                    tag for tag, hidden in request.user.preferences.hidden_tags.items()
+                    if hidden
+                ])
             else:
                 queryset = queryset.exclude(_cache_hidden_by_default=True)
             # Get who archived if staff
@@ -4680,11 +4764,6 @@ class ActivityCollection(MagiCollection):
         def item_buttons_classes(self):
             return [cls for cls in super(ActivityCollection.ItemView, self).item_buttons_classes if cls != 'btn-secondary'] + ['btn-link']
 
-        def get_queryset(self, queryset=None, parameters={}, request=None):
-            queryset = super(ActivityCollection.ItemView, self).get_queryset(
-                queryset=queryset, parameters=parameters, request=request)
-            return self.collection._get_queryset_for_list_and_item(queryset=queryset, request=request)
-
         def get_h1_title(self, *args, **kwargs):
             title_prefixes, h1 = super(ActivityCollection.ItemView, self).get_h1_title(*args, **kwargs)
             h1['title'] = _('Activity')
@@ -221,7 +221,10 @@ class MagiDisplay(object):
         )
 
     def to_kwargs_parameters(self, item, value, strict_parameters=True, **kwargs):
-        valid_parameters = self.valid_parameters + self.to_kwargs_parameters_from_parameters_display_classes(kwargs)
+        valid_parameters = (
+            self.get_compiled_templates()['valid_parameters']
+            + self.to_kwargs_parameters_from_parameters_display_classes(kwargs)
+        )
         kwargs_parameters = {}
         for parameter_name, parameter_value in kwargs.items():
             if strict_parameters and parameter_name not in valid_parameters:
@@ -264,8 +267,9 @@ class MagiDisplay(object):
 
     def to_parameters(self, item, value, kwargs_parameters):
         parameters = AttrDict()
+        dont_call_callable_parameters_for = self.get_compiled_templates()['dont_call_callable_parameters_for']
         for parameter_name, kwargs_value in kwargs_parameters.items():
-            if (parameter_name not in self.get_dont_call_callable_parameters_for
+            if (parameter_name not in dont_call_callable_parameters_for
                 and callable(kwargs_value)
                 and not failSafe(lambda: issubclass(kwargs_value, object), exceptions=[TypeError])):
                 setattr(parameters, parameter_name, kwargs_value(item))
@@ -299,14 +303,15 @@ class MagiDisplay(object):
     def get_parameter_template(self, parameter_name, parameter_value, parameters, parameters_templates, template_name=u'template_{}'):
         if not hasValue(parameter_value, false_bool_is_value=False):
             parameter_template = u''
-        elif getattr(self, template_name.format(parameter_name), None):
-            parameter_template = getattr(self, template_name.format(parameter_name))
         else:
-            parameter_template = u'{{{}}}'.format(parameter_name)
+            parameter_template = (
+                self.get_template_attribute(template_name.format(parameter_name))
+                or u'{{{}}}'.format(parameter_name)
+            )
         if callable(parameter_template):
             parameter_template = parameter_template(parameters)
         if (isinstance(parameter_value, dict)
-            and not getattr(self, u'template_{}_foreach'.format(parameter_name), None)):
+            and not self.get_template_attribute(u'template_{}_foreach'.format(parameter_name))):
             for key in templateVariables(parameter_template):
                 if key in parameter_value:
                     parameters_templates[key] = u'{{{}}}'.format(key)
@@ -323,12 +328,18 @@ class MagiDisplay(object):
         # }
         list_or_dict_parameters_keys = []
         parameters_templates = {}
+        used_parameters = self.get_compiled_templates()['used_parameters']
         for parameter_name, parameter_value in parameters.items():
-            parameters_templates[parameter_name] = self.get_parameter_template(
-                parameter_name, parameter_value, parameters, parameters_templates)
-            if (hasValue(parameter_value, false_bool_is_value=False)
-                and (isinstance(parameter_value, list) or isinstance(parameter_value, dict))
-                and getattr(self, u'template_{}_foreach'.format(parameter_name), None)):
+            is_list_or_dict = isinstance(parameter_value, list) or isinstance(parameter_value, dict)
+            if (used_parameters is None
+                or parameter_name in used_parameters
+                # Dicts may add their keys to the parameters
+                or isinstance(parameter_value, dict)):
+                parameters_templates[parameter_name] = self.get_parameter_template(
+                    parameter_name, parameter_value, parameters, parameters_templates)
+            if (is_list_or_dict
+                and hasValue(parameter_value, false_bool_is_value=False)
+                and self.get_template_attribute(u'template_{}_foreach'.format(parameter_name))):
                 list_or_dict_parameters_keys.append(parameter_name)
 
         # Step 2: retrieve templates for each parameter
@@ -365,8 +376,14 @@ class MagiDisplay(object):
         return html
 
     def html_for_list_or_dict(self, parameter_name, parameter_value, parameters_templates, parameters):
-        separator = getattr(self, u'template_{}_separator'.format(parameter_name), u' ')
-        foreach_template = getattr(self, u'template_{}_foreach'.format(parameter_name))
+        separator = self.get_template_attribute(u'template_{}_separator'.format(parameter_name))
+        if separator is None:
+            separator = u' '
+        foreach_template = self.get_template_attribute(u'template_{}_foreach'.format(parameter_name))
+        to_foreach_value = self.get_template_attribute(u'to_{}_foreach_value'.format(parameter_name))
+        to_foreach_parameters_extra = self.get_template_attribute(
+            u'to_{}_foreach_parameters_extra'.format(parameter_name))
+        template_name = u'template_{}_{{}}'.format(parameter_name) if parameter_name != 'display_value' else u'template_{}'
         html_items = []
         for i, list_item in enumerate(parameter_value.items() if isinstance(parameter_value, dict) else parameter_value):
             # Prepare parameters per item:
@@ -379,13 +396,12 @@ class MagiDisplay(object):
                 parameters_per_item.key = None
                 parameters_per_item.value = list_item
             # If there's a to_{}_foreach_value set, apply to value
-            if getattr(self, u'to_{}_foreach_value'.format(parameter_name), None):
-                parameters_per_item['value'] = getattr(self, u'to_{}_foreach_value'.format(parameter_name))(parameters_per_item)
+            if to_foreach_value:
+                parameters_per_item['value'] = to_foreach_value(parameters_per_item)
             # If there's a to_{}_foreach_parameters_extra set
             extra_parameters_per_item = {}
-            if getattr(self, u'to_{}_foreach_parameters_extra'.format(parameter_name), None):
-                extra_parameters_per_item = getattr(
-                    self, u'to_{}_foreach_parameters_extra'.format(parameter_name))(parameters_per_item)
+            if to_foreach_parameters_extra:
+                extra_parameters_per_item = to_foreach_parameters_extra(parameters_per_item)
                 parameters_per_item.update(extra_parameters_per_item)
             # Prepare parameters templates
             parameters_templates_per_item = parameters_templates.copy()
@@ -393,7 +409,7 @@ class MagiDisplay(object):
                 parameters_templates_per_item[added_parameter_name] = self.get_parameter_template(
                     added_parameter_name, parameters_per_item[added_parameter_name],
                     parameters_per_item, parameters_templates_per_item,
-                    template_name=u'template_{}_{{}}'.format(parameter_name) if parameter_name != 'display_value' else u'template_{}',
+                    template_name=template_name,
                 )
             # Prepare template
             template_per_item = self.prepare_template(
@@ -407,6 +423,55 @@ class MagiDisplay(object):
         # Join all rendered HTML into 1
         return markSafeJoin(html_items, separator=separator)
 
+    ############################################################
+    # Compiled templates
+    # What only depends on the display class gets determined once, on first render,
+    # then re-used for all the items. If you change templates or parameters of a display
+    # class after it has been used, call reset_compiled_templates.
+
+    MAX_COMPILED_ATTRIBUTES = 1000
+
+    def get_compiled_templates(self):
+        try:
+            return self.__dict__['_compiled_templates']
+        except KeyError:
+            pass
+        compiled = {
+            'valid_parameters': self.valid_parameters,
+            'dont_call_callable_parameters_for': set(self.get_dont_call_callable_parameters_for),
+            # { attribute name: attribute or None }
+            'attributes': {},
+            # None when it can't be determined in advance (= all parameters)
+            'used_parameters': None,
+        }
+        self.__dict__['_compiled_templates'] = compiled
+        # Parameters templates are only used when their parameter is in the main template
+        # or in a foreach template
+        templates = [ self.template ] + [
+            getattr(self, attribute_name) for attribute_name in dir(self)
+            if attribute_name.startswith('template_') and attribute_name.endswith('_foreach')
+        ]
+        if not any(callable(template) for template in templates):
+            compiled['used_parameters'] = set([
+                variable
+                for template in templates if template
+                for variable in templateVariables(template)
+            ])
+        return compiled
+
+    def reset_compiled_templates(self):
+        self.__dict__.pop('_compiled_templates', None)
+
+    def get_template_attribute(self, attribute_name):
+        attributes = self.get_compiled_templates()['attributes']
+        try:
+            return attributes[attribute_name]
+        except KeyError:
+            attribute = getattr(self, attribute_name, None)
+            if len(attributes) < self.MAX_COMPILED_ATTRIBUTES:
+                attributes[attribute_name] = attribute
+            return attribute
+
     ############################################################
     # Tools
 
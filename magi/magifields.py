@@ -125,6 +125,9 @@ PERMISSION_ITEM_OPTIONS = {
 ############################################################
 # MagiField
 
+# { option name: key } See MagiField.item_option_to_key
+_item_option_keys = {}
+
 class MagiField(object):
     """
     Fields are auto-determined using is_field, which is a required class method.
@@ -881,11 +884,15 @@ class MagiField(object):
 
     @classmethod
     def item_option_to_key(self, option_name):
-        return (
-            (option_name[3:] if option_name.startswith('{}_') else None)
-            or (option_name[:-3] if option_name.endswith('_{}') else None)
-            or option_name.replace('_{}_', '_')
-        )
+        # Called for each option of each field of each item, so it's only computed once
+        key = _item_option_keys.get(option_name, None)
+        if key is None:
+            key = _item_option_keys[option_name] = (
+                (option_name[3:] if option_name.startswith('{}_') else None)
+                or (option_name[:-3] if option_name.endswith('_{}') else None)
+                or option_name.replace('_{}_', '_')
+            )
+        return key
 
     @classmethod
     def item_option_to_kwarg(self, option_name):
@@ -3983,6 +3990,10 @@ class MagiButtonField(MagiField):
 ############################################################
 # MagiFields
 
+# { (MagiFields class, model, collection name, view, extra fields, options): plan }
+# See MagiFields.cache_unbound_fields
+_unbound_fields_plans = {}
+
 class MagiFields(object):
     ############################################################
     # Optional variables
@@ -4001,6 +4012,11 @@ class MagiFields(object):
     preselected_subfields = {}
     # If a foreign key has been preselected, the following sub-fields can be displayed
 
+    cache_unbound_fields = True
+    # Which classes are used for which fields, which fields are excluded and their order only
+    # get determined once per collection, view and options, then are re-used for the next items.
+    # Set to False if they depend on the item (in prepare_extra_fields, is_field, etc).
+
     ############################################################
     # Optional variables than can also be given to __init__
 
@@ -4271,11 +4287,22 @@ class MagiFields(object):
         self.fields = OrderedDict()
         self.fields_per_category = OrderedDict()
 
-        self.set_model_fields()
-        self.set_related_fields()
-        self.set_extra_fields()
-        self.set_missing_fields()
-        self.set_share_templates_fields()
+        self._plan = self._get_unbound_fields_plan()
+        if self._plan and self._plan['fields'] is not None:
+            self._set_fields_from_plan()
+        else:
+            self._recorded_fields = [] if self._plan else None
+            self.set_model_fields()
+            self.set_related_fields()
+            self.set_extra_fields()
+            self.set_missing_fields()
+            self.set_share_templates_fields()
+            if self._plan:
+                self._plan['skipped'] = self.skipped[:]
+                self._plan['excluded'] = self.excluded[:]
+                self._plan['found_preselected_subfields'] = getattr(self, '_found_preselected_subfields', {})
+                self._plan['fields'] = self._recorded_fields
+            self._recorded_fields = None
         if self.item: # Buttons may be set again on bound
             self.set_button_fields()
 
@@ -4292,17 +4319,27 @@ class MagiFields(object):
                 or self.options.fields_order_settings # In view
                 or (self.options.get_fields_order and self.item) # In view
         ):
+            order = (
+                (self.options.order or [])
+                + (self.options.fields_order or [])
+                + (self.options.get_fields_order(self.item)
+                   if self.item and self.options.get_fields_order else [])
+            )
+            order_key = (tuple(self.fields.keys()), tuple(order))
+            ordered_field_names = self._plan['orders'].get(order_key, None) if self._plan else None
+            if ordered_field_names is not None:
+                self.fields = OrderedDict([
+                    (field_name, self.fields[field_name]) for field_name in ordered_field_names
+                ])
+                return
             self.fields = newOrder(
                 self.fields,
-                order=(
-                    (self.options.order or [])
-                    + (self.options.fields_order or [])
-                    + (self.options.get_fields_order(self.item)
-                       if self.item and self.options.get_fields_order else [])
-                ),
+                order=order,
                 insert_in_dict_when_missing=False,
                 **mergeDicts(self.order_settings, self.options.fields_order_settings)
             )
+            if self._plan:
+                self._plan['orders'][order_key] = self.fields.keys()
 
     def set_unbound_field(
             self, type, field_name, cls=None,
@@ -4332,22 +4369,14 @@ class MagiFields(object):
                     break
 
         if cls:
-            # The class can already have been instanciated, or not
-            if isinstance(cls, MagiField):
-                kwargs_for_init = mergeDicts(cls.fields_kwargs, kwargs_for_init_only)
-                field = type_f(cls)(**kwargs_for_init)
-            else:
-                field = cls(**kwargs_for_init_only)
-            field.init_unbound_field(magifields=self, **kwargs)
-
+            field = self._init_unbound_field(cls, kwargs_for_init_only, kwargs)
             if field:
                 if self._should_exclude_field(field_name, field):
                     self.excluded.append(field_name)
                 else:
-                    self.fields[field_name] = field
-                    if type not in self.fields_per_category:
-                        self.fields_per_category[type] = OrderedDict()
-                    self.fields_per_category[type][field_name] = field
+                    self._add_unbound_field(type, field_name, field)
+                    if self._recorded_fields is not None and type != 'BUTTON':
+                        self._recorded_fields.append((type, field_name, cls, kwargs_for_init_only, kwargs))
 
     ############################################################
     # Model fields
@@ -4684,6 +4713,49 @@ class MagiFields(object):
     # Internal
 
     # Called before bound, when setting fields
+    _plan = None
+    _recorded_fields = None
+
+    def _init_unbound_field(self, cls, kwargs_for_init_only, kwargs):
+        # The class can already have been instanciated, or not
+        if isinstance(cls, MagiField):
+            kwargs_for_init = mergeDicts(cls.fields_kwargs, kwargs_for_init_only)
+            field = type_f(cls)(**kwargs_for_init)
+        else:
+            field = cls(**kwargs_for_init_only)
+        field.init_unbound_field(magifields=self, **kwargs)
+        return field
+
+    def _add_unbound_field(self, type, field_name, field):
+        self.fields[field_name] = field
+        if type not in self.fields_per_category:
+            self.fields_per_category[type] = OrderedDict()
+        self.fields_per_category[type][field_name] = field
+
+    def _get_unbound_fields_plan(self):
+        """
+        Returns the plan shared by all the MagiFields of the same class, collection, view and options,
+        or None when cache_unbound_fields is False.
+        """
+        if not self.cache_unbound_fields:
+            return None
+        key = (
+            type(self), self.model, self.collection.name, self.view.view,
+            tuple(self.EXTRA_FIELDS.keys()),
+            repr(sorted(self.options.items())),
+        )
+        plan = _unbound_fields_plans.get(key, None)
+        if plan is None:
+            plan = _unbound_fields_plans[key] = { 'fields': None, 'orders': {} }
+        return plan
+
+    def _set_fields_from_plan(self):
+        self.skipped = self._plan['skipped'][:]
+        self.excluded = self._plan['excluded'][:]
+        self._found_preselected_subfields = self._plan['found_preselected_subfields']
+        for type, field_name, cls, kwargs_for_init_only, kwargs in self._plan['fields']:
+            self._add_unbound_field(type, field_name, self._init_unbound_field(cls, kwargs_for_init_only, kwargs))
+
     def _should_exclude_field(self, field_name, field):
         field_name_options = [ field_name, field.to_field_name(field_name) ]
         # Options: self.exclude_fields or self.options.fields_exclude
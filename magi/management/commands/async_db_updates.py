@@ -1,14 +1,18 @@
 # -*- coding: utf-8 -*-
-import inspect, datetime, requests
+import inspect, datetime, requests, time
+from collections import OrderedDict
+from optparse import make_option
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings as django_settings
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
 from magi import urls # Unused, ensures RAW_CONTEXT to be filled
-from magi.item_model import BaseMagiModel
+from magi.item_model import BaseMagiModel, is_async_update_pending, RELATED_CACHE_ASYNC_UPDATE_PREFIX
 from magi.models import uploadItem
 from magi.utils import (
     modelHasField,
+    listUnique,
     shrinkImageFromData,
     dataToImageFile,
     imageThumbnailFromData,
@@ -17,80 +21,183 @@ from magi.utils import (
 )
 from magi import models as magi_models
 
-def get_next_item(model, field, modified_field_name, boolean_on_change=None):
-    try:
-        queryset = model.objects.all()
+############################################################
+# External services
+# Can be replaced with local stubs (ex: in tests)
 
-        global specified_pks
-        if specified_pks:
-            queryset = queryset.filter(pk__in=specified_pks)
-
-        if boolean_on_change is not None:
-            # Field (boolean) = boolean_on_change
-            # Modified field = NOT NULL
-            queryset = queryset.filter(**{
-                field.name: boolean_on_change,
-            }).exclude(
-                Q(**{ u'{}__isnull'.format(modified_field_name): True })
-                | Q(**{ modified_field_name: '' })
-            )
-        else:
-            # Field = NOT NULL
-            # Modified field = NULL
-            queryset = queryset.exclude(
-                Q(**{ u'{}__isnull'.format(field.name): True })
-                | Q(**{ field.name: '' })
-            ).filter(
-                Q(**{ u'{}__isnull'.format(modified_field_name): True })
-                | Q(**{ modified_field_name: '' })
-            )
+GITHUB_MARKDOWN_API_URL = u'https://api.github.com/markdown/raw'
+
+def markdown_to_html(markdown):
+    headers = {
+        'content-type': u'text/plain',
+    }
+    if getattr(django_settings, 'GITHUB_API_TOKEN', None):
+        headers['Authorization'] = u'token {}'.format(django_settings.GITHUB_API_TOKEN)
+    r = requests.post(
+        GITHUB_MARKDOWN_API_URL,
+        data=markdown.encode('utf-8'),
+        headers=headers,
+    )
+    r.raise_for_status()
+    return r.text
+
+def shrink_image(data, filename, settings={}):
+    """
+    Optimize images with TinyPNG, returns the data of the optimized image
+    """
+    return shrinkImageFromData(data, filename, settings=settings, return_data=True)[0]
 
-        return queryset[0]
+############################################################
+# Get items to update
 
-    except IndexError:
-        return False
+def get_next_items(model, field, modified_field_name, boolean_on_change=None, limit=1, exclude_pks=None):
+    queryset = model.objects.all()
+
+    global specified_pks
+    if specified_pks:
+        queryset = queryset.filter(pk__in=specified_pks)
+    if exclude_pks:
+        queryset = queryset.exclude(pk__in=exclude_pks)
+
+    if boolean_on_change is not None:
+        # Field (boolean) = boolean_on_change
+        # Modified field = NOT NULL
+        queryset = queryset.filter(**{
+            field.name: boolean_on_change,
+        }).exclude(
+            Q(**{ u'{}__isnull'.format(modified_field_name): True })
+            | Q(**{ modified_field_name: '' })
+        )
+    else:
+        # Field = NOT NULL
+        # Modified field = NULL
+        queryset = queryset.exclude(
+            Q(**{ u'{}__isnull'.format(field.name): True })
+            | Q(**{ field.name: '' })
+        ).filter(
+            Q(**{ u'{}__isnull'.format(modified_field_name): True })
+            | Q(**{ modified_field_name: '' })
+        )
+
+    return list(queryset[:limit])
+
+def get_next_item(model, field, modified_field_name, boolean_on_change=None):
+    items = get_next_items(model, field, modified_field_name, boolean_on_change=boolean_on_change)
+    return items[0] if items else False
 
 def save_item(model, item, updated_fields, in_item=False):
+    for k, v in updated_fields.items():
+        setattr(item, k, v)
     if in_item:
-        for k, v in updated_fields.items():
-            setattr(item, k, v)
         item.save()
     else:
         model.objects.filter(pk=item.pk).update(**updated_fields)
     item.update_all_related_caches()
 
-# All callbacks return True or False whether or not they did something
-# When the first callback does something, the script stops
+############################################################
+# Process items
+# Each update is done in 3 steps:
+# - prepare(model, field, item): reads what's needed from the item, returns None if there's nothing to process
+# - process(prepared): does the actual work (resizing, calls to external services...)
+#   Only gets and returns serializable values, so it can run in a thread or a process.
+# - save(model, field, item, prepared, result): saves the result in the database
 
-def update_image(model, field):
-    if field.name.startswith('_'):
-        return False
-    tinypng_api_key = getattr(django_settings, 'TINYPNG_API_KEY', None)
-    if tinypng_api_key and modelHasField(model, u'_original_{}'.format(field.name)):
-        if tinypng_compress(model, field):
-            return True
-    if tinypng_api_key and modelHasField(model, u'_tthumbnail_{}'.format(field.name)):
-        if tinypng_thumbnail(model, field):
-            return True
-    if modelHasField(model, u'_thumbnail_{}'.format(field.name)):
-        if thumbnail(model, field):
-            return True
-    return False
-    if modelHasField(model, u'_2x_{}'.format(field.name)):
-        if thumbnail(model, field):
-            return True
-        print 'todo generate a 2x version with waifux2'
-        return True
-    return False
+def process_items(model, field, items, prepare, process, save, pool=None, fail_silently=True):
+    """
+    When a pool is provided (ThreadPoolExecutor or ProcessPoolExecutor), items are processed in parallel.
+    Prepare and save are always called from the current thread.
+    Returns the list of items that were updated and the list of pks of the items that failed.
+    """
+    to_process, failed_pks = [], []
+    for item in items:
+        try:
+            prepared = prepare(model, field, item)
+        except Exception, e:
+            if not fail_silently:
+                raise
+            print u'[Error] Preparing {} #{}: {}'.format(model.__name__, item.pk, e)
+            failed_pks.append(item.pk)
+            continue
+        if prepared is not None:
+            to_process.append((item, prepared))
+    if pool and process:
+        futures = [(item, prepared, pool.submit(process, prepared)) for item, prepared in to_process]
+    else:
+        futures = [(item, prepared, None) for item, prepared in to_process]
+    processed = []
+    for item, prepared, future in futures:
+        try:
+            if future:
+                result = future.result()
+            elif process:
+                result = process(prepared)
+            else:
+                result = prepared
+        except Exception, e:
+            if not fail_silently:
+                raise
+            print u'[Error] Processing {} #{}: {}'.format(model.__name__, item.pk, e)
+            failed_pks.append(item.pk)
+            continue
+        processed.append((item, prepared, result))
+    updated = []
+    with transaction.atomic():
+        for item, prepared, result in processed:
+            # Savepoint per item: an item that fails to save doesn't cancel the others
+            try:
+                with transaction.atomic():
+                    saved = save(model, field, item, prepared, result)
+            except Exception, e:
+                if not fail_silently:
+                    raise
+                print u'[Error] Saving {} #{}: {}'.format(model.__name__, item.pk, e)
+                failed_pks.append(item.pk)
+                continue
+            if saved is False:
+                failed_pks.append(item.pk)
+            else:
+                updated.append(item)
+    return updated, failed_pks
 
-def tinypng_compress(model, field):
-    original_field_name = u'_original_{}'.format(field.name)
-    item = get_next_item(model, field, original_field_name)
+def process_next_item(model, field, modified_field_name, prepare, process, save, boolean_on_change=None):
+    item = get_next_item(model, field, modified_field_name, boolean_on_change=boolean_on_change)
     if not item:
         return False
+    updated, _failed_pks = process_items(model, field, [item], prepare, process, save, fail_silently=False)
+    if updated:
+        print '[Info] Done.'
+    return True
+
+############################################################
+# Images
+
+def _image_name(item, field, folder):
+    filename = getattr(item, field.name).name
+    prefix = field.upload_to.prefix + (folder if field.upload_to.prefix.endswith('/') else '/' + folder)
+    return uploadItem(prefix)(item, filename)
+
+def _read_image(model, item, field, modified_field_name):
+    value = getattr(item, field.name)
+    content = value.read()
+    if not content:
+        save_item(model, item, { modified_field_name: unicode(value) })
+        print '[Warning] Empty file, discarded.'
+        return None
+    return content
+
+def _save_image(model, field, item, image_field_name, data, image_name, updated_fields={}):
+    image = dataToImageFile(data)
+    image.name = image_name
+    updated_fields = updated_fields.copy()
+    updated_fields[image_field_name] = image
+    save_item(model, item, updated_fields, in_item=True)
+
+# TinyPNG compress
+
+def tinypng_compress_prepare(model, field, item):
+    original_field_name = u'_original_{}'.format(field.name)
     settings = getattr(item, 'tinypng_settings', {}).get(field.name, {})
-    use_tinypng = settings.get('use_tinypng', True)
-    if use_tinypng:
+    if settings.get('use_tinypng', True):
         print '[Info] Compressing on TinyPNG {} for {} #{}...'.format(
             field.name, model.__name__, item.pk
         )
@@ -98,55 +205,56 @@ def tinypng_compress(model, field):
         print '[Info] Resizing {} for {} #{}...'.format(
             field.name, model.__name__, item.pk
         )
-    value = getattr(item, field.name)
-    filename = value.name
-    prefix = field.upload_to.prefix + ('tiny' if field.upload_to.prefix.endswith('/') else '/tiny')
-    image_name = uploadItem(prefix)(item, filename)
-    content = value.read()
-    if not content:
-        save_item(model, item, { original_field_name: unicode(value) })
-        print '[Warning] Empty file, discarded.'
-        return True
-    if use_tinypng or image_name.endswith('.gif'):
-        image = shrinkImageFromData(content, filename, settings=settings)
-    else:
-        resize = settings.get('resize', 'thumb')
-        if resize in ['thumb', 'cover'] and 'width' in settings:
-            image = imageSquareThumbnailFromData(content, image_name, size=settings['width'])
-        elif resize == 'fit' and 'width' in settings and 'height' in settings:
-            image = imageThumbnailFromData(
-                content, image_name, width=settings['width'], height=settings['height'])
-        elif resize == 'scale':
-            image = imageResizeScaleFromData(
-                content, image_name, width=settings.get('width', None), height=settings.get('height', None))
-        else:
-            # Else: don't modify image
-            image = dataToImageFile(content)
-    image.name = image_name
-    save_item(model, item, {
-        original_field_name: unicode(value),
-        field.name: image,
-    }, in_item=True)
-    print '[Info] Done.'
-    return True
+    content = _read_image(model, item, field, original_field_name)
+    if content is None:
+        return None
+    return {
+        'content': content,
+        'filename': getattr(item, field.name).name,
+        'image_name': _image_name(item, field, 'tiny'),
+        'original': unicode(getattr(item, field.name)),
+        'settings': settings,
+    }
 
-def tinypng_thumbnail(model, field):
+def tinypng_compress_process(prepared):
+    content, filename, image_name, settings = (
+        prepared['content'], prepared['filename'], prepared['image_name'], prepared['settings'])
+    if settings.get('use_tinypng', True) or image_name.endswith('.gif'):
+        return shrink_image(content, filename, settings=settings)
+    resize = settings.get('resize', 'thumb')
+    if resize in ['thumb', 'cover'] and 'width' in settings:
+        return imageSquareThumbnailFromData(content, image_name, size=settings['width'], return_data=True)[0]
+    elif resize == 'fit' and 'width' in settings and 'height' in settings:
+        return imageThumbnailFromData(
+            content, image_name, width=settings['width'], height=settings['height'], return_data=True)[0]
+    elif resize == 'scale':
+        return imageResizeScaleFromData(
+            content, image_name, width=settings.get('width', None), height=settings.get('height', None),
+            return_data=True)[0]
+    # Else: don't modify image
+    return content
+
+def tinypng_compress_save(model, field, item, prepared, data):
+    _save_image(model, field, item, field.name, data, prepared['image_name'], updated_fields={
+        u'_original_{}'.format(field.name): prepared['original'],
+    })
+
+def tinypng_compress(model, field):
+    return process_next_item(
+        model, field, u'_original_{}'.format(field.name),
+        tinypng_compress_prepare, tinypng_compress_process, tinypng_compress_save,
+    )
+
+# TinyPNG thumbnail
+
+def tinypng_thumbnail_prepare(model, field, item):
     thumbnail_field_name = u'_tthumbnail_{}'.format(field.name)
-    item = get_next_item(model, field, thumbnail_field_name)
-    if not item:
-        return False
     print '[Info] Generating thumbnail with TinyPNG {} for {} #{}...'.format(
         field.name, model.__name__, item.pk,
     )
-    value = getattr(item, field.name)
-    filename = value.name
-    prefix = field.upload_to.prefix + ('thumb' if field.upload_to.prefix.endswith('/') else '/thumb')
-    image_name = uploadItem(prefix)(item, filename)
-    content = value.read()
-    if not content:
-        save_item(model, item, { thumbnail_field_name: unicode(value) })
-        print '[Warning] Empty file, discarded.'
-        return True
+    content = _read_image(model, item, field, thumbnail_field_name)
+    if content is None:
+        return None
     tinypng_settings = getattr(item, 'tinypng_settings', {}).get(thumbnail_field_name, {}).copy()
     for k, v in [
             ('resize', 'thumb'),
@@ -155,114 +263,366 @@ def tinypng_thumbnail(model, field):
     ]:
         if k not in tinypng_settings:
             tinypng_settings[k] = v
-    image = shrinkImageFromData(content, image_name, settings=tinypng_settings)
-    image.name = image_name
-    save_item(model, item, { thumbnail_field_name: image }, in_item=True)
-    print '[Info] Done.'
-    return True
+    return {
+        'content': content,
+        'image_name': _image_name(item, field, 'thumb'),
+        'settings': tinypng_settings,
+    }
 
-def thumbnail(model, field):
-    thumbnail_field_name = u'_thumbnail_{}'.format(field.name)
-    item = get_next_item(model, field, thumbnail_field_name)
-    if not item:
-        return False
+def tinypng_thumbnail_process(prepared):
+    return shrink_image(prepared['content'], prepared['image_name'], settings=prepared['settings'])
+
+def tinypng_thumbnail_save(model, field, item, prepared, data):
+    _save_image(model, field, item, u'_tthumbnail_{}'.format(field.name), data, prepared['image_name'])
+
+def tinypng_thumbnail(model, field):
+    return process_next_item(
+        model, field, u'_tthumbnail_{}'.format(field.name),
+        tinypng_thumbnail_prepare, tinypng_thumbnail_process, tinypng_thumbnail_save,
+    )
+
+# Thumbnail
+
+def thumbnail_prepare(model, field, item):
     print '[Info] Generating a thumbnail {} for {} #{}...'.format(
         field.name, model.__name__, item.pk,
     )
-    value = getattr(item, field.name)
-    filename = value.name
-    prefix = field.upload_to.prefix + ('thumb' if field.upload_to.prefix.endswith('/') else '/thumb')
-    image_name = uploadItem(prefix)(item, filename)
-    content = value.read()
-    if not content:
-        save_item(model, item, { thumbnail_field_name: unicode(value) })
-        print '[Warning] Empty file, discarded.'
-        return True
-    thumbnail_size = getattr(model, 'thumbnail_size', {}).get(field.name, {}).copy()
+    content = _read_image(model, item, field, u'_thumbnail_{}'.format(field.name))
+    if content is None:
+        return None
+    return {
+        'content': content,
+        'image_name': _image_name(item, field, 'thumb'),
+        'thumbnail_size': getattr(model, 'thumbnail_size', {}).get(field.name, {}).copy(),
+    }
+
+def thumbnail_process(prepared):
+    content, image_name, thumbnail_size = (
+        prepared['content'], prepared['image_name'], prepared['thumbnail_size'])
     resize = thumbnail_size.get('resize', 'thumb')
     if resize in ['thumb', 'cover']:
-        image = imageSquareThumbnailFromData(content, image_name, size=thumbnail_size.get('width', 200))
+        return imageSquareThumbnailFromData(
+            content, image_name, size=thumbnail_size.get('width', 200), return_data=True)[0]
     elif resize == 'fit':
-        image = imageThumbnailFromData(
-            content, image_name, width=thumbnail_size.get('width', 200), height=thumbnail_size.get('height', 200))
+        return imageThumbnailFromData(
+            content, image_name, width=thumbnail_size.get('width', 200),
+            height=thumbnail_size.get('height', 200), return_data=True)[0]
     elif resize == 'scale':
-        image = imageResizeScaleFromData(
-            content, image_name, width=thumbnail_size.get('width', 200), height=thumbnail_size.get('height', 200))
-    image.name = image_name
-    save_item(model, item, { thumbnail_field_name: image }, in_item=True)
-    print '[Info] Done.'
-    return True
+        return imageResizeScaleFromData(
+            content, image_name, width=thumbnail_size.get('width', 200),
+            height=thumbnail_size.get('height', 200), return_data=True)[0]
+    raise ValueError(u'Unknown thumbnail resize type: {}'.format(resize))
+
+def thumbnail_save(model, field, item, prepared, data):
+    _save_image(model, field, item, u'_thumbnail_{}'.format(field.name), data, prepared['image_name'])
+
+def thumbnail(model, field):
+    return process_next_item(
+        model, field, u'_thumbnail_{}'.format(field.name),
+        thumbnail_prepare, thumbnail_process, thumbnail_save,
+    )
+
+# All callbacks return True or False whether or not they did something
+# When the first callback does something, the script stops
+
+def update_image(model, field):
+    if field.name.startswith('_'):
+        return False
+    tinypng_api_key = getattr(django_settings, 'TINYPNG_API_KEY', None)
+    if tinypng_api_key and modelHasField(model, u'_original_{}'.format(field.name)):
+        if tinypng_compress(model, field):
+            return True
+    if tinypng_api_key and modelHasField(model, u'_tthumbnail_{}'.format(field.name)):
+        if tinypng_thumbnail(model, field):
+            return True
+    if modelHasField(model, u'_thumbnail_{}'.format(field.name)):
+        if thumbnail(model, field):
+            return True
+    return False
+    if modelHasField(model, u'_2x_{}'.format(field.name)):
+        if thumbnail(model, field):
+            return True
+        print 'todo generate a 2x version with waifux2'
+        return True
+    return False
+
+def get_image_updates(model, field):
+    if field.name.startswith('_'):
+        return []
+    updates = []
+    tinypng_api_key = getattr(django_settings, 'TINYPNG_API_KEY', None)
+    if tinypng_api_key and modelHasField(model, u'_original_{}'.format(field.name)):
+        updates.append((u'_original_{}'.format(field.name), None,
+                        tinypng_compress_prepare, tinypng_compress_process, tinypng_compress_save))
+    if tinypng_api_key and modelHasField(model, u'_tthumbnail_{}'.format(field.name)):
+        updates.append((u'_tthumbnail_{}'.format(field.name), None,
+                        tinypng_thumbnail_prepare, tinypng_thumbnail_process, tinypng_thumbnail_save))
+    if modelHasField(model, u'_thumbnail_{}'.format(field.name)):
+        updates.append((u'_thumbnail_{}'.format(field.name), None,
+                        thumbnail_prepare, thumbnail_process, thumbnail_save))
+    return updates
+
+############################################################
+# Markdown
+
+def markdown_prepare(model, field, item):
+    print u'[Info] Updating markdown {} for {} #{}...'.format(field.name, model.__name__, item.pk)
+    return getattr(item, field.name)
+
+def markdown_save(model, field, item, prepared, html):
+    save_item(model, item, {
+        u'_cache_{}'.format(field.name[2:]): html,
+    })
 
 def update_markdown(model, field):
     if modelHasField(model, u'_cache_{}'.format(field.name[2:])):
-        item = get_next_item(model, field, u'_cache_{}'.format(field.name[2:]))
-        if not item:
-            return False
-        print u'[Info] Updating markdown {} for {} #{}...'.format(field.name, model.__name__, item.pk)
-        headers = {
-            'content-type': u'text/plain',
-        }
-        if getattr(django_settings, 'GITHUB_API_TOKEN', None):
-            headers['Authorization'] = u'token {}'.format(django_settings.GITHUB_API_TOKEN)
-        r = requests.post(
-            u'https://api.github.com/markdown/raw',
-            data=getattr(item, field.name).encode('utf-8'),
-            headers=headers,
+        return process_next_item(
+            model, field, u'_cache_{}'.format(field.name[2:]),
+            markdown_prepare, markdown_to_html, markdown_save,
         )
-        r.raise_for_status()
-        save_item(model, item, {
-            u'_cache_{}'.format(field.name[2:]): r.text,
-        })
-        print '[Info] Done.'
-        return True
     return False
 
+def get_markdown_updates(model, field):
+    if modelHasField(model, u'_cache_{}'.format(field.name[2:])):
+        return [(u'_cache_{}'.format(field.name[2:]), None, markdown_prepare, markdown_to_html, markdown_save)]
+    return []
+
+############################################################
+# On change
+
+def on_change_prepare(model, field, item):
+    print u'[Info] Updating {} after change occured for {} #{}...'.format(field.name[:8], model.__name__, item.pk)
+    return item
+
+def on_change_save(model, field, item, prepared, result):
+    # Callbacks may access the database, so they're not called in the pool.
+    callback = getattr(model, u'{}_ON_CHANGE'.format(field.name[:8].upper()))
+    return bool(callback(item))
+
 def update_on_change(model, field):
     if isinstance(field, models.BooleanField) and hasattr(model, u'{}_ON_CHANGE'.format(field.name[:8].upper())):
         item = get_next_item(model, field, field.name[:8], boolean_on_change=True)
         if not item:
             return False
-        print u'[Info] Updating {} after change occured for {} #{}...'.format(field.name[:8], model.__name__, item.pk)
-        callback = getattr(model, u'{}_ON_CHANGE'.format(field.name[:8].upper()))
-        if callback(item):
+        on_change_prepare(model, field, item)
+        if on_change_save(model, field, item, item, item):
             print '[Info] Done.'
             return True
     return False
 
+def get_on_change_updates(model, field):
+    if isinstance(field, models.BooleanField) and hasattr(model, u'{}_ON_CHANGE'.format(field.name[:8].upper())):
+        return [(field.name[:8], True, on_change_prepare, None, on_change_save)]
+    return []
+
+############################################################
+# Find updates for models
+
 field_type_to_action = [
-    (models.ImageField, update_image),
+    (models.ImageField, update_image, get_image_updates),
 ]
 
 field_prefix_to_action = [
-    ('m_', update_markdown),
+    ('m_', update_markdown, get_markdown_updates),
 ]
 
 field_suffix_to_action = [
-    ('_changed', update_on_change),
+    ('_changed', update_on_change, get_on_change_updates),
 ]
 
+def _is_async_updatable_model(model, specified_model=None):
+    return (inspect.isclass(model)
+            and issubclass(model, BaseMagiModel)
+            and not getattr(model._meta, 'abstract', False)
+            and (not specified_model or model.__name__ == specified_model))
+
+def _get_callbacks(field):
+    callbacks = []
+    for type_of_field, callback, get_updates in field_type_to_action:
+        if isinstance(field, type_of_field):
+            callbacks.append((callback, get_updates))
+    for prefix, callback, get_updates in field_prefix_to_action:
+        if field.name.startswith(prefix):
+            callbacks.append((callback, get_updates))
+    for suffix, callback, get_updates in field_suffix_to_action:
+        if field.name.endswith(suffix):
+            callbacks.append((callback, get_updates))
+    return callbacks
+
 def model_async_update(model, specified_model=None, field_name=None):
-    if (inspect.isclass(model)
-        and issubclass(model, BaseMagiModel)
-        and not getattr(model._meta, 'abstract', False)
-        and (not specified_model or model.__name__ == specified_model)):
+    if _is_async_updatable_model(model, specified_model=specified_model):
         for field in model._meta.fields:
             if field_name and field.name != field_name:
                 continue
-            for type_of_field, callback in field_type_to_action:
-                if isinstance(field, type_of_field):
-                    if callback(model, field):
-                        return True
-            for prefix, callback in field_prefix_to_action:
-                if field.name.startswith(prefix):
-                    if callback(model, field):
-                        return True
-            for suffix, callback in field_suffix_to_action:
-                if field.name.endswith(suffix):
-                    if callback(model, field):
-                        return True
+            for callback, _get_updates in _get_callbacks(field):
+                if callback(model, field):
+                    return True
     return False
 
+def get_model_async_updates(model, specified_model=None, field_name=None):
+    """
+    Returns a list of (model, field, modified_field_name, boolean_on_change, prepare, process, save)
+    """
+    updates = []
+    if _is_async_updatable_model(model, specified_model=specified_model):
+        for field in model._meta.fields:
+            if field_name and field.name != field_name:
+                continue
+            for _callback, get_updates in _get_callbacks(field):
+                updates += [(model, field) + update for update in get_updates(model, field)]
+    return updates
+
+def get_all_models():
+    return (
+        magi_models.__dict__.values()
+        + __import__(django_settings.SITE + '.models', fromlist=['']).__dict__.values()
+    )
+
+############################################################
+# Queue
+# Items add themselves to the queue (magi.models.AsyncUpdate) when they get saved,
+# so the worker doesn't need to look for them in all the tables.
+
+def enqueue_all(all_models, specified_model=None, field_name=None):
+    """
+    Looks for the items that need an update in all the tables and adds them to the queue.
+    Only needed for items saved before the queue existed or updated without calling save.
+    Returns the number of items added.
+    """
+    total = 0
+    for model in all_models:
+        for model, field, modified_field_name, boolean_on_change, _prepare, _process, _save in get_model_async_updates(
+                model, specified_model=specified_model, field_name=field_name):
+            items = get_next_items(model, field, modified_field_name, boolean_on_change=boolean_on_change, limit=None)
+            for item in items:
+                magi_models.AsyncUpdate.enqueue(item, field.name, priority=item.ASYNC_UPDATE_PRIORITY)
+            total += len(items)
+    return total
+
+def print_queue_depth():
+    queue_depth = magi_models.AsyncUpdate.get_queue_depth()
+    for (model_name, field_name, status), total in queue_depth.items():
+        print u'[Info] {} {} {}: {}'.format(model_name, field_name, status, total)
+    print u'[Info] Total in queue: {}'.format(sum(queue_depth.values()))
+
+def _model_name(model):
+    return u'{}.{}'.format(model._meta.app_label, model._meta.object_name)
+
+def process_jobs(jobs, updates_per_field, pool=None):
+    """
+    Processes a batch of updates popped from the queue.
+    Returns the number of items updated and the number of items that failed.
+    """
+    jobs_per_field = OrderedDict()
+    for job in jobs:
+        jobs_per_field.setdefault((job.model_name, job.field_name), []).append(job)
+    total_updated, total_failed = 0, 0
+    for (model_name, field_name), field_jobs in jobs_per_field.items():
+        if field_name.startswith(RELATED_CACHE_ASYNC_UPDATE_PREFIX):
+            updated, failed = process_related_cache_jobs(field_jobs)
+            total_updated += updated
+            total_failed += failed
+            continue
+        updates = updates_per_field.get((model_name, field_name), [])
+        items = updates[0][0].objects.in_bulk([job.item_id for job in field_jobs]) if updates else {}
+        failed_pks = set()
+        for model, field, modified_field_name, boolean_on_change, prepare, process, save in updates:
+            to_update = [
+                item for item in items.values()
+                if item.pk not in failed_pks
+                and is_async_update_pending(item, field.name, modified_field_name, boolean_on_change)
+            ]
+            if not to_update:
+                continue
+            batch_start = time.time()
+            updated, batch_failed_pks = process_items(model, field, to_update, prepare, process, save, pool=pool)
+            failed_pks.update(batch_failed_pks)
+            total_updated += len(updated)
+            total_failed += len(batch_failed_pks)
+            duration = time.time() - batch_start
+            print u'[Info] {} {} -> {}: {} updated, {} failed in {:.2f}s ({:.2f} items/s)'.format(
+                model.__name__, field.name, modified_field_name, len(updated),
+                len(batch_failed_pks), duration, len(to_update) / duration if duration else 0,
+            )
+        for job in field_jobs:
+            item = items.get(job.item_id, None)
+            if job.item_id in failed_pks:
+                job.retry_later()
+            elif item and field_name in item.get_pending_async_updates():
+                job.release()
+            else:
+                # Done, deleted item or nothing to do anymore
+                job.done()
+    return total_updated, total_failed
+
+def process_related_cache_jobs(jobs):
+    """
+    Updates the related caches deferred with magi.item_model.deferred_related_caches.
+    All the jobs are for the same model and cache.
+    Returns the number of items updated and the number of items that failed.
+    """
+    model = jobs[0].model_class
+    cache_name = jobs[0].field_name[len(RELATED_CACHE_ASYNC_UPDATE_PREFIX):]
+    batch_start = time.time()
+    try:
+        updated = model.update_related_caches_of_items(list(
+            model._related_caches_queryset(batched=True).filter(pk__in=[job.item_id for job in jobs])),
+            cache_names=[cache_name])
+    except Exception, e:
+        print u'[Error] Updating {} cache of {}: {}'.format(cache_name, model.__name__, e)
+        for job in jobs:
+            job.retry_later()
+        return 0, len(jobs)
+    for job in jobs:
+        job.done()
+    print u'[Info] {} {} cache: {} updated in {:.2f}s'.format(
+        model.__name__, cache_name, updated, time.time() - batch_start)
+    return updated, 0
+
+############################################################
+# Worker
+
+def run_worker(all_models, specified_model=None, field_name=None, batch_size=20, workers=4,
+               processes=False, sleep=None):
+    """
+    Processes all the pending updates in the queue, batch by batch.
+    One query per batch gets the updates to do, they're processed in parallel in a pool of
+    threads (better for TinyPNG and GitHub calls) or processes (better for resizing images),
+    then saved in one transaction.
+    When sleep is specified, keeps running and checks for new updates every {sleep} seconds.
+    Items that failed are retried later, with a delay that doubles after each attempt.
+    Returns the total number of updated items.
+    """
+    updates_per_field = OrderedDict()
+    for model in all_models:
+        for update in get_model_async_updates(model, specified_model=specified_model, field_name=field_name):
+            updates_per_field.setdefault((_model_name(update[0]), update[1].name), []).append(update)
+    model_names = listUnique([model_name for model_name, _field_name in updates_per_field.keys()] + [
+        _model_name(model) for model in all_models
+        if not field_name and _is_async_updatable_model(model, specified_model=specified_model)
+        and getattr(model, 'RELATED_CACHES', [])
+    ])
+    total, total_failed, start = 0, 0, time.time()
+    pool = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+    try:
+        while True:
+            jobs = magi_models.AsyncUpdate.pop(
+                limit=batch_size, model_names=model_names, field_name=field_name)
+            if jobs:
+                updated, failed = process_jobs(jobs, updates_per_field, pool=pool)
+                total += updated
+                total_failed += failed
+            elif sleep:
+                time.sleep(sleep)
+            else:
+                break
+    finally:
+        pool.shutdown(wait=True)
+    duration = time.time() - start
+    print u'[Info] Total: {} updated, {} failed in {:.2f}s ({:.2f} items/s)'.format(
+        total, total_failed, duration, total / duration if duration else 0)
+    return total
+
 specified_pks = []
 
 class Command(BaseCommand):
@@ -272,9 +632,53 @@ class Command(BaseCommand):
     - Uses TinyPNG to optimize an image and keep the original in _original_something if field exists
     - Create a thumbbail in _thumbnail_something if field exists
     - Generate a 2x version with waifux2 in _2x_something if field exists
+    With --worker, performs all the updates in the queue in batches.
     """
     can_import_settings = True
 
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--worker',
+            action='store_true',
+            help='Process all pending updates in batches instead of just one.',
+        ),
+        make_option(
+            '--batch-size',
+            action='store',
+            type='int',
+            default=20,
+            help='With --worker: How many items get processed together?',
+        ),
+        make_option(
+            '--workers',
+            action='store',
+            type='int',
+            default=4,
+            help='With --worker: How many items get processed in parallel?',
+        ),
+        make_option(
+            '--processes',
+            action='store_true',
+            help='With --worker: Use processes instead of threads. Faster to resize images, slower for TinyPNG and markdown.',
+        ),
+        make_option(
+            '--sleep',
+            action='store',
+            type='int',
+            help='With --worker: Keep running and check for new items to update every X seconds.',
+        ),
+        make_option(
+            '--enqueue',
+            action='store_true',
+            help='Look for all the items that need an update and add them to the queue used by --worker. Needed once for items saved before the queue existed.',
+        ),
+        make_option(
+            '--queue',
+            action='store_true',
+            help='Show how many updates are in the queue used by --worker.',
+        ),
+    )
+
     def handle(self, *args, **options):
 
         print '[Info]', datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -288,6 +692,24 @@ class Command(BaseCommand):
         global specified_pks
         specified_pks += args[2:]
 
+        if options.get('enqueue', False):
+            print '[Info] Added {} items to the queue.'.format(enqueue_all(
+                get_all_models(), specified_model=specified_model, field_name=specified_field_name))
+            if not options.get('worker', False):
+                return
+
+        if options.get('queue', False):
+            print_queue_depth()
+            return
+
+        if options.get('worker', False):
+            run_worker(
+                get_all_models(), specified_model=specified_model, field_name=specified_field_name,
+                batch_size=options['batch_size'], workers=options['workers'],
+                processes=options.get('processes', False), sleep=options.get('sleep', None),
+            )
+            return
+
         for model in magi_models.__dict__.values():
             if model_async_update(model, specified_model=specified_model, field_name=specified_field_name):
                 return
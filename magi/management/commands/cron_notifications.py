@@ -1,63 +1,230 @@
 # -*- coding: utf-8 -*-
-import datetime
+import datetime, time, smtplib
+from optparse import make_option
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from django.core.mail import get_connection
 from django.core.management.base import BaseCommand, CommandError
-from django.utils.translation import ugettext_lazy as _, string_concat, activate as translation_activate
+from django.utils.translation import ugettext_lazy as _, string_concat, get_language, activate as translation_activate
 from django.utils import timezone
 from magi.urls import * # unused, just to make sure raw_context is updated
 from magi import models
-from magi.settings import SITE_NAME, SITE_NAME_PER_LANGUAGE
-from magi.utils import send_email, emailContext
+from magi.settings import SITE_NAME, SITE_NAME_PER_LANGUAGE, RETENTION_POLICIES
+from magi.management.commands.purge_old_items import purge
+from magi.utils import build_email, emailContext
 from pprint import pprint
 
+############################################################
+# Build emails
+
+def get_notifications_to_send():
+    return models.Notification.objects.filter(email_sent=False, seen=False).select_related(
+        'owner', 'owner__preferences').order_by('id')
+
+def get_notification_language(notification):
+    preferences = notification.owner.preferences
+    return preferences.language if preferences.i_language else 'en'
+
+def get_notification_email_key(notification):
+    """
+    Notifications with the same key are duplicates, only one email gets sent.
+    """
+    return notification.owner.email + notification.english_message + notification.website_url
+
+def build_notification_emails(notifications, sent=None, failed=None):
+    """
+    Returns a list of (notification, email) to send.
+    Notifications get grouped by language and recipient, so the context of each language is only built once.
+    sent and failed are the sets of keys of the emails already sent or that failed,
+    used to avoid sending duplicates (see get_notification_email_key).
+    """
+    sent = sent if sent is not None else set()
+    failed = failed if failed is not None else set()
+    batch_keys = set()
+    notifications_per_language = OrderedDict()
+    for notification in notifications:
+        if not notification.owner.preferences.is_notification_email_allowed(notification.message):
+            try:
+                print '  No email for {}: {}'.format(notification.owner.username, notification.localized_message.replace('\n', ''))
+            except:
+                print 'No email'
+            continue
+        try:
+            key = get_notification_email_key(notification)
+        except Exception, e:
+            print u'!! Error when parsing notification', notification.id, e
+            continue
+        if key in sent or key in failed or key in batch_keys:
+            print u' Duplicate not sent to {}: {}'.format(notification.owner.username, notification.english_message)
+            continue
+        batch_keys.add(key)
+        notifications_per_language.setdefault(get_notification_language(notification), []).append(notification)
+    emails = []
+    old_language = get_language()
+    for language, language_notifications in notifications_per_language.items():
+        translation_activate(language)
+        language_context = emailContext()
+        site_name = SITE_NAME_PER_LANGUAGE.get(language, SITE_NAME)
+        for notification in sorted(language_notifications, key=lambda n: n.owner_id):
+            context = language_context.copy()
+            context['notification'] = notification
+            context['user'] = notification.owner
+            try:
+                emails.append((notification, build_email(
+                    subject=u'{} {}: {}'.format(site_name, unicode(_('Notification')), notification.localized_message),
+                    template_name='notification',
+                    to=[notification.owner.email],
+                    context=context,
+                )))
+            except Exception, e:
+                print u'!! Error when building email to {} !!'.format(notification.owner.email)
+                print e
+    translation_activate(old_language)
+    return emails
+
+############################################################
+# Send emails
+
+def send_messages(messages):
+    """
+    Sends a list of emails using the same connection, one by one so a failed email doesn't stop the others.
+    Returns a list with the error of each email, None when it got sent.
+    Can be called in a thread.
+    """
+    connection = get_connection()
+    errors = []
+    for i, message in enumerate(messages):
+        try:
+            connection.open()
+        except Exception, e:
+            # Nothing can be sent without a connection
+            return errors + [e] * (len(messages) - i)
+        try:
+            connection.send_messages([message])
+            errors.append(None)
+        except Exception, e:
+            errors.append(e)
+            # The connection may be broken, reopen it for the next email
+            try:
+                connection.close()
+            except Exception:
+                pass
+    try:
+        connection.close()
+    except Exception:
+        pass
+    return errors
+
+def is_permanent_email_error(error):
+    """
+    Refused recipients and other 5xx replies won't work better next time.
+    A refused sender is a configuration issue, so the emails get sent again once it's fixed.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _message in error.recipients.values())
+    return (isinstance(error, smtplib.SMTPResponseException)
+            and not isinstance(error, smtplib.SMTPSenderRefused)
+            and error.smtp_code >= 500)
+
+def send_emails(emails, chunk_size=100, pool=None):
+    """
+    Sends a list of (notification, email) in chunks, in parallel when a pool is provided.
+    Returns the list of notifications sent and the list of (notification, error) that failed.
+    """
+    chunks = [emails[i:i + chunk_size] for i in range(0, len(emails), chunk_size)]
+    if pool:
+        futures = [(chunk, pool.submit(send_messages, [email for _n, email in chunk])) for chunk in chunks]
+    else:
+        futures = [(chunk, None) for chunk in chunks]
+    sent, failed = [], []
+    for chunk, future in futures:
+        errors = future.result() if future else send_messages([email for _n, email in chunk])
+        for (notification, _email), error in zip(chunk, errors):
+            if error is not None:
+                print u'!! Error when sending email to {} !!'.format(notification.owner.email)
+                print error
+                failed.append((notification, error))
+                continue
+            try:
+                print u'Email sent to {}: {}'.format(notification.owner.username, notification.english_message.replace('\n', ''))
+            except:
+                print 'Email sent'
+            sent.append(notification)
+    return sent, failed
+
+def is_failed_notification(notification, failed):
+    try:
+        return get_notification_email_key(notification) in failed
+    except Exception:
+        return False
+
+def send_notifications(batch_size=500, chunk_size=100, workers=1):
+    """
+    Sends the emails of all the notifications that haven't been sent or seen yet, batch by batch.
+    Each batch is marked as sent with one query, except the notifications whose email failed
+    (and their duplicates), so they get sent again the next time.
+    Emails that can never be delivered (refused recipient, see is_permanent_email_error) are marked as sent.
+    Returns the number of emails sent.
+    """
+    sent, failed = set(), set()
+    total_sent, total_failed, start = 0, 0, time.time()
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    last_id = 0
+    try:
+        while True:
+            notifications = list(get_notifications_to_send().filter(id__gt=last_id)[:batch_size])
+            if not notifications:
+                break
+            last_id = notifications[-1].id
+            emails = build_notification_emails(notifications, sent=sent, failed=failed)
+            batch_sent, batch_failed = send_emails(emails, chunk_size=chunk_size, pool=pool)
+            sent.update(get_notification_email_key(n) for n in batch_sent)
+            for notification, error in batch_failed:
+                # Duplicates of a permanent error are done, same as when the email got sent
+                (sent if is_permanent_email_error(error) else failed).add(get_notification_email_key(notification))
+            models.Notification.objects.filter(id__in=[
+                n.id for n in notifications if not is_failed_notification(n, failed)]).update(email_sent=True)
+            total_sent += len(batch_sent)
+            total_failed += len(batch_failed)
+    finally:
+        if pool:
+            pool.shutdown(wait=True)
+    duration = time.time() - start
+    print u'Emails: {} sent, {} failed in {:.2f}s ({:.2f} messages/s)'.format(
+        total_sent, total_failed, duration, total_sent / duration if duration else 0)
+    return total_sent
+
 class Command(BaseCommand):
     can_import_settings = True
 
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--batch-size',
+            action='store',
+            type='int',
+            default=500,
+            help='How many notifications get loaded and marked as sent together?',
+        ),
+        make_option(
+            '--chunk-size',
+            action='store',
+            type='int',
+            default=100,
+            help='How many emails get sent with the same connection?',
+        ),
+        make_option(
+            '--workers',
+            action='store',
+            type='int',
+            default=1,
+            help='How many chunks of emails get sent in parallel?',
+        ),
+    )
+
     def handle(self, *args, **options):
 
-        sent = []
-        notifications = models.Notification.objects.filter(email_sent=False, seen=False).select_related('owner', 'owner__preferences')
-        for notification in notifications:
-            preferences = notification.owner.preferences
-            if preferences.is_notification_email_allowed(notification.message):
-                try:
-                    notification_sent = notification.owner.email + notification.english_message + notification.website_url
-                except Exception, e:
-                    print u'!! Error when parsing notification', notification.id, e
-                    continue
-                if notification_sent in sent:
-                    print u' Duplicate not sent to {}: {}'.format(notification.owner.username, notification.english_message)
-                else:
-                    language = preferences.language if preferences.i_language else 'en'
-                    translation_activate(language)
-                    context = emailContext()
-                    context['notification'] = notification
-                    context['user'] = notification.owner
-                    try:
-                        send_email(
-                            subject=u'{} {}: {}'.format(SITE_NAME_PER_LANGUAGE.get(language, SITE_NAME), unicode(_('Notification')), notification.localized_message),
-                            template_name='notification',
-                            to=[notification.owner.email],
-                            context=context,
-                        )
-                        try:
-                            print u'Email sent to {}: {}'.format(notification.owner.username, notification.localized_message.replace('\n', ''))
-                        except:
-                            print 'Email sent'
-                        sent.append(notification_sent)
-                    except Exception, e:
-                        print u'!! Error when sending email to {} !!'.format(notification.owner.email)
-                        print e
-            else:
-                try:
-                    print '  No email for {}: {}'.format(notification.owner.username, notification.localized_message.replace('\n', ''))
-                except:
-                    print 'No email'
-            notification.email_sent = True
-            notification.save()
-
-        now = timezone.now()
-        six_months_ago = now - datetime.timedelta(days=30*6)
-        get_old_notifications = lambda: models.Notification.objects.filter(seen=True, creation__lt=six_months_ago)
-        print 'Delete old notifications:', get_old_notifications().count()
-        while get_old_notifications().count() > 0:
-            models.Notification.objects.filter(id__in=[n.id for n in get_old_notifications()[:100]]).delete()
+        send_notifications(
+            batch_size=options['batch_size'], chunk_size=options['chunk_size'], workers=options['workers'])
+
+        if 'notification' in RETENTION_POLICIES:
+            purge('notification')
@@ -1,6 +1,8 @@
+from optparse import make_option
 from django.core.management.base import BaseCommand
 from django.conf import settings as django_settings
 from magi import urls
+from magi import tools
 from magi.tools import generateSettings
 
 try:
@@ -9,7 +11,21 @@ except ImportError:
     CUSTOM_GENERATE_SETTINGS = None
 
 class Command(BaseCommand):
+    """
+    Only the sections whose inputs changed since last time get generated again.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--force',
+            action='store_true',
+            help='Generate all the sections, even when their inputs didn\'t change.',
+        ),
+    )
+
     def handle(self, *args, **options):
+        if options.get('force', False):
+            # Custom generate_settings call generateSettings themselves
+            tools.FORCE_GENERATE_SETTINGS = True
         if CUSTOM_GENERATE_SETTINGS:
             CUSTOM_GENERATE_SETTINGS.generate_settings()
         else:
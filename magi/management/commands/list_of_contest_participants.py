@@ -210,11 +210,12 @@ class Command(BaseCommand):
     def get_site_entries(self):
         self.activities_by_url = {}
         tag = self.options[SITE]
-        activities = models.Activity.objects.filter(c_tags__contains='"{}"'.format(tag)).select_related(
+        activities = models.filterActivitiesWithTags(models.Activity.objects.all(), [tag]).select_related(
             'owner', 'owner__preferences').prefetch_related(
                 Prefetch('owner__links', queryset=models.UserLink.objects.filter(
                     i_type__in=self.platforms), to_attr='all_links'),
-            ).exclude(c_tags__contains='"news"')
+            )
+        activities = models.excludeActivitiesWithTags(activities, ['news'])
         entries = []
         for activity in activities:
             url = activity.http_item_url
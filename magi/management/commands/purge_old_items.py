@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import datetime, time
+from optparse import make_option
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from magi.settings import RETENTION_POLICIES
+
+def get_queryset_to_purge(policy):
+    """
+    Returns the queryset of the items older than the retention policy allows.
+    """
+    model = apps.get_model(*policy['model'].split('.'))
+    return model.objects.filter(**dict(policy.get('filters', {}), **{
+        u'{}__lt'.format(policy.get('date_field', 'creation')): timezone.now() - datetime.timedelta(days=policy['days']),
+    }))
+
+def delete_in_chunks(queryset, chunk_size=1000, sleep=None):
+    """
+    Deletes all the items in the queryset, chunk by chunk.
+    Each chunk gets the next {chunk_size} primary keys, then deletes that range of primary keys,
+    so the database never has to count or lock the whole table.
+    When sleep is specified, waits {sleep} seconds between chunks to let replicas catch up.
+    Returns the number of deleted items.
+    """
+    total, last_pk = 0, None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(chunk_queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        queryset.filter(pk__gte=pks[0], pk__lte=pks[-1]).delete()
+        total += len(pks)
+        last_pk = pks[-1]
+        if len(pks) < chunk_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+    return total
+
+def purge(policy_name, chunk_size=1000, sleep=None, dry_run=False):
+    """
+    Deletes the items older than the retention policy allows.
+    Returns the number of deleted items, or the number of items that would get deleted with dry_run.
+    """
+    queryset = get_queryset_to_purge(RETENTION_POLICIES[policy_name])
+    if dry_run:
+        total = queryset.count()
+        print u'[Info] {}: {} old items would get deleted'.format(policy_name, total)
+        return total
+    start = time.time()
+    total = delete_in_chunks(queryset, chunk_size=chunk_size, sleep=sleep)
+    print u'[Info] {}: {} old items deleted in {:.2f}s'.format(policy_name, total, time.time() - start)
+    return total
+
+class Command(BaseCommand):
+    """
+    Deletes old items according to RETENTION_POLICIES (by default: notifications seen more than 6 months ago).
+    Optionally takes the names of the policies to apply.
+    """
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            action='store',
+            type='int',
+            default=1000,
+            help='How many items get deleted per query?',
+        ),
+        make_option(
+            '--sleep',
+            action='store',
+            type='float',
+            help='How many seconds to wait between chunks?',
+        ),
+        make_option(
+            '--dry-run',
+            action='store_true',
+            help='Only show how many items would get deleted.',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        policy_names = args or RETENTION_POLICIES.keys()
+        for policy_name in policy_names:
+            if policy_name not in RETENTION_POLICIES:
+                raise CommandError(u'Unknown retention policy: {}'.format(policy_name))
+        for policy_name in policy_names:
+            purge(
+                policy_name, chunk_size=options['chunk_size'], sleep=options.get('sleep', None),
+                dry_run=options.get('dry_run', False),
+            )
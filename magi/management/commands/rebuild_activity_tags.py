@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from magi.models import rebuildActivityTags
+
+class Command(BaseCommand):
+    """
+    Rebuilds the activity tags (ActivityTag) used to filter activities by tag and to exclude hidden tags.
+    Needed when tags of activities get updated without calling save.
+    """
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            action='store',
+            type='int',
+            default=1000,
+            help='How many activities get indexed together?',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        start = time.time()
+        total = rebuildActivityTags(chunk_size=options['chunk_size'])
+        print u'[Info] {} activity tags indexed in {:.2f}s'.format(total, time.time() - start)
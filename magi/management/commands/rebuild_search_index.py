@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from magi.search import getSearchIndexFields, rebuildSearchIndex
+
+class Command(BaseCommand):
+    """
+    Rebuilds the search index used in list views for the models with SEARCH_INDEX_FIELDS.
+    Needed when SEARCH_INDEX_FIELDS or SEARCH_BACKEND change, or when items get updated
+    without calling save.
+    Optionally takes the names of the models (app_label.ModelName).
+    """
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            action='store',
+            type='int',
+            default=1000,
+            help='How many items get indexed together?',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if args:
+            try:
+                models = [apps.get_model(*model_name.split('.')) for model_name in args]
+            except (LookupError, TypeError), e:
+                raise CommandError(unicode(e))
+        else:
+            models = [model for model in apps.get_models() if getSearchIndexFields(model)]
+        for model in models:
+            start = time.time()
+            total = rebuildSearchIndex(model, chunk_size=options['chunk_size'])
+            print u'[Info] {}: {} items indexed in {:.2f}s'.format(model.__name__, total, time.time() - start)
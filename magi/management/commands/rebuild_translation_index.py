@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from magi.item_model import get_indexed_translated_fields, rebuild_translation_index
+
+class Command(BaseCommand):
+    """
+    Rebuilds the translation index used by filterByTranslatedValue for the models with
+    INDEXED_TRANSLATED_FIELDS. Needed when INDEXED_TRANSLATED_FIELDS changes or when
+    translations get updated without calling save.
+    Optionally takes the names of the models (app_label.ModelName).
+    """
+    can_import_settings = True
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            action='store',
+            type='int',
+            default=1000,
+            help='How many items get indexed together?',
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if args:
+            try:
+                models = [apps.get_model(*model_name.split('.')) for model_name in args]
+            except (LookupError, TypeError), e:
+                raise CommandError(unicode(e))
+        else:
+            models = [model for model in apps.get_models() if get_indexed_translated_fields(model)]
+        for model in models:
+            start = time.time()
+            total = rebuild_translation_index(model, chunk_size=options['chunk_size'])
+            print u'[Info] {}: {} translations indexed in {:.2f}s'.format(model.__name__, total, time.time() - start)
@@ -0,0 +1,25 @@
+from django.conf import settings as django_settings
+from magi.item_model import start_deferring_related_caches, stop_deferring_related_caches
+
+class DeferredRelatedCachesMiddleware(object):
+    """
+    When DEFERRED_RELATED_CACHES is set in your settings (True, or 'async' to let the
+    async_db_updates script do it), the caches of the items that have a cache of an
+    item edited during the request get updated once at the end of the request.
+    """
+    def process_request(self, request):
+        if getattr(django_settings, 'DEFERRED_RELATED_CACHES', None):
+            start_deferring_related_caches()
+            request.deferring_related_caches = True
+
+    def process_exception(self, request, exception):
+        # The pending updates may come from rolled back items
+        if getattr(request, 'deferring_related_caches', False):
+            request.deferring_related_caches = False
+            stop_deferring_related_caches(discard=True)
+
+    def process_response(self, request, response):
+        if getattr(request, 'deferring_related_caches', False):
+            request.deferring_related_caches = False
+            stop_deferring_related_caches()
+        return response
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('magi', '0050_report_is_suggestededit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AsyncUpdate',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('model_name', models.CharField(max_length=100)),
+                ('item_id', models.PositiveIntegerField()),
+                ('field_name', models.CharField(max_length=100)),
+                ('i_status', models.PositiveIntegerField(default=0, choices=[(0, b'pending'), (1, b'locked'), (2, b'failed')])),
+                ('priority', models.IntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt', models.DateTimeField()),
+                ('locked_by', models.CharField(max_length=32, null=True, db_index=True)),
+                ('locked_until', models.DateTimeField(null=True)),
+                ('creation', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='asyncupdate',
+            unique_together=set([('model_name', 'item_id', 'field_name')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='asyncupdate',
+            index_together=set([('i_status', 'priority', 'next_attempt')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('magi', '0052_notification_index_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationIndex',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('model_name', models.CharField(max_length=100)),
+                ('item_id', models.PositiveIntegerField(db_index=True)),
+                ('field_name', models.CharField(max_length=100)),
+                ('language', models.CharField(max_length=10)),
+                ('value', models.TextField()),
+                ('normalized_value', models.CharField(max_length=191, db_index=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
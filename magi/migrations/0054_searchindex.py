@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('magi', '0053_translationindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndex',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('model_name', models.CharField(max_length=100)),
+                ('item_id', models.PositiveIntegerField(db_index=True)),
+                ('term', models.CharField(max_length=100, db_index=True)),
+                ('weight', models.PositiveIntegerField(default=1)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from magi.utils import split_data
+
+def add_activity_tags(apps, schema_editor, chunk_size=1000):
+    Activity = apps.get_model('magi', 'Activity')
+    ActivityTag = apps.get_model('magi', 'ActivityTag')
+    last_pk = 0
+    while True:
+        activities = list(Activity.objects.filter(c_tags__isnull=False, pk__gt=last_pk).order_by('pk').values_list('pk', 'c_tags')[:chunk_size])
+        if not activities:
+            break
+        ActivityTag.objects.bulk_create([
+            ActivityTag(activity_id=pk, tag=tag)
+            for pk, c_tags in activities
+            for tag in set(split_data(c_tags))
+        ], batch_size=chunk_size)
+        last_pk = activities[-1][0]
+
+def remove_activity_tags(apps, schema_editor):
+    # The table gets dropped when reversing CreateModel
+    pass
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('magi', '0054_searchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityTag',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('tag', models.CharField(max_length=100)),
+                ('activity', models.ForeignKey(related_name='indexed_tags', to='magi.Activity')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='activitytag',
+            unique_together=set([('activity', 'tag')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='activitytag',
+            index_together=set([('tag', 'activity')]),
+        ),
+        migrations.RunPython(add_activity_tags, reverse_code=remove_activity_tags),
+    ]
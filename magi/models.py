@@ -1,7 +1,9 @@
-import datetime, pytz
+import datetime, pytz, uuid
 from collections import OrderedDict
 from dateutil.relativedelta import relativedelta
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, Count
 from django.contrib.auth.models import User
 from django.core import validators
 from django.utils.translation import ugettext_lazy as _, string_concat, get_language
@@ -35,6 +37,7 @@ from magi.utils import (
     failSafe,
     isFullURL,
     mergeDicts,
+    split_data,
 )
 from magi.settings import (
     ACCOUNT_MODEL,
@@ -46,6 +49,7 @@ from magi.settings import (
     SITE_NAME,
     SITE_NAME_PER_LANGUAGE,
     ONLY_SHOW_SAME_LANGUAGE_ACTIVITY_BY_DEFAULT,
+    SEARCH_INDEX_ACTIVITIES,
     ACTIVITY_TAGS,
     GROUPS,
     HOME_ACTIVITY_TABS,
@@ -831,6 +835,8 @@ class Activity(MagiModel):
     TAGS_CHOICES = ACTIVITY_TAGS_CHOICES
     c_tags = models.TextField(_('Tags'), blank=True, null=True)
 
+    SEARCH_INDEX_FIELDS = ['m_message', 'c_tags'] if SEARCH_INDEX_ACTIVITIES else []
+
     _original_image = models.ImageField(null=True, upload_to=uploadTiny('activities'))
     image = models.ImageField(_('Image'), upload_to=uploadToRandom('activities'), null=True, blank=True, help_text=_('Only post official artworks, artworks you own, or fan artworks that are approved by the artist and credited.'))
 
@@ -981,13 +987,114 @@ class Activity(MagiModel):
     def __unicode__(self):
         return self.get_title() or unicode(_('Post'))
 
+    def save(self, *args, **kwargs):
+        super(Activity, self).save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields', None)
+        if update_fields is None or 'c_tags' in update_fields:
+            updateActivityTags([self])
+
     class Meta:
         verbose_name_plural = 'activities'
         ordering = ['-last_bump']
 
+############################################################
+# Activity tags
+
+class ActivityTag(models.Model):
+    """
+    One row per tag of an activity (values in c_tags), so activities can be filtered by tag
+    with an index. Maintained when activities get saved, rebuilt with the rebuild_activity_tags command.
+    """
+    activity = models.ForeignKey(Activity, related_name='indexed_tags')
+    tag = models.CharField(max_length=100)
+
+    def __unicode__(self):
+        return u'#{} {}'.format(self.activity_id, self.tag)
+
+    class Meta:
+        unique_together = (('activity', 'tag'),)
+        index_together = (('tag', 'activity'),)
+
 ############################################################
 # Activities utilities
 
+def updateActivityTags(activities):
+    """
+    Updates the ActivityTag rows of a list of activities.
+    Only the tags that changed get deleted or added.
+    """
+    if not activities:
+        return
+    existing = {}
+    for row in ActivityTag.objects.filter(activity_id__in=[activity.pk for activity in activities]):
+        existing.setdefault(row.activity_id, {})[row.tag] = row
+    to_delete, to_create = [], []
+    for activity in activities:
+        activity_existing = existing.get(activity.pk, {})
+        for tag in set(split_data(activity.c_tags)):
+            if activity_existing.pop(tag, None) is None:
+                to_create.append(ActivityTag(activity_id=activity.pk, tag=tag))
+        to_delete += [row.pk for row in activity_existing.values()]
+    if to_delete:
+        ActivityTag.objects.filter(pk__in=to_delete).delete()
+    if to_create:
+        ActivityTag.objects.bulk_create(to_create)
+
+def rebuildActivityTags(chunk_size=1000):
+    """
+    Deletes and adds again all the ActivityTag rows, chunk by chunk.
+    Returns the number of tags added.
+    """
+    ActivityTag.objects.all().delete()
+    total, last_pk = 0, 0
+    while True:
+        activities = list(Activity.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'c_tags')[:chunk_size])
+        if not activities:
+            break
+        rows = [
+            ActivityTag(activity_id=pk, tag=tag)
+            for pk, c_tags in activities
+            for tag in set(split_data(c_tags))
+        ]
+        ActivityTag.objects.bulk_create(rows)
+        total += len(rows)
+        last_pk = activities[-1][0]
+    return total
+
+def filterActivitiesWithTags(queryset, tags):
+    """
+    Activities that have all the tags.
+    """
+    for tag in tags:
+        # One join per tag (unique per activity, so no duplicates)
+        queryset = queryset.filter(indexed_tags__tag=tag)
+    return queryset
+
+def excludeActivitiesWithTags(queryset, tags):
+    """
+    Activities that have none of the tags.
+    """
+    if not tags:
+        return queryset
+    # Checked per activity with the (activity, tag) index, so it stops as soon as a page is full
+    return queryset.extra(
+        where=[u'NOT EXISTS (SELECT 1 FROM {tags} WHERE {tags}.activity_id = {table}.id AND {tags}.tag IN ({values}))'.format(
+            tags=ActivityTag._meta.db_table,
+            table=Activity._meta.db_table,
+            values=u', '.join([u'%s'] * len(tags)),
+        )],
+        params=list(tags),
+    )
+
+def countActivitiesPerTag(tags):
+    """
+    Returns { tag: number of activities with this tag }, with one query.
+    """
+    counts = { tag: 0 for tag in tags }
+    for row in ActivityTag.objects.filter(tag__in=tags).values('tag').annotate(total=Count('id')):
+        counts[row['tag']] = row['total']
+    return counts
+
 _CHOOSE_HIDDEN_TAGS_MESSAGE = _('You can change which tags you would like to see or hide in your settings.')
 
 def getAllowedTags(
@@ -1200,6 +1307,8 @@ class Notification(MagiModel):
 
     class Meta:
         ordering = ['-creation', '-id']
+        # Used by the retention policy (see purge_old_items)
+        index_together = (('seen', 'creation'),)
 
 ############################################################
 # Report
@@ -1550,6 +1659,179 @@ class PrivateMessage(MagiModel):
     def __unicode__(self):
         return self.message
 
+############################################################
+# Async updates queue
+
+class AsyncUpdate(BaseMagiModel):
+    """
+    Updates to be done by the async_db_updates script (images, markdown, _ON_CHANGE callbacks, deferred related caches).
+    Added when an item that needs one gets saved, removed once it's done.
+    """
+    model_name = models.CharField(max_length=100) # app_label.ModelName
+    item_id = models.PositiveIntegerField()
+    field_name = models.CharField(max_length=100)
+
+    STATUS_CHOICES = (
+        'pending',
+        'locked',
+        'failed',
+    )
+    i_status = models.PositiveIntegerField(choices=i_choices(STATUS_CHOICES), default=0)
+    priority = models.IntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField()
+    locked_by = models.CharField(max_length=32, null=True, db_index=True)
+    locked_until = models.DateTimeField(null=True)
+    creation = models.DateTimeField(auto_now_add=True)
+
+    MAX_ATTEMPTS = 5
+    RETRY_DELAY = datetime.timedelta(minutes=1) # Doubles after each attempt
+    LOCK_DURATION = datetime.timedelta(minutes=30)
+
+    @property
+    def model_class(self):
+        return apps.get_model(*self.model_name.split('.'))
+
+    @classmethod
+    def enqueue(self, item, field_name, priority=0):
+        self.enqueue_pk(type(item), item.pk, field_name, priority=priority)
+
+    @classmethod
+    def enqueue_pk(self, model, pk, field_name, priority=0):
+        model_name = u'{}.{}'.format(model._meta.app_label, model._meta.object_name)
+        now = timezone.now()
+        if self.objects.filter(model_name=model_name, item_id=pk, field_name=field_name).update(
+                i_status=self.get_i('status', 'pending'), priority=priority, attempts=0,
+                next_attempt=now, locked_by=None, locked_until=None):
+            return
+        try:
+            with transaction.atomic():
+                self.objects.create(
+                    model_name=model_name, item_id=pk, field_name=field_name,
+                    priority=priority, next_attempt=now,
+                )
+        except IntegrityError:
+            # Added at the same time by another process
+            pass
+
+    @classmethod
+    def pop(self, limit=20, model_names=None, field_name=None):
+        """
+        Locks and returns the next updates to do, by priority.
+        Also returns the updates that stayed locked for too long (worker that crashed).
+        """
+        now = timezone.now()
+        queryset = self.objects.filter(
+            Q(i_status=self.get_i('status', 'pending'), next_attempt__lte=now)
+            | Q(i_status=self.get_i('status', 'locked'), locked_until__lte=now)
+        )
+        if model_names is not None:
+            queryset = queryset.filter(model_name__in=model_names)
+        if field_name:
+            queryset = queryset.filter(field_name=field_name)
+        pks = list(queryset.order_by('-priority', 'next_attempt', 'id').values_list('id', flat=True)[:limit])
+        if not pks:
+            return []
+        # Only the updates that didn't get locked by another worker in between get locked
+        token = uuid.uuid4().hex
+        queryset.filter(pk__in=pks).update(
+            i_status=self.get_i('status', 'locked'), locked_by=token, locked_until=now + self.LOCK_DURATION)
+        return list(self.objects.filter(locked_by=token).order_by('-priority', 'next_attempt', 'id'))
+
+    def _locked_queryset(self):
+        # When the item got saved again while locked, it's pending again and locked_by doesn't match
+        return type(self).objects.filter(pk=self.pk, locked_by=self.locked_by)
+
+    def done(self):
+        self._locked_queryset().delete()
+
+    def release(self):
+        self._locked_queryset().update(
+            i_status=self.get_i('status', 'pending'), locked_by=None, locked_until=None)
+
+    def retry_later(self):
+        attempts = self.attempts + 1
+        self._locked_queryset().update(
+            i_status=self.get_i('status', 'failed' if attempts >= self.MAX_ATTEMPTS else 'pending'),
+            attempts=attempts,
+            next_attempt=timezone.now() + self.RETRY_DELAY * (2 ** (attempts - 1)),
+            locked_by=None, locked_until=None,
+        )
+
+    @classmethod
+    def get_queue_depth(self):
+        """
+        Returns { (model_name, field_name, status): total }
+        """
+        return OrderedDict([
+            ((d['model_name'], d['field_name'], self.get_reverse_i('status', d['i_status'])), d['total'])
+            for d in self.objects.values('model_name', 'field_name', 'i_status').annotate(
+                    total=Count('id')).order_by('model_name', 'field_name', 'i_status')
+        ])
+
+    def __unicode__(self):
+        return u'{} #{} {} ({})'.format(self.model_name, self.item_id, self.field_name, self.status)
+
+    class Meta:
+        unique_together = (('model_name', 'item_id', 'field_name'),)
+        index_together = (('i_status', 'priority', 'next_attempt'),)
+
+############################################################
+# Translation index
+
+class TranslationIndex(models.Model):
+    """
+    One row per translation of the fields listed in INDEXED_TRANSLATED_FIELDS of a model
+    (values in d_{field name}s), so filterByTranslatedValue doesn't have to search the JSON.
+    Maintained when items get saved, rebuilt with the rebuild_translation_index command.
+    """
+    model_name = models.CharField(max_length=100) # app_label.ModelName
+    item_id = models.PositiveIntegerField(db_index=True)
+    field_name = models.CharField(max_length=100)
+    language = models.CharField(max_length=10)
+    value = models.TextField()
+    # Lower case, truncated to fit in an index
+    normalized_value = models.CharField(max_length=191, db_index=True)
+
+    NORMALIZED_VALUE_MAX_LENGTH = 191
+
+    @classmethod
+    def normalize(self, value):
+        return value.lower()[:self.NORMALIZED_VALUE_MAX_LENGTH]
+
+    @classmethod
+    def get_model_name(self, model):
+        # Not the name of the deferred model when .only or .defer is used
+        model = model._meta.concrete_model
+        return u'{}.{}'.format(model._meta.app_label, model._meta.object_name)
+
+    @classmethod
+    def objects_of_model(self, model):
+        return self.objects.filter(model_name=self.get_model_name(model))
+
+    def __unicode__(self):
+        return u'{} #{} {} ({}): {}'.format(self.model_name, self.item_id, self.field_name, self.language, self.value)
+
+class SearchIndex(models.Model):
+    """
+    One row per word of the fields listed in SEARCH_INDEX_FIELDS of a model, used by
+    magi.search.InvertedIndexSearchBackend to search in list views.
+    Maintained when items get saved, rebuilt with the rebuild_search_index command.
+    """
+    model_name = models.CharField(max_length=100) # app_label.ModelName
+    item_id = models.PositiveIntegerField(db_index=True)
+    term = models.CharField(max_length=100, db_index=True) # Lower case
+    weight = models.PositiveIntegerField(default=1) # Times the word appears in the item
+
+    get_model_name = TranslationIndex.get_model_name
+
+    @classmethod
+    def objects_of_model(self, model):
+        return self.objects.filter(model_name=self.get_model_name(model))
+
+    def __unicode__(self):
+        return u'{} #{}: {} ({})'.format(self.model_name, self.item_id, self.term, self.weight)
+
 ############################################################
 # Callbacks to call on UserPreferences or User edited
 # If you call these you should also call ON_USER_EDITED and ON_PREFERENCES_EDITED from settings.
@@ -31,7 +31,7 @@ GET_PARAMETERS_IN_FORM_HANDLED_OUTSIDE = [
 
 GET_PARAMETERS_NOT_IN_FORM = [
     'ids',
-    'page', 'page_size',
+    'page', 'page_size', 'cursor',
     'ajax_modal_only', 'ajax_show_top_buttons', 'ajax_show_top_buttons',
     'hide_relevant_fields_on_ordering',
     'show_owner', 'get_started',
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import re, json
+from django.conf import settings as django_settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from magi.utils import split_data
+
+############################################################
+# Words
+
+SEARCH_TERM_MAX_LENGTH = 100
+
+_words_regex = re.compile(r'\w+', re.UNICODE)
+
+def getSearchTerms(value):
+    """
+    Returns the list of lower case words in a string.
+    """
+    if not value:
+        return []
+    if not isinstance(value, unicode):
+        value = value.decode('utf-8')
+    return [word[:SEARCH_TERM_MAX_LENGTH] for word in _words_regex.findall(value.lower())]
+
+def getSearchIndexFields(model):
+    return getattr(model, 'SEARCH_INDEX_FIELDS', [])
+
+def getItemSearchTerms(item):
+    """
+    Returns { word: number of times it appears } for the fields in SEARCH_INDEX_FIELDS of an item.
+    d_ fields: all the translations, c_ fields: all the values.
+    """
+    terms = {}
+    for field_name in getSearchIndexFields(type(item)):
+        value = getattr(item, field_name, None)
+        if not value:
+            continue
+        if field_name.startswith('d_'):
+            values = [v for v in json.loads(value).values() if isinstance(v, basestring)]
+        elif field_name.startswith('c_'):
+            values = split_data(value)
+        else:
+            values = [unicode(value)]
+        for value in values:
+            for term in getSearchTerms(value):
+                terms[term] = terms.get(term, 0) + 1
+    return terms
+
+############################################################
+# Backends
+
+class SearchBackend(object):
+    """
+    Used to search in the fields listed in SEARCH_INDEX_FIELDS of a model.
+    To use your own, set SEARCH_BACKEND to its path in your django settings.
+    """
+    def update(self, items):
+        """
+        Called when items get saved. All the items are from the same model.
+        """
+        raise NotImplementedError()
+
+    def delete(self, model, pks):
+        raise NotImplementedError()
+
+    def rebuild(self, model, chunk_size=1000):
+        """
+        Returns the number of indexed items.
+        """
+        self.delete(model, None)
+        fields = getSearchIndexFields(model)
+        if not fields:
+            return 0
+        total, last_pk = 0, 0
+        while True:
+            items = list(model.objects.filter(pk__gt=last_pk).order_by('pk').only(*fields)[:chunk_size])
+            if not items:
+                break
+            self.update(items)
+            total += len(items)
+            last_pk = items[-1].pk
+        return total
+
+    def condition(self, model, term):
+        """
+        Returns a condition (Q) to filter the items that contain a word that starts with term.
+        """
+        raise NotImplementedError()
+
+    def rank(self, queryset, terms):
+        """
+        Returns the queryset with a search_rank value (higher = more relevant), or the queryset
+        if it's not supported.
+        """
+        return queryset
+
+class InvertedIndexSearchBackend(SearchBackend):
+    """
+    Works with any database: each word of each item is a row of magi.models.SearchIndex.
+    The words of the search match the words that start with them, and the items are ranked
+    by how many times these words appear.
+    """
+    def update(self, items):
+        from magi.models import SearchIndex
+        if not items:
+            return
+        model = type(items[0])
+        model_name = SearchIndex.get_model_name(model)
+        existing = {}
+        for row in SearchIndex.objects_of_model(model).filter(item_id__in=[item.pk for item in items]):
+            existing.setdefault(row.item_id, {})[row.term] = row
+        to_delete, to_create = [], []
+        for item in items:
+            item_existing = existing.get(item.pk, {})
+            for term, weight in getItemSearchTerms(item).items():
+                row = item_existing.pop(term, None)
+                if row and row.weight == weight:
+                    continue
+                if row:
+                    to_delete.append(row.pk)
+                to_create.append(SearchIndex(model_name=model_name, item_id=item.pk, term=term, weight=weight))
+            to_delete += [row.pk for row in item_existing.values()]
+        if to_delete:
+            SearchIndex.objects.filter(pk__in=to_delete).delete()
+        if to_create:
+            SearchIndex.objects.bulk_create(to_create)
+
+    def delete(self, model, pks):
+        from magi.models import SearchIndex
+        rows = SearchIndex.objects_of_model(model)
+        if pks is not None:
+            rows = rows.filter(item_id__in=pks)
+        rows.delete()
+
+    def _rows(self, model, term):
+        from magi.models import SearchIndex
+        # A range rather than LIKE, so the index can be used with any database
+        return SearchIndex.objects_of_model(model).filter(term__gte=term, term__lt=term + u'\uffff')
+
+    def condition(self, model, term):
+        return Q(pk__in=self._rows(model, term).values_list('item_id', flat=True))
+
+    def rank(self, queryset, terms):
+        from magi.models import SearchIndex
+        if not terms:
+            return queryset
+        return queryset.extra(
+            select={
+                'search_rank': u'SELECT COALESCE(SUM(weight), 0) FROM {index} WHERE {index}.model_name = %s AND {index}.item_id = {table}.{pk} AND ({terms})'.format(
+                    index=SearchIndex._meta.db_table,
+                    table=queryset.model._meta.db_table,
+                    pk=queryset.model._meta.pk.column,
+                    terms=u' OR '.join([u'({}.term >= %s AND {}.term < %s)'.format(
+                        SearchIndex._meta.db_table, SearchIndex._meta.db_table)] * len(terms)),
+                ),
+            },
+            select_params=[SearchIndex.get_model_name(queryset.model)] + [
+                value for term in terms for value in (term, term + u'\uffff')
+            ],
+        )
+
+_search_backend = None
+
+def getSearchBackend():
+    global _search_backend
+    if _search_backend is None:
+        _search_backend = import_string(getattr(
+            django_settings, 'SEARCH_BACKEND', 'magi.search.InvertedIndexSearchBackend'))()
+    return _search_backend
+
+############################################################
+# Utils used by BaseMagiModel and MagiFiltersForm
+
+def updateSearchIndex(items):
+    if items and getSearchIndexFields(type(items[0])):
+        getSearchBackend().update(items)
+
+def deleteSearchIndex(model, pks):
+    if getSearchIndexFields(model):
+        getSearchBackend().delete(model, pks)
+
+def rebuildSearchIndex(model, chunk_size=1000):
+    return getSearchBackend().rebuild(model, chunk_size=chunk_size)
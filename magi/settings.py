@@ -21,6 +21,7 @@ from magi.default_settings import (
     DEFAULT_HOMEPAGE_ART_POSITION,
     DEFAULT_SEASONS,
     DEFAULT_USER_COLORS,
+    DEFAULT_RETENTION_POLICIES,
 )
 from magi.utils import (
     complementaryColor,
@@ -210,6 +211,11 @@ if hasattr(settings_module, 'ONLY_SHOW_SAME_LANGUAGE_ACTIVITY_BY_DEFAULT'):
 else:
     ONLY_SHOW_SAME_LANGUAGE_ACTIVITY_BY_DEFAULT = False
 
+if hasattr(settings_module, 'SEARCH_INDEX_ACTIVITIES'):
+    SEARCH_INDEX_ACTIVITIES = getattr(settings_module, 'SEARCH_INDEX_ACTIVITIES')
+else:
+    SEARCH_INDEX_ACTIVITIES = False
+
 if hasattr(settings_module, 'LANGUAGES_CANT_SPEAK_ENGLISH'):
     LANGUAGES_CANT_SPEAK_ENGLISH = getattr(settings_module, 'LANGUAGES_CANT_SPEAK_ENGLISH')
 else:
@@ -322,6 +328,11 @@ if hasattr(settings_module, 'USER_COLORS'):
 else:
     USER_COLORS = DEFAULT_USER_COLORS
 
+if hasattr(settings_module, 'RETENTION_POLICIES'):
+    RETENTION_POLICIES = getattr(settings_module, 'RETENTION_POLICIES')
+else:
+    RETENTION_POLICIES = DEFAULT_RETENTION_POLICIES
+
 ############################################################
 # Optional settings without default values (= None)
 
@@ -1186,6 +1186,8 @@ function load_more_function(nextPageUrl, newPageParameters, newPageCallback /* o
     let button_content = button.html();
     button.html('<div class="loader"><i class="flaticon-loading"></i></div>');
     var next_page = button.attr('data-next-page');
+    // Keyset pagination: start after the last loaded item
+    var next_cursor = button.attr('data-next-cursor');
 
     let url_parts = getURLparts(nextPageUrl);
     let current_parameters = splitParameters(location.search);
@@ -1196,6 +1198,10 @@ function load_more_function(nextPageUrl, newPageParameters, newPageCallback /* o
         ...new_page_parameters,
         ...{ page: next_page },
     };
+    delete parameters.cursor;
+    if (next_cursor) {
+        parameters.cursor = next_cursor;
+    }
     url_parts.parameters = parameters;
     let next_page_url = makeURLfromParts(url_parts);
 
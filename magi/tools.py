@@ -1,15 +1,15 @@
 # -*- coding: utf-8 -*-
-import datetime, time, sys, os, math, pytz
+import datetime, time, sys, os, math, pytz, cPickle, hashlib
 from collections import OrderedDict
 from PIL import Image
 from django.utils import timezone
 from django.utils.translation import activate as translation_activate, ugettext_lazy as _, get_language
 from django.utils.formats import date_format
 from django.utils.html import escape
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, FieldError
 from django.conf import settings as django_settings
-from django.db.models import Count
-from django.forms import ModelChoiceField, NullBooleanField
+from django.db.models import Count, Max, ManyToManyField
+from django.forms import ModelChoiceField, NullBooleanField, MultipleChoiceField
 from magi.utils import (
     andJoin,
     birthdays_within,
@@ -26,6 +26,7 @@ from magi.utils import (
     get_default_owner as utils_get_default_owner,
     birthdayOrderingQueryset,
     modelHasField,
+    modelGetField,
     getCharacterImageFromPk,
     LANGUAGES_DICT,
     getMagiCollection,
@@ -52,6 +53,7 @@ from magi.settings import (
     HAS_MANY_BACKGROUNDS,
     HAS_MANY_FAVORITE_CHARACTERS,
 )
+from magi.forms import MagiFilter, MagiFilterOperator, MagiFilterOperatorSelector
 from magi import models, seasons
 
 ############################################################
@@ -459,6 +461,71 @@ def generateShareImageForMainCollections(collection):
     image_instance.save()
     return unicode(image_instance.image)
 
+def getPresentChoicesWithOneQuery(filter_form, queryset, field_name, choices):
+    """
+    Returns the keys of the choices found in the values present in the queryset, using one query per selector.
+    A choice found always returns at least one item when filtering, but a choice not found may still
+    return items with the case and collation rules of the database, so only the database can tell.
+    Returns None when what the filter does can't be guessed from the values (to_queryset, to_value, ...).
+    """
+    form_field = filter_form.fields[field_name]
+    filter = getattr(filter_form, u'{}_filter'.format(field_name), None) or MagiFilter()
+    if (filter.to_queryset or filter.to_value or filter.noop
+        or isinstance(form_field, NullBooleanField)):
+        return None
+    selectors = filter.selectors or [field_name]
+    if (len(selectors) > 1
+        and (filter.operator_for_multiple_selectors or MagiFilterOperatorSelector.default) != MagiFilterOperatorSelector.Or):
+        return None
+    to_needle = unicode
+    contains = False
+    if isinstance(form_field, MultipleChoiceField) or filter.multiple:
+        # CSV values are stored with quotes: "a","b"
+        if field_name.startswith('c_'):
+            to_needle = lambda choice: u'"{}"'.format(choice)
+        contains = (filter.operator_for_multiple or MagiFilterOperator.default_for_field(form_field)) != MagiFilterOperator.OrExact
+    # Other fields filters with their initial value, like when filtering per choice
+    queryset = filter_form.filter_queryset(queryset, { field_name: '' }, None)
+    present_values = set()
+    for selector in selectors:
+        try:
+            # order_by() to avoid columns used for ordering to be added to the distinct
+            present_values.update(
+                unicode(value)
+                for value in queryset.values_list(selector, flat=True).order_by().distinct()
+                if value is not None
+            )
+        except FieldError:
+            # Selector with lookup, ex: name__icontains
+            return None
+    present_choices = []
+    for choice, verbose in choices:
+        if choice == '':
+            continue
+        needle = to_needle(choice)
+        # d_ values are compared with their stored JSON, same as the database
+        if contains:
+            present = any(needle in value for value in present_values)
+        else:
+            present = needle in present_values
+        if present:
+            present_choices.append(choice)
+    return present_choices
+
+def getPresentChoices(filter_form, queryset, field_name, choices):
+    """
+    Returns the keys of the choices that would return at least one item when filtering.
+    """
+    found_choices = set(getPresentChoicesWithOneQuery(filter_form, queryset, field_name, choices) or [])
+    # One query per choice not found, filtered by the database
+    return [
+        choice for choice, verbose in choices
+        if choice != '' and (
+            choice in found_choices
+            or filter_form.filter_queryset(queryset, { field_name: choice }, None).exists()
+        )
+    ]
+
 def getCacheForFilterFormChoices():
     print 'Get cache of filter form choices'
     cached_choices = {}
@@ -471,6 +538,7 @@ def getCacheForFilterFormChoices():
         cache_choices_for_fields = getattr(filter_form, 'cache_choices', [])
         if not cache_choices_for_fields or not hasattr(filter_form, 'filter_queryset'):
             continue
+        start = time.time()
         queryset = collection.list_view.get_queryset(collection.queryset, {}, None)
         cached_choices[collection.name] = {}
         for field_name in cache_choices_for_fields:
@@ -479,7 +547,7 @@ def getCacheForFilterFormChoices():
             if isinstance(filter_form.fields[field_name], NullBooleanField):
                 choices = [ (1, ''), (2, 'Yes'), (3, 'No') ]
             else:
-                choices = filter_form.fields[field_name].choices
+                choices = list(filter_form.fields[field_name].choices)
             cache_verbose_from_items = False
             if (isinstance(filter_form.fields[field_name], ModelChoiceField)
                 and not isCharacterModelClass(filter_form.fields[field_name].queryset.model)):
@@ -490,10 +558,11 @@ def getCacheForFilterFormChoices():
                 filtered_choices = []
             kept = []
             removed = []
+            present_choices = set(getPresentChoices(filter_form, queryset, field_name, choices))
             for choice, verbose in choices:
                 if choice == '':
                     continue
-                if filter_form.filter_queryset(queryset, { field_name: choice }, None).count():
+                if choice in present_choices:
                     kept.append(verbose)
                     if cache_verbose_from_items:
                         choice_details = { 'key': choice }
@@ -516,6 +585,7 @@ def getCacheForFilterFormChoices():
                     collection.title, filter_form.fields[field_name].label, len(removed),
                     (andJoin(kept) if kept else 'none') if removed else 'all',
                 )
+        print u'  {} filter form choices: {:.2f}s'.format(collection.title, time.time() - start)
     return cached_choices
 
 ############################################################
@@ -537,99 +607,319 @@ def seasonalGeneratedSettings(staff_configurations):
                     seasonal_settings[season_name][variable] = value
     return seasonal_settings
 
-def magiCirclesGeneratedSettings(existing_values):
+############################################################
+# Sections of generated settings
+# Each section declares its inputs (models and fields) and is only generated again when
+# the fingerprint of its inputs changed. Otherwise, its previous output is used.
+
+# Can be changed:
+FORCE_GENERATE_SETTINGS = False # Set by generate_settings --force
+GENERATED_SETTINGS_SECTION_MAX_AGE = datetime.timedelta(days=1) # Catches changes that don't change the fingerprint
+
+def getGeneratedSettingsCacheFile():
+    return django_settings.BASE_DIR + '/' + django_settings.SITE + '_project/generated_settings_sections.pickle'
+
+def loadGeneratedSettingsCache(cache_file=None):
+    try:
+        with open(cache_file or getGeneratedSettingsCacheFile(), 'rb') as f:
+            return cPickle.load(f)
+    except (IOError, EOFError, cPickle.UnpicklingError, AttributeError, ImportError):
+        return {}
+
+def saveGeneratedSettingsCache(cache, cache_file=None):
+    to_save = {}
+    for name, cached_section in cache.items():
+        try:
+            cPickle.dumps(cached_section)
+        except Exception, e:
+            print u'  {}: output can\'t be cached ({})'.format(name, e)
+            continue
+        to_save[name] = cached_section
+    with open(cache_file or getGeneratedSettingsCacheFile(), 'wb') as f:
+        cPickle.dump(to_save, f, cPickle.HIGHEST_PROTOCOL)
+
+def getGeneratedSettingsContentHash(model, field_names):
+    """
+    Hash of the values of the fields in all the items, for models without a modification date.
+    """
+    content_hash = hashlib.md5()
+    for values in model.objects.order_by('pk').values_list('pk', *field_names).iterator():
+        content_hash.update(repr(values))
+    return content_hash.hexdigest()
+
+def getGeneratedSettingsFingerprint(inputs, per=None):
+    """
+    inputs: list of models, (model, [field names]) or (model, [field names], [hashed field names])
+    per: None, 'hour' or 'day', for sections that depend on the current date
+    For each model: total, max pk, max of each field (ex: modification date)
+    and hash of the hashed fields (catches values edited in place).
+    """
+    fingerprint = []
+    for input in inputs:
+        if not isinstance(input, tuple):
+            input = (input, [])
+        model, field_names, hashed_field_names = (input + ([],))[:3]
+        aggregates = { 'total': Count('pk'), 'max_pk': Max('pk') }
+        for field_name in field_names:
+            aggregates[u'max_{}'.format(field_name)] = Max(field_name)
+        values = model.objects.aggregate(**aggregates)
+        fingerprint.append([model.__name__] + [
+            unicode(values[key]) for key in ['total', 'max_pk'] + [
+                u'max_{}'.format(field_name) for field_name in field_names
+            ]
+        ] + ([getGeneratedSettingsContentHash(model, hashed_field_names)] if hashed_field_names else []))
+    if per:
+        fingerprint.append(timezone.now().strftime('%Y-%m-%d %H' if per == 'hour' else '%Y-%m-%d'))
+    return fingerprint
+
+def generateSettingsSections(sections, cache=None, force=False, state=None):
+    """
+    sections: list of dicts with:
+    - name
+    - generate: function that takes the state (outputs of previous sections) and returns a dict with:
+      settings (dict), imports (list), latest_news (list), state (dict, given to the next sections)
+    - inputs: see getGeneratedSettingsFingerprint. None = always generated.
+    - per: see getGeneratedSettingsFingerprint
+    - depends_on: names of sections that, when generated again, require this one to be generated again
+    Returns generated settings, imports, state (with latest_news) and the new cache.
+    """
     now = timezone.now()
-    one_week_ago = now - datetime.timedelta(days=10)
+    cache = cache or {}
+    state = dict(state or {})
+    state['latest_news'] = list(state.get('latest_news', []))
+    generated_settings, imports, new_cache = {}, [], {}
+    generated_sections = set()
+    for section in sections:
+        start = time.time()
+        name = section['name']
+        fingerprint = None
+        if section.get('inputs', None) is not None:
+            fingerprint = getGeneratedSettingsFingerprint(section['inputs'], per=section.get('per', None))
+        cached_section = cache.get(name, None)
+        if (not force
+            and fingerprint is not None
+            and cached_section
+            and cached_section['fingerprint'] == fingerprint
+            and cached_section['date'] > now - GENERATED_SETTINGS_SECTION_MAX_AGE
+            and not (set(section.get('depends_on', [])) & generated_sections)):
+            output = cached_section['output']
+            status = 'unchanged'
+        else:
+            output = section['generate'](state)
+            generated_sections.add(name)
+            cached_section = { 'date': now, 'output': output }
+            status = 'generated'
+        if fingerprint is not None:
+            new_cache[name] = dict(cached_section, fingerprint=fingerprint)
+        generated_settings.update(output.get('settings', {}))
+        imports += output.get('imports', [])
+        state['latest_news'] += output.get('latest_news', [])
+        state.update(output.get('state', {}))
+        print u'  [{}] {} in {:.2f}s'.format(name, status, time.time() - start)
+    return generated_settings, imports, state, new_cache
+
+def _charactersSections(name, queryset, existing_values, generate_kwargs):
+    sections = []
+    if not existing_values.get(generate_kwargs.get('base_name', None) or 'FAVORITE_CHARACTERS', None):
+        def _generate(state):
+            settings, imports = {}, []
+            generateCharactersSettings(queryset, generated_settings=settings, imports=imports, **generate_kwargs)
+            return { 'settings': settings, 'imports': imports }
+        sections.append({
+            'name': name,
+            'generate': _generate,
+            # Birthday today
+            'inputs': [queryset.model], 'per': 'day',
+        })
+    if modelHasField(queryset.model, 'birthday'):
+        category = (u'{}_birthdays'.format(generate_kwargs['base_name'].lower())
+                    if generate_kwargs.get('base_name', None) else 'characters_birthdays')
+        def _generate_birthdays(state):
+            if hasNewsOfCategory(state['latest_news'], category):
+                return {}
+            return { 'latest_news': getCharactersBirthdays(queryset, category=category, latest_news=[]) }
+        sections.append({
+            'name': u'{}_birthdays'.format(name),
+            'generate': _generate_birthdays,
+            'inputs': [queryset.model], 'per': 'day',
+            'depends_on': ['staff_configurations'],
+        })
+    return sections
+
+# Staff configurations don't have a modification date: values edited by staff change the hash
+STAFF_CONFIGURATIONS_INPUT = (models.StaffConfiguration, [], ['key', 'value', 'i_language'])
+
+def getCachedFilterFormChoicesInputs():
+    """
+    Models of the collections with cache_choices in their filter form, with the values of these fields hashed.
+    Related items (ex: a ForeignKey) get all their fields hashed, since their names are used as choices.
+    """
+    hashed_field_names = OrderedDict()
+    for collection in (getMagiCollections() or {}).values():
+        cache_choices = getattr(collection.list_view.filter_form, 'cache_choices', [])
+        if not collection.list_view.filters_details or not cache_choices:
+            continue
+        model = collection.queryset.model
+        hashed_field_names.setdefault(model, [])
+        for field_name in cache_choices:
+            field = modelGetField(model, field_name)
+            if not field or field.attname in hashed_field_names[model]:
+                continue
+            if field.rel:
+                hashed_field_names[field.rel.to] = [
+                    related_field.attname for related_field in field.rel.to._meta.concrete_fields
+                ]
+                if isinstance(field, ManyToManyField):
+                    continue
+            hashed_field_names[model].append(field.attname)
+    return [(model, [], field_names) for model, field_names in hashed_field_names.items()]
 
-    generated_settings = {}
-    imports = []
+def getMagiCirclesGeneratedSettingsSections(existing_values):
+    sections = []
 
     ############################################################
     # Get settings only when missing:
 
     # Get staff configurations and latest news
-    staff_configurations = existing_values.get('STAFF_CONFIGURATIONS', None)
-    latest_news = []
-    if not staff_configurations:
-        staff_configurations, more_latest_news = getStaffConfigurations()
-        latest_news += more_latest_news
+    if not existing_values.get('STAFF_CONFIGURATIONS', None):
+        def _generate_staff_configurations(state):
+            staff_configurations, latest_news = getStaffConfigurations()
+            return { 'latest_news': latest_news, 'state': { 'staff_configurations': staff_configurations } }
+        sections.append({
+            'name': 'staff_configurations',
+            'generate': _generate_staff_configurations,
+            'inputs': [STAFF_CONFIGURATIONS_INPUT],
+        })
 
-    # Get favorite characters
+    # Get favorite characters + birthday banners
     if FAVORITE_CHARACTERS_MODEL:
-        queryset = FAVORITE_CHARACTERS_FILTER(FAVORITE_CHARACTERS_MODEL.objects.all())
-        # Cache
-        if not existing_values.get('FAVORITE_CHARACTERS', None):
-            generateCharactersSettings(
-                queryset,
-                generated_settings=generated_settings,
-                imports=imports, has_many=HAS_MANY_FAVORITE_CHARACTERS,
-                threshold=MANY_CHARACTERS_THRESHOLD,
-            )
-        # Get birthday banners
-        if modelHasField(FAVORITE_CHARACTERS_MODEL, 'birthday'):
-            if not hasNewsOfCategory(latest_news, 'characters_birthdays'):
-                latest_news = getCharactersBirthdays(
-                    queryset,
-                    latest_news=latest_news,
-                )
+        sections += _charactersSections(
+            'favorite_characters',
+            FAVORITE_CHARACTERS_FILTER(FAVORITE_CHARACTERS_MODEL.objects.all()),
+            existing_values, {
+                'has_many': HAS_MANY_FAVORITE_CHARACTERS,
+                'threshold': MANY_CHARACTERS_THRESHOLD,
+            },
+        )
 
     # Other characters
     if OTHER_CHARACTERS_MODELS:
-        generated_settings['OTHER_CHARACTERS_KEYS'] = OTHER_CHARACTERS_MODELS.keys()
+        sections.append({
+            'name': 'other_characters_keys',
+            'generate': lambda state: { 'settings': { 'OTHER_CHARACTERS_KEYS': OTHER_CHARACTERS_MODELS.keys() } },
+        })
         for key, character_details in OTHER_CHARACTERS_MODELS.items():
             if not isinstance(character_details, dict):
                 character_details = { 'model': character_details }
-            queryset = character_details.get('filter', lambda q: q)(character_details['model'].objects.all())
-            # Cache
-            if not existing_values.get(key, None):
-                generateCharactersSettings(
-                    queryset,
-                    generated_settings=generated_settings,
-                    imports=imports,
-                    for_favorite=False,
-                    base_name=key,
-                    has_many=character_details.get('has_many', None),
-                    threshold=character_details.get('many_threshold', MANY_CHARACTERS_THRESHOLD),
-                )
-            # Get birthday banners
-            if modelHasField(character_details['model'], 'birthday'):
-                category = u'{}_birthdays'.format(key.lower())
-                if not hasNewsOfCategory(latest_news, category):
-                    latest_news = getCharactersBirthdays(
-                        queryset,
-                        category=category,
-                        latest_news=latest_news,
-                    )
+            sections += _charactersSections(
+                key.lower(),
+                character_details.get('filter', lambda q: q)(character_details['model'].objects.all()),
+                existing_values, {
+                    'for_favorite': False,
+                    'base_name': key,
+                    'has_many': character_details.get('has_many', None),
+                    'threshold': character_details.get('many_threshold', MANY_CHARACTERS_THRESHOLD),
+                },
+            )
 
     # Get total donators
     if not existing_values.get('TOTAL_DONATORS', None):
-        generated_settings['TOTAL_DONATORS'] = totalDonatorsThisMonth() or '\'\''
+        sections.append({
+            'name': 'total_donators',
+            'generate': lambda state: { 'settings': { 'TOTAL_DONATORS': totalDonatorsThisMonth() or '\'\'' } },
+            'inputs': [models.DonationMonth, models.Badge], 'per': 'day',
+        })
 
     # Get latest donation month
     if not existing_values.get('DONATION_MONTH', None):
-        generated_settings['DONATION_MONTH'] = latestDonationMonth(failsafe=True)
+        sections.append({
+            'name': 'donation_month',
+            'generate': lambda state: { 'settings': { 'DONATION_MONTH': latestDonationMonth(failsafe=True) } },
+            'inputs': [models.DonationMonth], 'per': 'day',
+        })
 
     # Get seasonal settings
     if not existing_values.get('SEASONAL_SETTINGS', None):
-        generated_settings['SEASONAL_SETTINGS'] = seasonalGeneratedSettings(staff_configurations)
+        def _generate_seasonal_settings(state):
+            seasonal_settings = seasonalGeneratedSettings(state['staff_configurations'])
+            return {
+                'settings': { 'SEASONAL_SETTINGS': seasonal_settings },
+                'state': { 'seasonal_settings': seasonal_settings },
+            }
+        sections.append({
+            'name': 'seasonal_settings',
+            'generate': _generate_seasonal_settings,
+            'inputs': [STAFF_CONFIGURATIONS_INPUT], 'per': 'hour',
+            'depends_on': ['staff_configurations'],
+        })
 
     # Add banners for seasonal hashtags
-    if not hasNewsOfCategory(latest_news, 'seasonal_activity_tag'):
-        latest_news = getSeasonalActivityTagBanners(
-            seasonal_settings=existing_values.get('SEASONAL_SETTINGS', None) or generated_settings['SEASONAL_SETTINGS'],
-            latest_news=latest_news,
-        )
+    def _generate_seasonal_activity_tag_banners(state):
+        if hasNewsOfCategory(state['latest_news'], 'seasonal_activity_tag'):
+            return {}
+        return { 'latest_news': getSeasonalActivityTagBanners(
+            seasonal_settings=state['seasonal_settings'], latest_news=[]) }
+    sections.append({
+        'name': 'seasonal_activity_tag_banners',
+        'generate': _generate_seasonal_activity_tag_banners,
+        'inputs': [], 'per': 'hour',
+        'depends_on': ['staff_configurations', 'seasonal_settings'],
+    })
 
     # Get users birthdays
-    if not hasNewsOfCategory(latest_news, 'users_birthdays'):
-        latest_news = getUsersBirthdaysToday(
-            latest_news=latest_news,
-        )
+    def _generate_users_birthdays(state):
+        if hasNewsOfCategory(state['latest_news'], 'users_birthdays'):
+            return {}
+        return { 'latest_news': getUsersBirthdaysToday(latest_news=[]) }
+    sections.append({
+        'name': 'users_birthdays',
+        'generate': _generate_users_birthdays,
+        'inputs': [models.UserPreferences], 'per': 'day',
+        'depends_on': ['staff_configurations'],
+    })
 
     ############################################################
     # Always get:
 
     # Generate share images once a week
+    sections.append({
+        'name': 'share_images',
+        'generate': lambda state: { 'settings': generateShareImagesSettings() },
+    })
+
+    # Get homepage arts
+    if GET_HOMEPAGE_ARTS:
+        sections.append({
+            'name': 'homepage_arts',
+            'generate': lambda state: { 'settings': { 'HOMEPAGE_ARTS': GET_HOMEPAGE_ARTS() } },
+        })
+
+    # Get backgrounds
+    sections.append({
+        'name': 'backgrounds',
+        'generate': lambda state: { 'settings': generateBackgroundsSettings() },
+        'inputs': None if GET_BACKGROUNDS or not BACKGROUNDS_MODEL else [BACKGROUNDS_MODEL],
+    })
+
+    # Get past tags count
+    sections.append({
+        'name': 'past_activity_tags_count',
+        'generate': lambda state: { 'settings': { 'PAST_ACTIVITY_TAGS_COUNT': getPastActivityTagsCount() } },
+        'inputs': [models.Activity], 'per': 'day',
+    })
+
+    # Cache choices
+    sections.append({
+        'name': 'cached_filter_form_choices',
+        'generate': lambda state: { 'settings': { 'CACHED_FILTER_FORM_CHOICES': getCacheForFilterFormChoices() } },
+        'inputs': getCachedFilterFormChoicesInputs(),
+    })
+
+    return sections
+
+def generateShareImagesSettings():
+    now = timezone.now()
+    one_week_ago = now - datetime.timedelta(days=10)
     if django_settings.DEBUG:
         generated_share_images_last_date = now
         generated_share_images = {}
@@ -645,16 +935,16 @@ def magiCirclesGeneratedSettings(existing_values):
             for collection_name, collection in getMagiCollections().items():
                 if collection.auto_share_image:
                     generated_share_images[collection.name] = generateShareImageForMainCollections(collection)
-    generated_settings['GENERATED_SHARE_IMAGES_LAST_DATE'] = 'datetime.datetime.fromtimestamp(' + unicode(
-        time.mktime(generated_share_images_last_date.timetuple())
-    ) + ')'
-    generated_settings['GENERATED_SHARE_IMAGES'] = generated_share_images
-
-    # Get homepage arts
-    if GET_HOMEPAGE_ARTS:
-        generated_settings['HOMEPAGE_ARTS'] = GET_HOMEPAGE_ARTS()
+    return {
+        'GENERATED_SHARE_IMAGES_LAST_DATE': 'datetime.datetime.fromtimestamp(' + unicode(
+            time.mktime(generated_share_images_last_date.timetuple())
+        ) + ')',
+        'GENERATED_SHARE_IMAGES': generated_share_images,
+    }
 
-    # Get backgrounds
+def generateBackgroundsSettings():
+    generated_settings = {}
+    total = 0
     if GET_BACKGROUNDS:
         generated_settings['BACKGROUNDS'] = GET_BACKGROUNDS()
         total = len(generated_settings['BACKGROUNDS'])
@@ -666,33 +956,48 @@ def magiCirclesGeneratedSettings(existing_values):
         generated_settings['HAS_MANY_BACKGROUNDS'] = HAS_MANY_BACKGROUNDS
     else:
         generated_settings['HAS_MANY_BACKGROUNDS'] = backgrounds_collection and total > MANY_BACKGROUNDS_THRESHOLD
+    return generated_settings
 
-    # Get past tags count
-    generated_settings['PAST_ACTIVITY_TAGS_COUNT'] = {}
-    for tag_name, tag in ACTIVITY_TAGS.items():
+def getPastActivityTagsCount():
+    return models.countActivitiesPerTag([
+        tag_name for tag_name, tag in ACTIVITY_TAGS.items()
         if getEventStatus(
                 tag.get('start_date', None),
                 tag.get('end_date', None),
                 without_year_return='ended',
-        ) == 'ended':
-            generated_settings['PAST_ACTIVITY_TAGS_COUNT'][tag_name] = models.Activity.objects.filter(
-                c_tags__contains='"{}"'.format(tag_name)).count()
-
-    # Cache choices
-    generated_settings['CACHED_FILTER_FORM_CHOICES'] = getCacheForFilterFormChoices()
+        ) == 'ended'
+    ])
+
+def magiCirclesGeneratedSettings(existing_values, force=None):
+    """
+    Only generates the sections whose inputs changed since last time, unless force is True.
+    """
+    if force is None:
+        force = FORCE_GENERATE_SETTINGS
+    start = time.time()
+    cache = loadGeneratedSettingsCache()
+    generated_settings, imports, state, cache = generateSettingsSections(
+        getMagiCirclesGeneratedSettingsSections(existing_values),
+        cache=cache, force=force, state={
+            'staff_configurations': existing_values.get('STAFF_CONFIGURATIONS', None),
+            'seasonal_settings': existing_values.get('SEASONAL_SETTINGS', None),
+        },
+    )
+    saveGeneratedSettingsCache(cache)
+    print u'Generated settings in {:.2f}s'.format(time.time() - start)
 
     ############################################################
     # Save
 
     generated_settings.update({
-        'STAFF_CONFIGURATIONS': staff_configurations,
-        'LATEST_NEWS': latest_news,
+        'STAFF_CONFIGURATIONS': state['staff_configurations'],
+        'LATEST_NEWS': state['latest_news'],
     })
 
     return generated_settings, imports
 
-def generateSettings(values, imports=[]):
-    m_values, m_imports = magiCirclesGeneratedSettings(values)
+def generateSettings(values, imports=[], force=None):
+    m_values, m_imports = magiCirclesGeneratedSettings(values, force=force)
     # Existing values have priority
     # Dicts and lists get merged
     for key, value in values.items():
@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import division
-import os, string, random, csv, tinify, cStringIO, pytz, simplejson, datetime, io, operator, re, math, requests, urllib, urllib2, json
+import os, string, random, csv, tinify, cStringIO, pytz, simplejson, datetime, io, operator, re, math, requests, urllib, urllib2, json, base64, hashlib
 from PIL import Image
 from json.encoder import encode_basestring_ascii
 from urlparse import urlparse
 from collections import OrderedDict
 from dateutil.relativedelta import relativedelta
 from django.conf import settings as django_settings
+from django.core.cache import cache
 from django.core.files.temp import NamedTemporaryFile
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
@@ -31,6 +32,7 @@ from django.db import connection
 from django.db.models.fields import BLANK_CHOICE_DASH, FieldDoesNotExist
 from django.db.models.related import RelatedObject
 from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
 from django.db.models import Q, Prefetch
 from django.forms.models import model_to_dict
 from django.forms import (
@@ -1001,31 +1003,31 @@ def checkIsCurrentSeasonNotFromGeneratedSettings(seasons_settings, season_name):
 ############################################################
 # Context for django requests
 
-def globalContext(request=None, email=False):
-    # /!\ Can't be called at global level
-    if not request and not email:
-        raise NotImplementedError('Request is required to get context.')
+_static_global_contexts = {}
+_static_global_contexts_version = None
 
-    context = RAW_CONTEXT.copy()
-    context['ajax'] = isRequestAjax(request)
+def resetStaticGlobalContexts():
+    global _static_global_contexts, _static_global_contexts_version
+    _static_global_contexts = {}
+    _static_global_contexts_version = None
 
-    if request:
-        context['ajax_modal_only'] = context['ajax'] and 'ajax_modal_only' in request.GET
-        context['is_authenticated'] = request.user.is_authenticated()
-        context['request'] = request
-        context['current'] = resolve(request.path_info).url_name
-        context['current_url'] = request.get_full_path() + ('?' if request.get_full_path()[-1] == '/' else '&')
-        language = request.LANGUAGE_CODE
-    else:
-        language = get_language()
-        context['ajax_modal_only'] = False
-        context['is_authenticated'] = False
-
-    if context['is_authenticated']:
-        context['is_crawler'] = False
-    else:
-        context['is_crawler'] = isRequestCrawler(request)
+def _staticGlobalContext(language, kind):
+    """
+    Returns the part of the global context that only depends on the language and the current season(s).
+    kind: 'email', 'ajax' or 'page'
+    Computed once per process, then again when the generated settings get reloaded.
+    /!\ Shared between requests: copy mutable values before changing them.
+    """
+    global _static_global_contexts, _static_global_contexts_version
+    version = getattr(django_settings, 'GENERATED_DATE', None)
+    if version != _static_global_contexts_version:
+        _static_global_contexts = {}
+        _static_global_contexts_version = version
+    key = (kind, language, get_language())
+    if key in _static_global_contexts:
+        return _static_global_contexts[key]
 
+    context = RAW_CONTEXT.copy()
     context['page_title'] = None
     context['current_language'] = language
     context['localized_language'] = LANGUAGES_DICT.get(language, '')
@@ -1039,40 +1041,21 @@ def globalContext(request=None, email=False):
     context['t_full_email_image'] = context['full_email_image_per_language'].get(
         language, context['full_email_image'])
     context['js_variables'] = {}
-
-    ############################################################
-    # Debug
-
-    if django_settings.DEBUG:
-        # Ensures that static assets are always reloaded
-        context['static_files_version'] = randomString(20)
-        # Don't enforce recaptcha
-        if not django_settings.RECAPTCHA_PUBLIC_KEY:
-            context['disable_recaptcha'] = True
+    context['seasonal_to_context'] = []
 
     ############################################################
     # Only email pages
 
-    if email:
+    if kind == 'email':
         if context['site_url'].startswith('//'):
             context['site_url'] = 'http:' + context['site_url']
         context['consider_donating_sentence'] = _('If you like {site_name}, please consider donating').format(
             site_name=getSiteName())
 
-    ############################################################
-    # Only ajax pages
-
-    elif context['ajax']:
-        pass
-
     ############################################################
     # Only non-ajax pages / non-email
 
-    else:
-        context['corner_popups'] = OrderedDict()
-
-        if request:
-            context['hidenavbar'] = 'hidenavbar' in request.GET
+    elif kind == 'page':
         context['javascript_translated_terms_json'] = simplejson.dumps(
             { term: unicode(_(term)) for term in context['javascript_translated_terms'] })
 
@@ -1106,12 +1089,71 @@ def globalContext(request=None, email=False):
                         if 'js_variables' not in context:
                             context['js_variables'] = {}
                         context['js_variables'].update(value)
-                    # Call function to add more to context
+                    # Function to call to add more to context, depends on the request
                     elif variable == 'to_context':
-                        getVariableFromSeasonalModule(
-                            'to_context', value,
-                            CUSTOM_SEASONAL_MODULE_FOR_CONTEXT,
-                        )(request, context)
+                        context['seasonal_to_context'].append(value)
+
+    _static_global_contexts[key] = context
+    return context
+
+def globalContext(request=None, email=False):
+    # /!\ Can't be called at global level
+    if not request and not email:
+        raise NotImplementedError('Request is required to get context.')
+
+    ajax = isRequestAjax(request)
+    language = request.LANGUAGE_CODE if request else get_language()
+    context = _staticGlobalContext(language, 'email' if email else ('ajax' if ajax else 'page')).copy()
+    seasonal_to_context = context.pop('seasonal_to_context')
+    # Mutable values shared between requests
+    context['js_variables'] = context['js_variables'].copy()
+    if 'ajax_callbacks' in context:
+        context['ajax_callbacks'] = list(context['ajax_callbacks'])
+    for key in ['cuteform_fields', 'cuteform_fields_json']:
+        if key in context:
+            context[key] = context[key].copy()
+
+    context['ajax'] = ajax
+    if request:
+        context['ajax_modal_only'] = context['ajax'] and 'ajax_modal_only' in request.GET
+        context['is_authenticated'] = request.user.is_authenticated()
+        context['request'] = request
+        context['current'] = resolve(request.path_info).url_name
+        context['current_url'] = request.get_full_path() + ('?' if request.get_full_path()[-1] == '/' else '&')
+    else:
+        context['ajax_modal_only'] = False
+        context['is_authenticated'] = False
+
+    if context['is_authenticated']:
+        context['is_crawler'] = False
+    else:
+        context['is_crawler'] = isRequestCrawler(request)
+
+    ############################################################
+    # Debug
+
+    if django_settings.DEBUG:
+        # Ensures that static assets are always reloaded
+        context['static_files_version'] = randomString(20)
+        # Don't enforce recaptcha
+        if not django_settings.RECAPTCHA_PUBLIC_KEY:
+            context['disable_recaptcha'] = True
+
+    ############################################################
+    # Only non-ajax pages / non-email
+
+    if not email and not ajax:
+        context['corner_popups'] = OrderedDict()
+
+        if request:
+            context['hidenavbar'] = 'hidenavbar' in request.GET
+
+        # Seasonal: call function to add more to context
+        for value in seasonal_to_context:
+            getVariableFromSeasonalModule(
+                'to_context', value,
+                CUSTOM_SEASONAL_MODULE_FOR_CONTEXT,
+            )(request, context)
 
         # Corner popups
         if context['is_authenticated']:
@@ -2169,9 +2211,11 @@ def getCurrentEvents(queryset, prefix='', ends_within=0, starts_within=0, start_
 ############################################################
 # Send email
 
-def send_email(subject, template_name, to=[], context=None, from_email=django_settings.AWS_SES_RETURN_PATH):
-    if 'template_name' != 'notification':
-        to.append(django_settings.LOG_EMAIL)
+def build_email(subject, template_name, to=[], context=None, from_email=django_settings.AWS_SES_RETURN_PATH):
+    """
+    Renders the email without sending it.
+    To send many emails, use a connection's send_messages (see cron_notifications).
+    """
     subject = subject.replace('\n', '').replace('\r', '')
     if not context:
         context = emailContext()
@@ -2180,7 +2224,12 @@ def send_email(subject, template_name, to=[], context=None, from_email=django_se
     htmly = get_template('emails/' + template_name + '.html').render(context)
     email = EmailMultiAlternatives(subject, plaintext, from_email, to)
     email.attach_alternative(htmly, "text/html")
-    email.send()
+    return email
+
+def send_email(subject, template_name, to=[], context=None, from_email=django_settings.AWS_SES_RETURN_PATH):
+    if 'template_name' != 'notification':
+        to.append(django_settings.LOG_EMAIL)
+    build_email(subject, template_name, to=to, context=context, from_email=from_email).send()
 
 ############################################################
 # Various string/int/list tools
@@ -3469,6 +3518,72 @@ def getQuerysetFromModel(model, request=None, return_collection=False):
         return collection, queryset
     return queryset
 
+_querysets_of_related_items = {}
+
+def resetQuerysetsOfRelatedItems():
+    _querysets_of_related_items.clear()
+
+def copyQueryset(queryset):
+    """
+    Returns a copy of the queryset that can be used in a Prefetch and evaluated.
+    Prefetch objects get modified when they're used, so the nested ones get copied too.
+    """
+    queryset = queryset._clone()
+    queryset._prefetch_related_lookups = [
+        Prefetch(
+            lookup.prefetch_through,
+            queryset=copyQueryset(lookup.queryset) if lookup.queryset is not None else None,
+            to_attr=lookup.to_attr,
+        ) if isinstance(lookup, Prefetch) else lookup
+        for lookup in queryset._prefetch_related_lookups
+    ]
+    return queryset
+
+def getQuerysetOfRelatedItem(model, related_item_field_name):
+    """
+    Returns (collection, queryset) of the related item, like getQuerysetFromModel.
+    Only depends on the default queryset of the collection of the related item, so it's
+    computed once per process. The returned queryset is a copy that can be modified.
+    """
+    key = (model, related_item_field_name)
+    if key not in _querysets_of_related_items:
+        _querysets_of_related_items[key] = getQuerysetFromModel(
+            getModelOfRelatedItem(model, related_item_field_name), return_collection=True)
+    collection, queryset = _querysets_of_related_items[key]
+    return collection, (copyQueryset(queryset) if queryset is not None else None)
+
+def getPreselectedPlan(model, preselected):
+    """
+    Returns (select_related lookups, prefetch_related lookups) to preselect a related item
+    and keep the default preselected/prefetched items of its collection.
+    prefetch_related lookups = list of (lookup, queryset or None), querysets need to be copied before use.
+    Computed once per process.
+    """
+    key = (model, preselected, 'preselected')
+    if key not in _querysets_of_related_items:
+        model_of_preselected = getModelOfRelatedItem(model, preselected)
+        _collection, queryset_of_preselected = getQuerysetOfRelatedItem(model, preselected)
+        fields_preselected, fields_prefetched = [ preselected ], []
+        if queryset_of_preselected is not None:
+            fields_preselected += [
+                u'{}__{}'.format(preselected, other_preselected)
+                for other_preselected in selectRelatedDictToStrings(queryset_of_preselected.query.select_related)
+            ]
+            for other_prefetched in queryset_of_preselected._prefetch_related_lookups:
+                queryset_of_other_prefetched = None
+                if isinstance(other_prefetched, Prefetch):
+                    queryset_of_other_prefetched = other_prefetched.queryset
+                    other_prefetched = other_prefetched.prefetch_to
+                if queryset_of_other_prefetched is None:
+                    _collection, queryset_of_other_prefetched = getQuerysetOfRelatedItem(
+                        model_of_preselected, other_prefetched)
+                fields_prefetched.append((
+                    u'{}__{}'.format(preselected, other_prefetched),
+                    queryset_of_other_prefetched.distinct() if queryset_of_other_prefetched is not None else None,
+                ))
+        _querysets_of_related_items[key] = (fields_preselected, fields_prefetched)
+    return _querysets_of_related_items[key]
+
 def addRelatedCaches(model_class, caches):
     if not getattr(model_class, 'RELATED_CACHES', []):
         model_class.RELATED_CACHES = []
@@ -3602,6 +3717,9 @@ def _addRelatedCaches_to_cache_m2m_csv(cache_name, rel_collection_name):
             rel_item.pk
             for rel_item in _addRelatedCaches_to_cache_queryset(item, cache_name, rel_collection_name)
         ]
+    # Used by getRelatedCachesOfItems
+    _to_cache.to_rel_item_cache = lambda rel_item: rel_item.pk
+    _to_cache.rel_collection_name = rel_collection_name
     return _to_cache
 
 def _addRelatedCaches_to_rel_item_cache(rel_item, fields, to_fields):
@@ -3619,8 +3737,50 @@ def _addRelatedCaches_to_cache_m2m(cache_name, fields, rel_collection_name, to_f
             _addRelatedCaches_to_rel_item_cache(rel_item, fields, to_fields)
             for rel_item in _addRelatedCaches_to_cache_queryset(item, cache_name, rel_collection_name)
         ]
+    # Used by getRelatedCachesOfItems
+    _to_cache.to_rel_item_cache = lambda rel_item: _addRelatedCaches_to_rel_item_cache(
+        rel_item, fields, to_fields)
+    _to_cache.rel_collection_name = rel_collection_name
     return _to_cache
 
+def getRelatedCachesOfItems(model_class, items, cache_name):
+    """
+    Bulk version of to_cache_{cache_name} for the many to many and reverse related caches
+    added with addRelatedCaches: all the related items of all the items are retrieved with
+    2 queries, instead of a count and a query per item.
+    Returns a dict of {item pk: (value to cache, total)}, or None when the cache can't be
+    retrieved in bulk (foreign keys or custom to_cache_ methods).
+    """
+    to_rel_item_cache = getattr(getattr(model_class, u'to_cache_{}'.format(cache_name), None), 'to_rel_item_cache', None)
+    if not to_rel_item_cache:
+        return None
+    to_cache = getattr(model_class, u'to_cache_{}'.format(cache_name))
+    filter_field_name = getFilterFieldNameOfRelatedItem(model_class, cache_name)
+    queryset = getQuerysetFromModel(getModelOfRelatedItem(model_class, cache_name)).filter(**{
+        u'{}__in'.format(filter_field_name): [item.pk for item in items] })
+    item_pks_per_rel_item = {}
+    totals = {}
+    for rel_item_pk, item_pk in queryset.values_list('pk', filter_field_name):
+        item_pks_per_rel_item.setdefault(rel_item_pk, []).append(item_pk)
+        totals[item_pk] = totals.get(item_pk, 0) + 1
+    max = getMaxShownForPrefetchedTogether(
+        model_class, cache_name, getMagiCollection(to_cache.rel_collection_name))
+    values = { item.pk: [] for item in items }
+    if item_pks_per_rel_item:
+        # Same order as when the queryset gets filtered for each item
+        for rel_item in queryset:
+            item_pks = item_pks_per_rel_item.pop(rel_item.pk, None)
+            if not item_pks:
+                continue
+            value = to_rel_item_cache(rel_item)
+            for item_pk in item_pks:
+                if not max or len(values[item_pk]) < max:
+                    values[item_pk].append(value)
+    return {
+        item_pk: (value, totals.get(item_pk, 0))
+        for item_pk, value in values.items()
+    }
+
 def _addRelatedCaches_to_cache_fk(cache_name, fields, to_fields):
     def _to_cache(item):
         rel_item = getattr(item, cache_name)
@@ -3669,12 +3829,15 @@ def _addRelatedCaches_toTranslationsField(field_name):
         return item.get_all_translations_of_field(field_name, include_english=False, unique=True)
     return _to_field
 
-def updateAllRelatedCaches():
+def updateAllRelatedCaches(batched=True, chunk_size=500, workers=1):
     # /!\ Can't be called at global level
     for collection_name, collection in getMagiCollections().items():
         print collection_name
         try:
-            collection.queryset.model.update_all_related_caches_of_model(update_reverse_related_caches=False)
+            collection.queryset.model.update_all_related_caches_of_model(
+                update_reverse_related_caches=False,
+                batched=batched, chunk_size=chunk_size, workers=workers,
+            )
         except AttributeError:
             pass
 
@@ -3702,6 +3865,38 @@ class ColorInput(TextInput):
 class FilterByMode:
     Exact, Contains, StartsWith, EndsWith = range(4)
 
+def _translationIndexCondition(
+        model, field_name, language=None, value=None,
+        mode=FilterByMode.Exact, case_insensitive=False,
+        prefilter=None,
+):
+    from magi.models import TranslationIndex
+    i = 'i' if case_insensitive else ''
+    rows = TranslationIndex.objects_of_model(model).filter(field_name=field_name)
+    if prefilter is not None:
+        rows = rows.filter(item_id__in=model.objects.filter(prefilter).values_list('pk', flat=True))
+    if language:
+        rows = rows.filter(language=language)
+    if value is not None:
+        if mode == FilterByMode.Exact:
+            rows = rows.filter(**{
+                'normalized_value': TranslationIndex.normalize(value),
+                u'value__{}exact'.format(i): value,
+            })
+        elif mode == FilterByMode.StartsWith:
+            # A range rather than LIKE, so the index can be used with any database
+            normalized_value = TranslationIndex.normalize(value)
+            rows = rows.filter(**{
+                'normalized_value__gte': normalized_value,
+                'normalized_value__lt': normalized_value + u'\uffff',
+                u'value__{}startswith'.format(i): value,
+            })
+        elif mode == FilterByMode.Contains:
+            rows = rows.filter(**{ u'value__{}contains'.format(i): value })
+        elif mode == FilterByMode.EndsWith:
+            rows = rows.filter(**{ u'value__{}endswith'.format(i): value })
+    return Q(pk__in=rows.values_list('item_id', flat=True))
+
 def filterByTranslatedValue(
         queryset, field_name, language=None, value=None,
         mode=FilterByMode.Exact, case_insensitive=False,
@@ -3710,6 +3905,7 @@ def filterByTranslatedValue(
         strict=False, force_queryset=False,
         # only when language is not specified:
         include_english=True,
+        use_translation_index=True,
 ):
     """
     When mode is Contains or EndsWith:
@@ -3720,6 +3916,9 @@ def filterByTranslatedValue(
       Only in that specific case, you can use force_queryset to return a queryset,
       but it will be rebuilt from the result, which means the extra query can't
       be avoided.
+    When the field is in INDEXED_TRANSLATED_FIELDS of the model, the translation index
+    is used instead of the JSON of d_{field_name}s (unless use_translation_index is False):
+    results are always strict, and force_queryset returns the queryset without extra query.
     """
     def _return(condition=None):
         if as_condition:
@@ -3774,6 +3973,38 @@ def filterByTranslatedValue(
             elif modelHasField(queryset.model, short_source_field_name):
                 other_languages_fields.append(short_source_field_name)
 
+    # With the translation index
+    if (use_translation_index
+        and field_name in getattr(queryset.model, 'INDEXED_TRANSLATED_FIELDS', [])
+        and (value is None or isinstance(value, basestring))
+        and mode in [FilterByMode.Exact, FilterByMode.StartsWith, FilterByMode.Contains, FilterByMode.EndsWith]):
+        prefilter = None
+        if value is not None and mode in [FilterByMode.Contains, FilterByMode.EndsWith]:
+            # No index can be used to search in the middle of the values, so the JSON gets
+            # searched first and the index only checks the values of the language
+            prefilter = filterByTranslatedValue(
+                queryset, field_name, language=language, value=value,
+                mode=mode, case_insensitive=case_insensitive,
+                as_condition=True, include_english=False, use_translation_index=False,
+            )
+        condition = _translationIndexCondition(
+            queryset.model, field_name, language=language, value=value,
+            mode=mode, case_insensitive=case_insensitive, prefilter=prefilter,
+        )
+        if not language:
+            lookup = {
+                FilterByMode.Exact: u'{}',
+                FilterByMode.StartsWith: u'{}__%scontains' % i,
+                FilterByMode.Contains: u'{}__%scontains' % i,
+                FilterByMode.EndsWith: u'{}__%sendswith' % i,
+            }[mode]
+            for other_field_name in other_languages_fields:
+                condition |= Q(**{ lookup.format(other_field_name): value })
+        # Always strict, the index only contains the value of the language
+        if language and strict and not as_condition and not force_queryset:
+            return list(queryset.filter(condition))
+        return _return(condition)
+
     if isinstance(value, basestring):
         d_value = encode_basestring_ascii(value)[1:-1]
 
@@ -3841,6 +4072,181 @@ def filterByTranslatedValue(
 
     return _return()
 
+############################################################
+# Cached counts
+
+# Prefix of the keys in Django's cache, followed by the hash of the query
+CACHED_COUNT_KEY_PREFIX = 'magi_count:'
+
+def getCachedCount(queryset, timeout=300):
+    """
+    Returns the count of a queryset and whether it was just counted.
+    Kept in Django's cache (shared by all the processes) for timeout seconds per query (so per filters),
+    so a count that comes from the cache may be outdated.
+    """
+    try:
+        query = unicode(queryset.query)
+    except EmptyResultSet:
+        return 0, True
+    key = CACHED_COUNT_KEY_PREFIX + hashlib.md5(query.encode('utf-8')).hexdigest()
+    count = cache.get(key, None)
+    if count is not None:
+        return count, False
+    count = queryset.count()
+    cache.set(key, count, timeout)
+    return count, True
+
+############################################################
+# Keyset pagination
+
+def getKeysetOrdering(queryset, allowed_fields):
+    """
+    Returns [(field, descending), ...] for the ordering of the queryset, with the pk at the end,
+    or None when the ordering isn't only on allowed_fields (so keyset pagination can't be used).
+    """
+    model = queryset.model
+    ordering = []
+    for field_name in queryset.query.order_by or model._meta.ordering:
+        descending = field_name.startswith('-')
+        field_name = field_name.lstrip('-')
+        if field_name == 'pk':
+            field_name = model._meta.pk.name
+        if field_name not in allowed_fields and field_name != model._meta.pk.name:
+            return None
+        field = modelGetField(model, field_name)
+        if not field:
+            return None
+        ordering.append((field, descending))
+        if field.primary_key:
+            return ordering
+    return ordering + [(model._meta.pk, ordering[-1][1] if ordering else False)]
+
+def getKeysetCursor(item, keyset_ordering):
+    """
+    Returns an opaque string with the values of the ordering fields of the item, used to get the
+    items that come after it.
+    """
+    values = []
+    for field, descending in keyset_ordering:
+        value = getattr(item, field.attname)
+        values.append(value.isoformat() if isinstance(value, (datetime.datetime, datetime.date)) else value)
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+def _nullsComeLast(descending):
+    # SQLite and MySQL consider NULL smaller than any value, PostgreSQL and Oracle bigger
+    nulls_are_smaller = connection.vendor in ['sqlite', 'mysql']
+    return descending == nulls_are_smaller
+
+def getKeysetCondition(keyset_ordering, cursor):
+    """
+    Returns a condition (Q) to get the items that come after the cursor, or None if the cursor is invalid.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        if not isinstance(values, list) or len(values) != len(keyset_ordering):
+            return None
+        values = [
+            None if value is None else field.to_python(value)
+            for (field, descending), value in zip(keyset_ordering, values)
+        ]
+    except (TypeError, ValueError, ValidationError):
+        return None
+    # (a > x) or (a = x and b > y) or (a = x and b = y and pk > z)
+    conditions = []
+    equal = Q()
+    for (field, descending), value in zip(keyset_ordering, values):
+        if value is None:
+            # Nothing after NULL when NULLs come last
+            if not _nullsComeLast(descending):
+                conditions.append(equal & Q(**{ u'{}__isnull'.format(field.name): False }))
+            equal &= Q(**{ u'{}__isnull'.format(field.name): True })
+        else:
+            after = Q(**{ u'{}__{}'.format(field.name, 'lt' if descending else 'gt'): value })
+            if field.null and _nullsComeLast(descending):
+                after |= Q(**{ u'{}__isnull'.format(field.name): True })
+            conditions.append(equal & after)
+            equal &= Q(**{ field.name: value })
+    condition = reduce(operator.or_, conditions)
+    # Redundant, but lets the database use an index on the first field
+    field, descending = keyset_ordering[0]
+    if values[0] is not None and not (field.null and _nullsComeLast(descending)):
+        condition = Q(**{ u'{}__{}'.format(field.name, 'lte' if descending else 'gte'): values[0] }) & condition
+    return condition
+
+############################################################
+# Random items
+
+# { query: (expiration, [pks]) }
+_random_pools = {}
+RANDOM_POOLS_MAX = 100
+
+def _getFirstPk(queryset, ordering='pk'):
+    pks = list(queryset.order_by(ordering).values_list('pk', flat=True)[:1])
+    return pks[0] if pks else None
+
+def _getRandomItemWithPk(queryset, min_pk, max_pk):
+    """
+    Picks a random pk between min_pk and max_pk and returns the first item from there.
+    Doesn't need to count, but the items that come after gaps in the pks are more likely.
+    """
+    random_pk = random.randint(min_pk, max_pk)
+    items = list(queryset.filter(pk__gte=random_pk).order_by('pk')[:1])
+    if not items: # Deleted in the meantime
+        items = list(queryset.filter(pk__lt=random_pk).order_by('-pk')[:1])
+    return items[0] if items else None
+
+def _getRandomPool(queryset, pool_size, pool_timeout):
+    try:
+        key = unicode(queryset.values_list('pk', flat=True).query)
+    except EmptyResultSet:
+        return None, []
+    now = timezone.now()
+    expiration, pks = _random_pools.get(key, (None, None))
+    if expiration is None or expiration < now:
+        if len(_random_pools) >= RANDOM_POOLS_MAX:
+            for other_key, (other_expiration, other_pks) in _random_pools.items():
+                if other_expiration < now:
+                    del(_random_pools[other_key])
+            if len(_random_pools) >= RANDOM_POOLS_MAX:
+                _random_pools.clear()
+        pks = list(queryset.order_by('?').values_list('pk', flat=True)[:pool_size])
+        _random_pools[key] = (now + datetime.timedelta(seconds=pool_timeout), pks)
+    return key, pks
+
+def getRandomItem(queryset, small_count=1000, pool_size=None, pool_timeout=3600):
+    """
+    Returns a random item of the queryset or None, without sorting the whole table like order_by('?').
+    - Queryset without filters: random pk between the first and last pks
+    - Filtered queryset with up to small_count items: count + random offset
+    - Bigger filtered queryset: first item that matches after a random pk between the first
+      and last pks that match
+    When pool_size is specified, the pks of pool_size random items of the queryset are kept in
+    memory for pool_timeout seconds and the item is picked in them.
+    """
+    if pool_size:
+        key, pks = _getRandomPool(queryset, pool_size, pool_timeout)
+        if pks:
+            items = list(queryset.filter(pk=random.choice(pks))[:1])
+            if items:
+                return items[0]
+            # Deleted in the meantime: get a new pool next time
+            _random_pools.pop(key, None)
+    if queryset.query.where.children:
+        total = queryset.order_by().count()
+        if not total:
+            return None
+        if total <= small_count:
+            # No need to order: any order works to get a random item
+            offset = random.randrange(total)
+            items = list(queryset.order_by()[offset:offset + 1])
+            if items:
+                return items[0]
+    # Pks of the items that match, so clustered items don't make most picks miss
+    min_pk = _getFirstPk(queryset)
+    if min_pk is None:
+        return None
+    return _getRandomItemWithPk(queryset, min_pk, _getFirstPk(queryset, ordering='-pk'))
+
 ############################################################
 # Model / Form fields
 
@@ -4643,7 +5049,7 @@ def imageResizeScaleFromData(data, filename, width=None, height=None, return_dat
         return image
     return _imageProcessing(data, filename, _toThumbnail, return_data=return_data)
 
-def shrinkImageFromData(data, filename, settings={}):
+def shrinkImageFromData(data, filename, settings={}, return_data=False):
     """
     Optimize images with TinyPNG
     """
@@ -4651,6 +5057,8 @@ def shrinkImageFromData(data, filename, settings={}):
     extension = extension.lower()
     api_key = getattr(django_settings, 'TINYPNG_API_KEY', None)
     if not api_key or extension not in ['.png', '.jpg', '.jpeg']:
+        if return_data:
+            return data, dataToImageFile(data)
         return dataToImageFile(data)
     tinify.key = api_key
     source = tinify.from_buffer(data)
@@ -4714,6 +5122,8 @@ def shrinkImageFromData(data, filename, settings={}):
             data = tinify.from_buffer(data).to_buffer()
         except: # Just return the original data
             pass
+    if return_data:
+        return data, dataToImageFile(data)
     return dataToImageFile(data)
 
 def localImageToImageFile(path, return_data=False):
@@ -4785,8 +5195,23 @@ def imageURLToImageFile(url, return_data=False, request_options={}):
         return image.read(), image
     return image
 
-def saveImageURLToModel(item, field_name, url, return_data=False, request_options={}):
-    data, image = imageURLToImageFile(url, return_data=True, request_options=request_options)
+def clearProcessedImages(item, field_name):
+    """
+    Remove any cached processed image, after the image changed.
+    """
+    setattr(item, u'_tthumbnail_{}'.format(field_name), None)
+    setattr(item, u'_thumbnail_{}'.format(field_name), None)
+    setattr(item, u'_original_{}'.format(field_name), None)
+    setattr(item, u'_2x_{}'.format(field_name), None)
+
+def saveImageURLToModel(item, field_name, url, return_data=False, request_options={}, image=None):
+    """
+    image: already downloaded file (ex: ContentFile), the url is then only used for the filename.
+    """
+    if image is None:
+        data, image = imageURLToImageFile(url, return_data=True, request_options=request_options)
+    else:
+        data = None
     if not image:
         if return_data:
             return None, None
@@ -4794,11 +5219,7 @@ def saveImageURLToModel(item, field_name, url, return_data=False, request_option
     filename = url.split('/')[-1].split('\\')[-1]
     image.name = item._meta.model._meta.get_field(field_name).upload_to(item, filename)
     setattr(item, field_name, image)
-    # Remove any cached processed image
-    setattr(item, u'_tthumbnail_{}'.format(field_name), None)
-    setattr(item, u'_thumbnail_{}'.format(field_name), None)
-    setattr(item, u'_original_{}'.format(field_name), None)
-    setattr(item, u'_2x_{}'.format(field_name), None)
+    clearProcessedImages(item, field_name)
     if return_data:
         return (data, image)
     return image
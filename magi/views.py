@@ -16,7 +16,8 @@ from django.utils.safestring import mark_safe
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.utils.http import urlquote
 from django.utils import timezone
-from django.db.models import Count, Prefetch, Q
+from django.db.models import Count, Prefetch, Q, F
+from django.db import connection, transaction, IntegrityError
 from magi.middleware.httpredirect import HttpRedirectException
 from magi.forms import (
     CreateUserForm,
@@ -1400,38 +1401,77 @@ def _shouldBumpActivity(activity, request):
         return True
     return False
 
+def _updateActivityTotalLikes(activity, difference, **fields):
+    """
+    Adds difference to _cache_total_likes in the database, without counting the likes again.
+    Only counts when the total was never counted. Returns the new total.
+    """
+    total_likes = activity._cache_total_likes
+    if total_likes is None or total_likes + difference < 0:
+        total_likes = activity.to_cache_total_likes()
+        fields['_cache_total_likes'] = total_likes
+    else:
+        total_likes += difference
+        fields['_cache_total_likes'] = F('_cache_total_likes') + difference
+    models.Activity.objects.filter(pk=activity.pk).update(**fields)
+    activity._cache_total_likes = total_likes
+    return total_likes
+
+def _addActivityLike(activity, user):
+    """
+    Returns whether the like got added, False when it was already there (ex: liked in another request).
+    """
+    try:
+        with transaction.atomic():
+            models.Activity.likes.through.objects.create(activity_id=activity.pk, user_id=user.pk)
+    except IntegrityError:
+        return False
+    return True
+
+def _removeActivityLike(activity, user):
+    """
+    Returns whether the like got removed, False when it was already gone (ex: unliked in another request).
+    """
+    # QuerySet.delete doesn't return the number of deleted rows
+    field = models.Activity._meta.get_field('likes')
+    cursor = connection.cursor()
+    cursor.execute(u'DELETE FROM {table} WHERE {activity} = %s AND {user} = %s'.format(
+        table=connection.ops.quote_name(field.m2m_db_table()),
+        activity=connection.ops.quote_name(field.m2m_column_name()),
+        user=connection.ops.quote_name(field.m2m_reverse_name()),
+    ), [activity.pk, user.pk])
+    return cursor.rowcount > 0
+
 def likeactivity(request, context, pk):
     if request.method != 'POST':
         raise PermissionDenied()
-    activity = get_object_or_404(models.Activity.objects.extra(select={
-        'liked': 'SELECT COUNT(*) FROM magi_activity_likes WHERE activity_id = magi_activity.id AND user_id={}'.format(request.user.id),
-    }).annotate(total_likes=Count('likes')).select_related('owner', 'owner__preferences'), pk=pk)
+    activity = get_object_or_404(models.Activity.objects.select_related('owner', 'owner__preferences'), pk=pk)
     # If the owner of the liked activity blocked the authenticated user
     if activity.cached_owner.id in request.user.preferences.cached_blocked_by_ids:
         raise PermissionDenied()
     if activity.cached_owner.username == request.user.username:
         raise PermissionDenied()
-    if 'like' in request.POST and not activity.liked:
+    liked = activity.likes.filter(pk=request.user.pk).exists()
+    # Total likes shown in the page include the owner, hence the + 1
+    # The total only changes when the like row actually got added or removed, so it can't drift
+    if 'like' in request.POST and not liked and _addActivityLike(activity, request.user):
+        fields = {}
         if _shouldBumpActivity(activity, request):
-            activity.last_bump = timezone.now()
-        activity.likes.add(request.user)
-        activity.update_cache('total_likes')
-        activity.save()
+            fields['last_bump'] = timezone.now()
+        total_likes = _updateActivityTotalLikes(activity, 1, **fields)
         pushNotification(activity.owner, 'like-archive' if activity.archived_by_owner else 'like', [unicode(request.user), unicode(activity)], url_values=[str(activity.id), tourldash(unicode(activity))], image=activity.image)
         return {
-            'total_likes': activity.total_likes + 2,
+            'total_likes': total_likes + 1,
             'result': 'liked',
         }
-    if 'unlike' in request.POST and activity.liked:
-        activity.likes.remove(request.user)
-        activity.update_cache('total_likes')
-        activity.save()
+    if 'unlike' in request.POST and liked and _removeActivityLike(activity, request.user):
+        total_likes = _updateActivityTotalLikes(activity, -1)
         return {
-            'total_likes': activity.total_likes,
+            'total_likes': total_likes + 1,
             'result': 'unliked',
         }
     return {
-        'total_likes': activity.total_likes + 1,
+        'total_likes': activity.cached_total_likes + 1,
     }
 
 def archiveactivity(request, context, pk):
@@ -34,6 +34,11 @@ from magi.utils import (
     getOwnerFromItem,
     markSafeFormat,
     getGetStartedDetails,
+    getRandomItem,
+    getCachedCount,
+    getKeysetOrdering,
+    getKeysetCursor,
+    getKeysetCondition,
 )
 from magi.forms import ConfirmDelete, filter_ids
 
@@ -46,6 +51,30 @@ def _redirect_on_high_traffic(view, request, ajax=False):
         and not request.user.is_authenticated()):
         raise HttpRedirectException(u'{}/hightraffic/'.format('/ajax' if ajax else ''))
 
+def _paginate(queryset, page, page_size, total_results=None, after_cursor=False, count_queryset=None, total_results_is_exact=True):
+    """
+    Returns the items of the page (queryset or list), the total and whether the total is exact.
+    When total_results is None, retrieves one more item to know if there's a next page instead
+    of counting, and the total is only the minimum.
+    When total_results is not exact (count from the cache), it's an estimate: also retrieves one more
+    item, and the total is exact on the last page.
+    When the page is empty (page after the last one), counts the total.
+    after_cursor: the queryset already starts after the last item of the previous page (keyset pagination)
+    count_queryset: queryset without the cursor condition, to count the total after a cursor
+    """
+    start = page * page_size
+    offset = 0 if after_cursor else start
+    if total_results is not None and total_results_is_exact:
+        return queryset[offset:(offset + page_size)], total_results, True
+    items = list(queryset[offset:(offset + page_size + 1)])
+    if len(items) > page_size:
+        return items[:page_size], max(start + len(items), total_results or 0), False
+    if not items and page > 0:
+        if after_cursor and count_queryset is None:
+            return items, start, False
+        return items, (queryset if count_queryset is None else count_queryset).count(), True
+    return items, start + len(items), True
+
 def _get_share_image(context, collection_view, item=None):
     return staticImageURL(collection_view.share_image(context, item), full=True)
 
@@ -241,9 +270,12 @@ def random_view(request, name, collection, ajax=False, extra_filters={}, shortcu
     if hasattr(filter_form, 'filter_queryset'):
         queryset = filter_form.filter_queryset(queryset, filters, request)
 
-    try:
-        random_item = queryset.order_by('?')[0]
-    except IndexError:
+    random_item = getRandomItem(
+        queryset,
+        pool_size=collection.list_view.random_pool_size,
+        pool_timeout=collection.list_view.random_pool_timeout,
+    )
+    if not random_item:
         raise HttpRedirectException(collection.get_list_url(
             ajax=ajax, modal_only=ajax, parameters=filters,
         ))
@@ -457,7 +489,11 @@ def list_view(request, name, collection, ajax=False, extra_filters={}, shortcut_
         ordering = ordering_fields
 
     # Apply order_by
-    queryset = queryset.order_by(*ordering)
+    # When searching with the search backend without choosing an ordering, most relevant first
+    if not filters.get('ordering', None) and 'search_rank' in queryset.query.extra_select:
+        queryset = queryset.order_by(*([u'-search_rank'] + ordering))
+    else:
+        queryset = queryset.order_by(*ordering)
 
     context['ordering'] = ordering
 
@@ -506,15 +542,16 @@ def list_view(request, name, collection, ajax=False, extra_filters={}, shortcut_
     ######################
     # Total
 
-    context['total_results'] = queryset.count()
-
-    if context['total_results'] == 1:
-        context['total_results_sentence'] = _('1 {object} matches your search:').format(
-            object=collection.title.lower())
+    count_strategy = collection.list_view.count_strategy
+    total_results_is_exact = True
+    if count_strategy == 'has_next_page':
+        # Known after retrieving the items of the page, see pagination below
+        context['total_results'] = None
+    elif count_strategy == 'cached':
+        context['total_results'], total_results_is_exact = getCachedCount(
+            queryset, timeout=collection.list_view.count_cache_timeout)
     else:
-        context['total_results_sentence'] = _('{total} {objects} match your search:').format(
-            total=context['total_results'], objects=collection.plural_title.lower(),
-        )
+        context['total_results'] = queryset.count()
 
     ######################
     # Pagination
@@ -550,23 +587,55 @@ def list_view(request, name, collection, ajax=False, extra_filters={}, shortcut_
             page = 0
 
     unpaginated_queryset = queryset
-    queryset = queryset[(page * page_size):((page * page_size) + page_size)]
+
+    # Keyset pagination: when a cursor is given, starts after the last item of the previous page
+    keyset_ordering = None
+    after_cursor = False
+    if collection.list_view.keyset_pagination_fields:
+        keyset_ordering = getKeysetOrdering(queryset, collection.list_view.keyset_pagination_fields)
+    if keyset_ordering:
+        queryset = queryset.order_by(*[
+            u'{}{}'.format('-' if descending else '', field.name)
+            for field, descending in keyset_ordering
+        ])
+        unpaginated_queryset = queryset
+        if page > 0 and filters.get('cursor', None):
+            condition = getKeysetCondition(keyset_ordering, filters['cursor'])
+            if condition is not None:
+                queryset = queryset.filter(condition)
+                after_cursor = True
 
     context['page'] = page + 1
+    queryset, context['total_results'], context['total_results_is_exact'] = _paginate(
+        queryset, page, page_size, total_results=context['total_results'], after_cursor=after_cursor,
+        count_queryset=unpaginated_queryset if after_cursor else None, total_results_is_exact=total_results_is_exact)
     context['total_pages'] = int(math.ceil(context['total_results'] / page_size))
     context['is_last_page'] = context['page'] == context['total_pages']
 
+    if context['total_results_is_exact']:
+        if context['total_results'] == 1:
+            context['total_results_sentence'] = _('1 {object} matches your search:').format(
+                object=collection.title.lower())
+        else:
+            context['total_results_sentence'] = _('{total} {objects} match your search:').format(
+                total=context['total_results'], objects=collection.plural_title.lower(),
+            )
+
     page_buttons = [(0, 'active' if page == 0 else None)]
     if page > 2:
         page_buttons.append((-1, 'disabled'))
     if (page - 1) > 0:
         page_buttons.append((page - 1, None))
     page_buttons.append((page, 'active'))
-    if (page + 1) < (context['total_pages'] - 1):
+    if not context['total_results_is_exact']:
+        # The last page is unknown
         page_buttons.append((page + 1, None))
-    if page < (context['total_pages'] - 3):
-        page_buttons.append((-2, 'disabled'))
-    page_buttons.append((context['total_pages'] - 1, 'active' if page == (context['total_pages'] - 1) else None))
+    else:
+        if (page + 1) < (context['total_pages'] - 1):
+            page_buttons.append((page + 1, None))
+        if page < (context['total_pages'] - 3):
+            page_buttons.append((-2, 'disabled'))
+        page_buttons.append((context['total_pages'] - 1, 'active' if page == (context['total_pages'] - 1) else None))
     context['displayed_page_buttons'] = listUnique(page_buttons)
     if request.path and request.path != '/':
         context['next_page_url'] = u'/ajax{}'.format(request.path)
@@ -604,7 +673,8 @@ def list_view(request, name, collection, ajax=False, extra_filters={}, shortcut_
             for key, values in filters.items_as_lists()
             if key != 'ajax_modal_only'
         ])
-        context['remaining'] = context['total_results'] - page_size
+        if context['total_results_is_exact']:
+            context['remaining'] = context['total_results'] - page_size
 
     # ajax_show_top_buttons will still show top buttons at the top, first page only
     context['ajax_show_top_buttons'] = ajax and 'ajax_show_top_buttons' in filters and page == 0
@@ -767,6 +837,10 @@ def list_view(request, name, collection, ajax=False, extra_filters={}, shortcut_
     # Go through each item
 
     context['items'] = list(queryset)
+    if collection.list_view.collectibles_totals_per_page:
+        collection.set_collectibles_totals(collection.list_view, request, context['items'])
+    if keyset_ordering and context['items']:
+        context['next_cursor'] = getKeysetCursor(context['items'][-1], keyset_ordering)
     previous_item = None
 
     for i, item in enumerate(context['items']):
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_activity_likes
+"""
+import sys, StringIO, datetime
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from magi.urls import *
+from magi import urls, views
+from magi import models as magi_models
+from magi.utils import tourldash
+from magi.notifications import pushNotification
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 20000
+TOTAL_USERS = 20
+PAGE_SIZE = 30
+
+def oldLikeActivity(request, context, pk):
+    """
+    likeactivity before likes got counted with _cache_total_likes arithmetic.
+    """
+    activity = magi_models.Activity.objects.extra(select={
+        'liked': 'SELECT COUNT(*) FROM magi_activity_likes WHERE activity_id = magi_activity.id AND user_id={}'.format(request.user.id),
+    }).annotate(total_likes=Count('likes')).select_related('owner', 'owner__preferences').get(pk=pk)
+    if activity.cached_owner.id in request.user.preferences.cached_blocked_by_ids:
+        return None
+    if 'like' in request.POST and not activity.liked:
+        if views._shouldBumpActivity(activity, request):
+            activity.last_bump = timezone.now()
+        activity.likes.add(request.user)
+        activity.update_cache('total_likes')
+        activity.save()
+        pushNotification(activity.owner, 'like-archive' if activity.archived_by_owner else 'like', [unicode(request.user), unicode(activity)], url_values=[str(activity.id), tourldash(unicode(activity))], image=activity.image)
+        return { 'total_likes': activity.total_likes + 2, 'result': 'liked' }
+    if 'unlike' in request.POST and activity.liked:
+        activity.likes.remove(request.user)
+        activity.update_cache('total_likes')
+        activity.save()
+        return { 'total_likes': activity.total_likes, 'result': 'unliked' }
+    return { 'total_likes': activity.total_likes + 1 }
+
+class ActivityLikesBenchmark(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.users = []
+        for i in range(TOTAL_USERS):
+            user = models.User.objects.create(username=u'user{}'.format(i))
+            user.preferences = magi_models.UserPreferences.objects.create(user=user)
+            self.users.append(user)
+        now = timezone.now()
+        magi_models.Activity.objects.bulk_create([
+            magi_models.Activity(
+                owner=self.users[0], m_message=u'Hello {}'.format(i),
+                last_bump=now - datetime.timedelta(minutes=i), _cache_total_likes=0)
+            for i in range(TOTAL_ITEMS)
+        ])
+        Through = magi_models.Activity.likes.through
+        Through.objects.bulk_create([
+            Through(activity_id=pk, user_id=user.pk)
+            for pk in magi_models.Activity.objects.values_list('pk', flat=True)
+            for user in self.users[1:(pk % 10) + 1]
+        ])
+        for activity in magi_models.Activity.objects.annotate(total=Count('likes')):
+            magi_models.Activity.objects.filter(pk=activity.pk).update(_cache_total_likes=activity.total)
+        self.collection = urls.collections['activity']
+        self.user = self.users[3]
+        self.activity = magi_models.Activity.objects.order_by('pk')[0]
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def getRequest(self, data={}):
+        request = RequestFactory().post('/ajax/likeactivity/', data)
+        request.user = self.user
+        return request
+
+    def _feed(self, after_slicing):
+        request = self.getRequest()
+        def _function():
+            queryset = magi_models.Activity.objects.order_by('-last_bump')
+            if after_slicing:
+                activities = list(queryset[:PAGE_SIZE])
+                self.collection._set_liked(request, activities)
+            else:
+                activities = list(queryset.extra(select={
+                    'liked': 'SELECT COUNT(*) FROM magi_activity_likes WHERE activity_id = magi_activity.id AND user_id = {}'.format(self.user.id),
+                })[:PAGE_SIZE])
+            return [bool(activity.liked) for activity in activities]
+        return _function
+
+    def _like(self, view):
+        def _function():
+            view(self.getRequest({ 'like': '' }), {}, self.activity.pk)
+            view(self.getRequest({ 'unlike': '' }), {}, self.activity.pk)
+        return _function
+
+    def countQueries(self, function):
+        with CaptureQueriesContext(connection) as context:
+            function()
+        return len(context.captured_queries)
+
+    def test_activity_likes(self):
+        self.assertEqual(self._feed(True)(), self._feed(False)())
+        self.assertEqual(oldLikeActivity(self.getRequest(), {}, self.activity.pk), views.likeactivity(
+            self.getRequest(), {}, self.activity.pk))
+        results = []
+        for label, function in [
+                (u'Feed page: liked subquery per row', self._feed(False)),
+                (u'Feed page: liked after slicing', self._feed(True)),
+                (u'Like + unlike: recount', self._like(oldLikeActivity)),
+                (u'Like + unlike: F() update', self._like(views.likeactivity)),
+        ]:
+            results.append((u'{} ({} queries)'.format(label, self.countQueries(function)), benchmark(function, number=10)))
+        sys.stdout = self.stdout
+        printBenchmark(u'Activities liked by the authenticated user ({} activities)'.format(TOTAL_ITEMS), results)
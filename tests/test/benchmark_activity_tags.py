@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_activity_tags
+"""
+from django.test import TestCase
+from magi import models as magi_models
+from magi.utils import join_data
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 20000
+TAGS = [u'comedy', u'meme', u'cosplay', u'fanart', u'news', u'staff', u'contest', u'season-summer']
+RARE_TAG = u'contest-winner'
+
+class ActivityTagsBenchmark(TestCase):
+    def setUp(self):
+        user = models.User.objects.create(username='abc')
+        magi_models.Activity.objects.bulk_create([
+            magi_models.Activity(owner=user, m_message=u'Hello', c_tags=join_data(*[
+                tag for j, tag in enumerate(TAGS) if i % (j + 2) == 0
+            ] + ([RARE_TAG] if i % 1000 == 0 else []))) for i in range(TOTAL_ITEMS)
+        ])
+        magi_models.rebuildActivityTags()
+        self.queryset = magi_models.Activity.objects.order_by('pk')
+
+    def _filter(self, tags, indexed):
+        def _function():
+            if indexed:
+                queryset = magi_models.filterActivitiesWithTags(self.queryset, tags)
+            else:
+                queryset = self.queryset
+                for tag in tags:
+                    queryset = queryset.filter(c_tags__contains=u'"{}"'.format(tag))
+            return list(queryset.values_list('pk', flat=True)[:30])
+        return _function
+
+    def _exclude(self, tags, indexed):
+        def _function():
+            if indexed:
+                queryset = magi_models.excludeActivitiesWithTags(self.queryset, tags)
+            else:
+                queryset = self.queryset
+                for tag in tags:
+                    queryset = queryset.exclude(c_tags__contains=u'"{}"'.format(tag))
+            return list(queryset.values_list('pk', flat=True)[:30])
+        return _function
+
+    def _count(self, indexed):
+        def _function():
+            if indexed:
+                return magi_models.countActivitiesPerTag(TAGS)
+            return {
+                tag: self.queryset.filter(c_tags__contains=u'"{}"'.format(tag)).count()
+                for tag in TAGS
+            }
+        return _function
+
+    def test_activity_tags(self):
+        for tags in [[u'season-summer'], [u'news', u'contest'], [RARE_TAG]]:
+            self.assertEqual(self._filter(tags, True)(), self._filter(tags, False)())
+            printBenchmark(u'Filter {} activities by tags: {}'.format(TOTAL_ITEMS, u', '.join(tags)), [
+                (u'c_tags__contains', benchmark(self._filter(tags, False), number=5)),
+                (u'Activity tags', benchmark(self._filter(tags, True), number=5)),
+            ])
+        tags = [u'comedy', u'meme', u'cosplay']
+        self.assertEqual(self._exclude(tags, True)(), self._exclude(tags, False)())
+        printBenchmark(u'Exclude hidden tags from {} activities'.format(TOTAL_ITEMS), [
+            (u'c_tags__contains', benchmark(self._exclude(tags, False), number=5)),
+            (u'Activity tags', benchmark(self._exclude(tags, True), number=5)),
+        ])
+        self.assertEqual(self._count(True)(), self._count(False)())
+        printBenchmark(u'Count {} activities per tag'.format(TOTAL_ITEMS), [
+            (u'c_tags__contains', benchmark(self._count(False), number=5)),
+            (u'Activity tags', benchmark(self._count(True), number=5)),
+        ])
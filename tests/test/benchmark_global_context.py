@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_global_context
+"""
+from django.test import TestCase
+from magi.urls import * # unused, just to make sure raw_context is updated
+from magi import utils
+from test.test_utils_global_context import getRequest
+from test.benchmark_utils import benchmark, printBenchmark
+
+class GlobalContextBenchmark(TestCase):
+    def _cold(self, function):
+        def _function():
+            utils.resetStaticGlobalContexts()
+            function()
+        return _function
+
+    def test_globalContext(self):
+        request = getRequest()
+        page = lambda: utils.globalContext(request)
+        email = lambda: utils.globalContext(email=True)
+        results = [
+            (u'Page (computed every time)', benchmark(self._cold(page))),
+            (u'Page (static part memoized)', benchmark(page)),
+            (u'Email (computed every time)', benchmark(self._cold(email))),
+            (u'Email (static part memoized)', benchmark(email)),
+        ]
+        printBenchmark(u'globalContext', results)
+        print
+        for label, seconds in results:
+            print u'  {:<40} {:>12.0f} calls/s'.format(label, 1 / seconds)
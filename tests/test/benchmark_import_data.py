@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_import_data
+"""
+import json, shutil, tempfile
+from django.test import TestCase
+from magi.import_data import import_from_json
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 2000
+
+def log(*args):
+    pass
+
+class ImportDataBenchmark(TestCase):
+    def setUp(self):
+        models.User.objects.create(username='abc', is_superuser=True)
+        self.folder = tempfile.mkdtemp() + '/'
+        self.details = {
+            'model': models.Idol,
+            'unique_fields': ['name'],
+            'fields': ['japanese_name'],
+            'mapping': { 'english_name': ['en', 'd_names'] },
+        }
+        with open(self.folder + 'idols.json', 'w') as f:
+            f.write(json.dumps([
+                { 'name': u'Idol {}'.format(i), 'japanese_name': u'アイドル {}'.format(i), 'english_name': u'Idol #{}'.format(i) }
+                for i in range(TOTAL_ITEMS)
+            ]))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _import(self, delete=False, **kwargs):
+        def _function():
+            if delete:
+                models.Idol.objects.all().delete()
+            import_from_json(self.folder, 'idols', self.details, log_function=log, **kwargs)
+        return _function
+
+    def test_import(self):
+        printBenchmark(u'import_from_json ({} items)'.format(TOTAL_ITEMS), [
+            (u'Create (save_item)', benchmark(self._import(delete=True), number=3)),
+            (u'Create (batched)', benchmark(self._import(delete=True, batched=True), number=3)),
+            (u'Nothing changed (save_item)', benchmark(self._import(), number=3)),
+            (u'Nothing changed (batched)', benchmark(self._import(batched=True), number=3)),
+        ])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_item_model
+"""
+from django.test import TestCase
+from magi.item_model import CachedItem, reset_attribute_resolvers
+from magi.utils import cacheRelExtra
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 500
+
+class ItemModelGetAttrBenchmark(TestCase):
+    def setUp(self):
+        user = models.User.objects.create(username='abc')
+        idol = models.Idol.objects.create(owner=user, name=u'Deby', image=u'idols/deby.png')
+        self.gachas = [
+            models.Gacha(
+                owner=user, name=u'Gacha {}'.format(i), image=u'gacha/image.png',
+                i_attribute=i % 3, i_power=i % 3, i_super_power=i % 3, i_rarity=i % 3,
+            ) for i in range(TOTAL_ITEMS)
+        ]
+        card = models.Card.objects.create(owner=user, idol=idol)
+        card.update_cache('idol')
+        card.update_cache('idol_name')
+        card.update_cache('gacha_ids')
+        card.save()
+        self.cards = list(models.Card.objects.all()) * TOTAL_ITEMS
+
+    def _access_gachas(self):
+        for gacha in self.gachas:
+            gacha.attribute, gacha.t_attribute, gacha.t_power, gacha.super_power
+            gacha.rarity, gacha.t_rarity, gacha.has_rarity, gacha.image_url, gacha.http_image_url
+            getattr(gacha, 'display_name_in_list', None)
+
+    def _access_cards(self):
+        for card in self.cards:
+            card.cached_idol_name, card.cached_gacha_ids
+            getattr(card, 'top_image_list', None)
+
+    def _cold(self, function):
+        def _function():
+            reset_attribute_resolvers()
+            function()
+        return _function
+
+    def test_getattr(self):
+        printBenchmark(u'BaseMagiModel.__getattr__ ({} items, 10 attributes each)'.format(TOTAL_ITEMS), [
+            (u'Gacha (resolved every time)', benchmark(self._cold(self._access_gachas), number=20)),
+            (u'Gacha (resolved once per class)', benchmark(self._access_gachas, number=20)),
+        ])
+        printBenchmark(u'BaseMagiModel.__getattr__ ({} items, 3 cached attributes each)'.format(TOTAL_ITEMS), [
+            (u'Card (resolved every time)', benchmark(self._cold(self._access_cards), number=20)),
+            (u'Card (resolved once per class)', benchmark(self._access_cards, number=20)),
+        ])
+
+class CachedItemGetAttrBenchmark(TestCase):
+    def _cached_gachas(self):
+        # Cached items are rebuilt from JSON for every request
+        return [
+            cacheRelExtra({
+                'id': i,
+                'name': u'Gacha {}'.format(i),
+                'image': u'gacha/image.png',
+                'i_attribute': i % 3,
+                'i_rarity': i % 3,
+            }, CachedItem, model_class=models.Gacha)
+            for i in range(100)
+        ]
+
+    def _access(self):
+        for gacha in self._cached_gachas():
+            gacha.attribute, gacha.t_attribute, gacha.rarity, gacha.t_rarity, gacha.has_rarity
+            gacha.t_name, gacha.image_url, gacha.http_image_url, gacha.ATTRIBUTE_CHOICES
+            getattr(gacha, 'something', None)
+
+    def _cold(self):
+        reset_attribute_resolvers()
+        self._access()
+
+    def test_getattr(self):
+        printBenchmark(u'CachedItem.__getattr__ (100 cached items, 10 attributes each)', [
+            (u'Resolved every time', benchmark(self._cold, number=100)),
+            (u'Resolved once per model class', benchmark(self._access, number=100)),
+        ])
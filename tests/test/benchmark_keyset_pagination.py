@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_keyset_pagination
+"""
+from django.test import TestCase
+from magi.utils import getKeysetOrdering, getKeysetCursor, getKeysetCondition
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 50000
+PAGE_SIZE = 12
+
+class KeysetPaginationBenchmark(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create(username='abc')
+        models.Idol.objects.bulk_create([
+            models.Idol(owner=self.user, name=u'Idol {:05d}'.format(i))
+            for i in range(TOTAL_ITEMS)
+        ])
+
+    def test_deep_page(self):
+        queryset = models.Idol.objects.order_by('-name', '-id')
+        keyset_ordering = getKeysetOrdering(queryset, ['name'])
+        for page in [1, 100, 3000]:
+            start = page * PAGE_SIZE
+            cursor = getKeysetCursor(queryset[start - 1], keyset_ordering)
+            self.assertEqual(
+                list(queryset[start:(start + PAGE_SIZE)]),
+                list(queryset.filter(getKeysetCondition(keyset_ordering, cursor))[:PAGE_SIZE]),
+            )
+            printBenchmark(u'Page {} ({} items)'.format(page + 1, TOTAL_ITEMS), [
+                (u'Offset', benchmark(lambda: list(queryset[start:(start + PAGE_SIZE)]), number=10)),
+                (u'Keyset', benchmark(lambda: list(queryset.filter(
+                    getKeysetCondition(keyset_ordering, cursor))[:PAGE_SIZE]), number=10)),
+            ])
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_magicollections_queryset
+"""
+from django.test import TestCase
+from magi.utils import resetQuerysetsOfRelatedItems
+from test import models
+from test.test_magicollections_queryset import View, registerCollections, unregisterCollections
+from test.benchmark_utils import benchmark, printBenchmark
+
+class CollectionGetQuerysetBenchmark(TestCase):
+    def setUp(self):
+        self.collections = registerCollections()
+
+    def tearDown(self):
+        unregisterCollections(self.collections)
+
+    def _cold(self, function):
+        def _function():
+            resetQuerysetsOfRelatedItems()
+            function()
+        return _function
+
+    def test_get_queryset(self):
+        view = View()
+        preselected = lambda: self.collections['gacha'].get_queryset(view)
+        printBenchmark(u'MagiCollection.get_queryset', [
+            (u'Preselected (resolved every time)', benchmark(self._cold(preselected))),
+            (u'Preselected (resolved once)', benchmark(preselected)),
+        ])
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_magidisplay
+"""
+from collections import OrderedDict
+from django.test import TestCase
+from django.utils import translation
+from magi.magidisplay import MagiDisplayTable, MagiDisplayList, MagiDisplayDescriptionList, MagiDisplayTableTitle
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ROWS = 500
+
+class MagiDisplayBenchmark(TestCase):
+    def setUp(self):
+        translation.activate('en')
+        self.rows = [[MagiDisplayTableTitle(u'Title'), u'Name', u'Value']] + [
+            [u'Row {}'.format(i), u'<b>Idol {}</b>'.format(i), i] for i in range(TOTAL_ROWS)
+        ]
+        self.items = [u'Item {}'.format(i) for i in range(TOTAL_ROWS)]
+        self.dict = OrderedDict([(u'key{}'.format(i), u'Value {}'.format(i)) for i in range(TOTAL_ROWS)])
+
+    def _render(self, display_class, value):
+        def _function():
+            return display_class.to_html(None, value, field_name='benchmark', verbose_name=u'Benchmark')
+        return _function
+
+    def test_render(self):
+        printBenchmark(u'Render {} rows'.format(TOTAL_ROWS), [
+            (u'Table', benchmark(self._render(MagiDisplayTable, self.rows), number=5)),
+            (u'List', benchmark(self._render(MagiDisplayList, self.items), number=5)),
+            (u'Description list', benchmark(self._render(MagiDisplayDescriptionList, self.dict), number=5)),
+        ])
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_magifields
+"""
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.contrib.auth.models import AnonymousUser
+from magi.urls import *
+from magi import urls
+from magi.magicollections import MagiCollection
+from magi.magifields import MagiFields
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 100
+
+class IdolCollection(MagiCollection):
+    queryset = models.Idol.objects.all()
+
+class UncachedFields(MagiFields):
+    cache_unbound_fields = False
+
+class MagiFieldsBenchmark(TestCase):
+    def setUp(self):
+        urls._addToCollections('idol', IdolCollection)
+        self.collection = urls.collections['idol']
+        user = models.User.objects.create(username='abc')
+        request = RequestFactory().get('/idol/1/')
+        request.user = AnonymousUser()
+        request.LANGUAGE_CODE = 'en'
+        self.context = { 'request': request, 'uses_deprecated_to_fields': False, 'ajax': False, 'is_crawler': False }
+        self.idols = [
+            models.Idol.objects.create(owner=user, name=u'Idol {}'.format(i), japanese_name=u'アイドル')
+            for i in range(TOTAL_ITEMS)
+        ]
+        for idol in self.idols:
+            idol.request = request
+
+    def tearDown(self):
+        del(urls.collections['idol'])
+        urls.all_enabled.remove('idol')
+
+    def _render(self, fields_class, view):
+        def _function():
+            for idol in self.idols:
+                fields = fields_class(view, idol, self.context)
+                for field in fields:
+                    field.to_text_value()
+        return _function
+
+    def test_item_fields(self):
+        for view in [self.collection.item_view, self.collection.list_view]:
+            printBenchmark(u'MagiFields of {} items in {}'.format(TOTAL_ITEMS, view.view), [
+                (u'Resolved for each item', benchmark(self._render(UncachedFields, view), number=3)),
+                (u'Plan cached', benchmark(self._render(MagiFields, view), number=3)),
+            ])
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_random
+"""
+import json
+from django.test import TestCase
+from magi.utils import getRandomItem
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 20000
+
+class RandomItemBenchmark(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create(username='abc')
+        models.Idol.objects.bulk_create([
+            models.Idol(owner=self.user, name=u'Idol {}'.format(i), japanese_name=(
+                u'アイドル {}'.format(i) if i % 50 == 0 else None), d_names=json.dumps({
+                    # Rows as big as the rows of most collections
+                    language: u'Idol {} in {} '.format(i, language) * 10
+                    for language in ['ja', 'fr', 'es', 'de', 'it', 'ru', 'zh-hans', 'kr']
+                }))
+            for i in range(TOTAL_ITEMS)
+        ])
+
+    def test_random_item(self):
+        for title, queryset in [
+                (u'No filter', models.Idol.objects.all()),
+                (u'Filtered (2%)', models.Idol.objects.filter(japanese_name__isnull=False)),
+                (u'Filtered (50%)', models.Idol.objects.filter(name__gte=u'Idol 5')),
+        ]:
+            printBenchmark(u'Random item ({} items): {}'.format(TOTAL_ITEMS, title), [
+                (u'order_by(\'?\')', benchmark(lambda: queryset.order_by('?')[0], number=20)),
+                (u'getRandomItem', benchmark(lambda: getRandomItem(queryset), number=20)),
+                (u'getRandomItem with pool', benchmark(lambda: getRandomItem(queryset, pool_size=100), number=20)),
+            ])
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_related_caches
+"""
+import sys, StringIO
+from django.test import TestCase
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 1000
+
+class RelatedCachesBenchmark(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        user = models.User.objects.create(username='abc')
+        models.Gacha.objects.bulk_create([
+            models.Gacha(owner=user, name=u'Gacha {}'.format(i), image=u'gacha/image.png')
+            for i in range(50)
+        ])
+        gachas = list(models.Gacha.objects.all())
+        models.Deck.objects.bulk_create([
+            models.Deck(owner=user, name=u'Deck {}'.format(i))
+            for i in range(TOTAL_ITEMS)
+        ])
+        for i, deck in enumerate(models.Deck.objects.all()):
+            deck.gachas.add(*gachas[i % 40:i % 40 + 8])
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def _update(self, reset=False, **kwargs):
+        def _function():
+            if reset:
+                models.Deck.objects.update(_cache_j_gachas=None, _cache_total_gachas=None)
+            models.Deck.update_all_related_caches_of_model(update_reverse_related_caches=False, **kwargs)
+        return _function
+
+    def test_update_all_related_caches_of_model(self):
+        results = [
+            (u'All changed (one by one)', benchmark(self._update(reset=True), number=3)),
+            (u'All changed (batched)', benchmark(self._update(reset=True, batched=True), number=3)),
+            (u'Nothing changed (one by one)', benchmark(self._update(), number=3)),
+            (u'Nothing changed (batched)', benchmark(self._update(batched=True), number=3)),
+        ]
+        sys.stdout = self.stdout
+        printBenchmark(u'update_all_related_caches_of_model ({} items)'.format(TOTAL_ITEMS), results)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_search
+"""
+import json
+from django.test import TestCase
+from magi.forms import MagiFiltersForm
+from magi.search import rebuildSearchIndex
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 20000
+WORDS = [u'happy', u'smile', u'cool', u'pure', u'star', u'dream', u'summer', u'winter', u'idol', u'festival', u'stage']
+SYLLABLES = [u'ka', u'ri', u'mo', u'to', u'ne', u'su', u'ha', u'yu', u'mi', u'ro']
+
+def getName(i):
+    # One common word + one rare word
+    return u'{} {}'.format(WORDS[i % len(WORDS)], u''.join([SYLLABLES[int(digit)] for digit in str(i)]))
+
+class IdolSearchFiltersForm(MagiFiltersForm):
+    search_fields = ['name', 'd_names']
+
+    class Meta(MagiFiltersForm.Meta):
+        model = models.Idol
+        fields = ()
+
+class SearchBenchmark(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create(username='abc')
+        models.Idol.objects.bulk_create([
+            models.Idol(owner=self.user, name=getName(i), d_names=json.dumps({
+                    'ja': u'アイドル {}'.format(i),
+                })) for i in range(TOTAL_ITEMS)
+        ])
+        models.Idol.SEARCH_INDEX_FIELDS = ['name', 'd_names']
+        rebuildSearchIndex(models.Idol)
+        self.form = IdolSearchFiltersForm.__new__(IdolSearchFiltersForm)
+
+    def tearDown(self):
+        del(models.Idol.SEARCH_INDEX_FIELDS)
+
+    def _search(self, indexed, value):
+        def _function():
+            models.Idol.SEARCH_INDEX_FIELDS = ['name', 'd_names'] if indexed else []
+            return list(self.form._search_to_queryset(
+                models.Idol.objects.all(), None, value).values_list('pk', flat=True)[:300])
+        return _function
+
+    def test_search(self):
+        for value in [u'rimotone', u'summer rimo', u'stage karimo', u'festival']:
+            # The search index only matches the start of words
+            self.assertTrue(set(self._search(True, value)()) <= set(self._search(False, value)()))
+            printBenchmark(u'Search in list view ({} items): "{}"'.format(TOTAL_ITEMS, value), [
+                (u'icontains', benchmark(self._search(False, value), number=5)),
+                (u'Search index', benchmark(self._search(True, value), number=5)),
+            ])
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Not run with the other tests. To run:
+python manage.py test test.benchmark_translation_index
+"""
+import json
+from django.test import TestCase
+from magi.item_model import rebuild_translation_index
+from magi.utils import filterByTranslatedValue, FilterByMode
+from test import models
+from test.benchmark_utils import benchmark, printBenchmark
+
+TOTAL_ITEMS = 20000
+
+class TranslationIndexBenchmark(TestCase):
+    def setUp(self):
+        models.TranslatedNames.objects.bulk_create([
+            models.TranslatedNames(name=u'Item {}'.format(i), d_names=json.dumps({
+                'ja': u'アイテム {}'.format(i),
+                'ru': u'Предмет {}'.format(i),
+                'zh-hans': u'项目 {}'.format(i),
+            })) for i in range(TOTAL_ITEMS)
+        ])
+        models.TranslatedNames.INDEXED_TRANSLATED_FIELDS = ['name']
+        rebuild_translation_index(models.TranslatedNames)
+        self.queryset = models.TranslatedNames.objects.all()
+
+    def tearDown(self):
+        del(models.TranslatedNames.INDEXED_TRANSLATED_FIELDS)
+
+    def _filter(self, indexed, **kwargs):
+        def _function():
+            if indexed:
+                models.TranslatedNames.INDEXED_TRANSLATED_FIELDS = ['name']
+            else:
+                models.TranslatedNames.INDEXED_TRANSLATED_FIELDS = []
+            result = filterByTranslatedValue(self.queryset, 'name', **kwargs)
+            return list(result)
+        return _function
+
+    def test_filter_by_translated_value(self):
+        for title, kwargs in [
+                (u'Exact, ja', { 'language': 'ja', 'value': u'アイテム 1234' }),
+                (u'Exact, any language', { 'value': u'Предмет 1234', 'case_insensitive': True }),
+                (u'Starts with, ja', { 'language': 'ja', 'value': u'アイテム 123', 'mode': FilterByMode.StartsWith }),
+                (u'Contains, ru, strict', { 'language': 'ru', 'value': u'мет 1234', 'mode': FilterByMode.Contains, 'strict': True }),
+        ]:
+            self.assertEqual(
+                [item.pk for item in self._filter(False, **kwargs)()],
+                [item.pk for item in self._filter(True, **kwargs)()],
+            )
+            printBenchmark(u'filterByTranslatedValue ({} items): {}'.format(TOTAL_ITEMS, title), [
+                (u'JSON', benchmark(self._filter(False, **kwargs), number=5)),
+                (u'Translation index', benchmark(self._filter(True, **kwargs), number=5)),
+            ])
@@ -0,0 +1,19 @@
+import time
+
+def benchmark(function, number=1000):
+    """
+    Returns the average time in seconds of one call to function.
+    """
+    start = time.time()
+    for _i in xrange(number):
+        function()
+    return (time.time() - start) / number
+
+def printBenchmark(title, results):
+    """
+    results = list of (label, average time in seconds)
+    """
+    print
+    print title
+    for label, seconds in results:
+        print u'  {:<40} {:>12.2f} us'.format(label, seconds * 1000000)
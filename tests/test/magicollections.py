@@ -0,0 +1 @@
+# Required by magi.urls
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+import magi.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('test', '0010_translatednames_korean_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Poster',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('image', models.ImageField(upload_to=magi.utils.uploadItem(b'posters'))),
+                ('_thumbnail_image', models.ImageField(null=True, upload_to=magi.utils.uploadThumb(b'posters'))),
+                ('m_description', models.TextField(null=True)),
+                ('_cache_description', models.TextField(null=True)),
+                ('owner', models.ForeignKey(related_name='posters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -5,7 +5,7 @@ from django.db import models
 from magi.utils import justReturn
 from magi.abstract_models import CacheOwner
 from magi.item_model import MagiModel, BaseMagiModel, i_choices
-from magi.utils import uploadItem
+from magi.utils import uploadItem, uploadThumb, addRelatedCaches
 
 class Account(MagiModel):
     collection_name = 'account'
@@ -155,7 +155,16 @@ class Idol(MagiModel):
     d_names = models.TextField(null=True)
     image = models.ImageField(upload_to=uploadItem('idols'))
 
+class Unit(MagiModel):
+    collection_name = 'unit'
+
+    owner = models.ForeignKey(User, related_name='added_units')
+    name = models.CharField(max_length=100, unique=True)
+    idols = models.ManyToManyField(Idol, related_name='units')
+
 class Card(MagiModel):
+    collection_name = 'card'
+
     owner = models.ForeignKey(User, related_name='added_cards')
 
     idol = models.ForeignKey(Idol, related_name='cards', null=True)
@@ -301,3 +310,21 @@ class TranslatedNames(BaseMagiModel):
 
     # No choices
     d_items = models.TextField(null=True)
+
+class Poster(BaseMagiModel):
+    owner = models.ForeignKey(User, related_name='posters')
+    image = models.ImageField(upload_to=uploadItem('posters'))
+    _thumbnail_image = models.ImageField(null=True, upload_to=uploadThumb('posters'))
+    m_description = models.TextField(null=True)
+    _cache_description = models.TextField(null=True)
+
+class Deck(MagiModel):
+    collection_name = 'deck'
+
+    owner = models.ForeignKey(User, related_name='added_decks')
+    name = models.CharField(max_length=100)
+    gachas = models.ManyToManyField(Gacha, related_name='decks')
+
+addRelatedCaches(Deck, {
+    'gachas': { 'fields': ['name'] },
+})
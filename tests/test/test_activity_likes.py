@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.test.client import RequestFactory
+from magi.urls import *
+from magi import urls, views
+from magi import models as magi_models
+from test import models
+
+class ActivityLikesTestCase(TestCase):
+    def setUp(self):
+        self.users = []
+        for username in ['abc', 'def', 'ghi']:
+            user = models.User.objects.create(username=username)
+            user.preferences = magi_models.UserPreferences.objects.create(user=user)
+            self.users.append(user)
+        self.activities = [
+            magi_models.Activity.objects.create(owner=self.users[0], m_message=u'Hello {}'.format(i))
+            for i in range(3)
+        ]
+        self.activities[1].likes.add(self.users[1])
+        self.activities[1].likes.add(self.users[2])
+        self.activities[2].likes.add(self.users[2])
+        for activity in self.activities:
+            activity.force_update_cache('total_likes')
+
+    def getRequest(self, user, data={}):
+        request = RequestFactory().post('/ajax/likeactivity/', data)
+        request.user = user
+        return request
+
+    def test_liked_in_feed(self):
+        collection = urls.collections['activity']
+        activities = list(magi_models.Activity.objects.order_by('pk'))
+        with self.assertNumQueries(1):
+            collection._set_liked(self.getRequest(self.users[1]), activities)
+        self.assertEqual([activity.liked for activity in activities], [False, True, False])
+        collection._set_liked(self.getRequest(self.users[2]), activities[2:])
+        self.assertTrue(activities[2].liked)
+        with self.assertNumQueries(0):
+            collection._set_liked(self.getRequest(self.users[1]), [])
+
+    def getTotalLikes(self, activity):
+        return magi_models.Activity.objects.get(pk=activity.pk)._cache_total_likes
+
+    def test_like_and_unlike(self):
+        activity = self.activities[1]
+        # Already liked
+        self.assertEqual(views.likeactivity(self.getRequest(self.users[1], { 'like': '' }), {}, activity.pk), {
+            'total_likes': 3,
+        })
+        self.assertEqual(views.likeactivity(self.getRequest(self.users[1], { 'unlike': '' }), {}, activity.pk), {
+            'total_likes': 2,
+            'result': 'unliked',
+        })
+        self.assertEqual(self.getTotalLikes(activity), 1)
+        self.assertEqual(views.likeactivity(self.getRequest(self.users[1], { 'like': '' }), {}, activity.pk), {
+            'total_likes': 3,
+            'result': 'liked',
+        })
+        self.assertEqual(self.getTotalLikes(activity), 2)
+        self.assertEqual(activity.likes.count(), 2)
+
+    def test_like_never_counted(self):
+        activity = self.activities[0]
+        magi_models.Activity.objects.filter(pk=activity.pk).update(_cache_total_likes=None)
+        self.assertEqual(views.likeactivity(self.getRequest(self.users[2], { 'like': '' }), {}, activity.pk), {
+            'total_likes': 2,
+            'result': 'liked',
+        })
+        self.assertEqual(self.getTotalLikes(activity), 1)
+
+    def test_add_and_remove_once(self):
+        activity, user = self.activities[0], self.users[1]
+        self.assertTrue(views._addActivityLike(activity, user))
+        self.assertFalse(views._addActivityLike(activity, user))
+        self.assertEqual(activity.likes.count(), 1)
+        self.assertTrue(views._removeActivityLike(activity, user))
+        self.assertFalse(views._removeActivityLike(activity, user))
+        self.assertEqual(activity.likes.count(), 0)
+
+    def test_concurrent_like(self):
+        activity = self.activities[2]
+        add_activity_like = views._addActivityLike
+        def addActivityLikeInOtherRequest(activity, user):
+            # Another request liked it after this one checked
+            add_activity_like(activity, user)
+            return add_activity_like(activity, user)
+        views._addActivityLike = addActivityLikeInOtherRequest
+        try:
+            views.likeactivity(self.getRequest(self.users[1], { 'like': '' }), {}, activity.pk)
+        finally:
+            views._addActivityLike = add_activity_like
+        self.assertEqual(activity.likes.count(), 2)
+        # Only counted by the request that added it (not run here)
+        self.assertEqual(self.getTotalLikes(activity), 1)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import sys, StringIO, importlib
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase
+from magi.default_settings import DEFAULT_GROUPS
+from magi.forms import FilterActivities
+from magi import models as magi_models
+from test import models
+
+class ActivityTagsTestCase(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.user = models.User.objects.create(username='abc')
+        self.activities = []
+        for tags in [['staff', 'news'], ['news'], ['comedy'], []]:
+            activity = magi_models.Activity(owner=self.user, m_message=u'Hello')
+            activity.save_c('tags', tags)
+            activity.save()
+            self.activities.append(activity)
+        self.form = FilterActivities.__new__(FilterActivities)
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def getTags(self, activity):
+        return sorted(magi_models.ActivityTag.objects.filter(
+            activity=activity).values_list('tag', flat=True))
+
+    def getPks(self, queryset):
+        return sorted(queryset.values_list('pk', flat=True))
+
+    def test_tags_on_save(self):
+        self.assertEqual(self.getTags(self.activities[0]), ['news', 'staff'])
+        self.assertEqual(self.getTags(self.activities[3]), [])
+        activity = self.activities[0]
+        activity.remove_c('tags', ['news'])
+        activity.add_c('tags', ['comedy'])
+        activity.save()
+        self.assertEqual(self.getTags(activity), ['comedy', 'staff'])
+        # Untouched when c_tags is not saved
+        activity.save_c('tags', [])
+        activity.save(update_fields=['m_message'])
+        self.assertEqual(self.getTags(activity), ['comedy', 'staff'])
+        activity.delete()
+        self.assertEqual(self.getTags(activity), [])
+
+    def test_filter_and_exclude(self):
+        pks = [activity.pk for activity in self.activities]
+        queryset = magi_models.Activity.objects.all()
+        self.assertEqual(self.getPks(magi_models.filterActivitiesWithTags(queryset, ['news'])), pks[:2])
+        self.assertEqual(self.getPks(magi_models.filterActivitiesWithTags(queryset, ['news', 'staff'])), pks[:1])
+        self.assertEqual(self.getPks(magi_models.excludeActivitiesWithTags(queryset, ['news'])), pks[2:])
+        self.assertEqual(self.getPks(magi_models.excludeActivitiesWithTags(queryset, ['staff', 'comedy'])), [pks[1], pks[3]])
+        self.assertEqual(self.getPks(magi_models.excludeActivitiesWithTags(queryset, [])), pks)
+        # Filter form
+        self.assertEqual(self.getPks(self.form._tags_to_queryset(queryset, None, ['news', 'staff'])), pks[:1])
+        self.assertEqual(self.getPks(self.form._tags_to_queryset(queryset, None, 'comedy')), pks[2:3])
+
+    def test_count_per_tag(self):
+        self.assertEqual(magi_models.countActivitiesPerTag(['news', 'comedy', 'unused']), {
+            'news': 2, 'comedy': 1, 'unused': 0,
+        })
+
+    def test_rebuild(self):
+        magi_models.Activity.objects.filter(pk=self.activities[2].pk).update(c_tags=u'"staff","comedy"')
+        magi_models.ActivityTag.objects.filter(activity=self.activities[1]).delete()
+        call_command('rebuild_activity_tags', chunk_size=2)
+        self.assertEqual(self.getTags(self.activities[1]), ['news'])
+        self.assertEqual(self.getTags(self.activities[2]), ['comedy', 'staff'])
+        self.assertEqual(magi_models.ActivityTag.objects.count(), 5)
+
+    def test_migration(self):
+        migration = importlib.import_module('magi.migrations.0055_activitytag')
+        magi_models.ActivityTag.objects.all().delete()
+        migration.add_activity_tags(apps, None, chunk_size=1)
+        self.assertEqual(self.getTags(self.activities[0]), ['news', 'staff'])
+        self.assertEqual(magi_models.ActivityTag.objects.count(), 4)
+
+    def test_group_stats_filters(self):
+        # Same as the LIKE on c_tags, with the index
+        for group, details in DEFAULT_GROUPS:
+            for stat in details.get('stats', []):
+                if stat['model'] == 'Activity':
+                    self.assertEqual(stat['filters'].keys(), ['indexed_tags__tag'])
+                    self.assertEqual(
+                        magi_models.Activity.objects.filter(**stat['filters']).count(),
+                        magi_models.Activity.objects.filter(c_tags__icontains=u'"{}"'.format(stat['filters']['indexed_tags__tag'])).count(),
+                    )
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import io, sys, shutil, tempfile, datetime, StringIO
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from magi.management.commands import async_db_updates
+from magi.models import AsyncUpdate
+from test import models
+
+def markdown_to_html_stub(markdown):
+    if markdown == 'fail':
+        raise ValueError('Invalid markdown')
+    return u'<p>{}</p>'.format(markdown)
+
+def imageData(width=400, height=300):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), (74, 134, 232)).save(output, format='PNG')
+    return output.getvalue()
+
+class PostersTestCase(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings.enable()
+        self.markdown_to_html = async_db_updates.markdown_to_html
+        async_db_updates.markdown_to_html = markdown_to_html_stub
+        self.user = models.User.objects.create(username='abc')
+        self.posters = []
+        for i in range(5):
+            poster = models.Poster(owner=self.user, m_description=u'Poster {}'.format(i))
+            poster.image.save(u'poster{}.png'.format(i), ContentFile(imageData()), save=False)
+            poster.save()
+            self.posters.append(poster)
+
+    def tearDown(self):
+        async_db_updates.markdown_to_html = self.markdown_to_html
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+        sys.stdout = self.stdout
+
+class AsyncDBUpdatesTestCase(PostersTestCase):
+    def assertAllUpdated(self):
+        for poster in models.Poster.objects.all():
+            self.assertEqual(poster._cache_description, u'<p>{}</p>'.format(poster.m_description))
+            self.assertTrue(poster._thumbnail_image)
+            self.assertEqual(Image.open(poster._thumbnail_image).size, (200, 200))
+
+    def test_one_item(self):
+        self.assertTrue(async_db_updates.model_async_update(models.Poster))
+        poster = models.Poster.objects.get(pk=self.posters[0].pk)
+        self.assertTrue(poster._thumbnail_image)
+        self.assertEqual(poster._cache_description, None)
+
+    def test_worker(self):
+        self.assertEqual(async_db_updates.run_worker([models.Poster], batch_size=2, workers=2), 10)
+        self.assertAllUpdated()
+        self.assertEqual(async_db_updates.run_worker([models.Poster]), 0)
+
+    def test_worker_processes(self):
+        self.assertEqual(async_db_updates.run_worker([models.Poster], workers=2, processes=True), 10)
+        self.assertAllUpdated()
+
+    def test_worker_field_name(self):
+        self.assertEqual(async_db_updates.run_worker([models.Poster], field_name='m_description'), 5)
+        self.assertFalse(models.Poster.objects.filter(_cache_description__isnull=True).exists())
+        self.assertFalse(any(poster._thumbnail_image for poster in models.Poster.objects.all()))
+
+    def test_worker_failed_items(self):
+        models.Poster.objects.filter(pk=self.posters[0].pk).update(m_description='fail')
+        self.assertEqual(async_db_updates.run_worker([models.Poster], field_name='m_description'), 4)
+        self.assertEqual(models.Poster.objects.get(pk=self.posters[0].pk)._cache_description, None)
+
+    def test_worker_failed_save(self):
+        markdown_save = async_db_updates.markdown_save
+        def _save(model, field, item, prepared, html):
+            markdown_save(model, field, item, prepared, html)
+            if item.pk == self.posters[0].pk:
+                raise ValueError('Invalid item')
+        async_db_updates.markdown_save = _save
+        try:
+            self.assertEqual(async_db_updates.run_worker([models.Poster], field_name='m_description'), 4)
+        finally:
+            async_db_updates.markdown_save = markdown_save
+        # Rolled back for the item that failed only
+        self.assertEqual(models.Poster.objects.get(pk=self.posters[0].pk)._cache_description, None)
+        self.assertEqual(models.Poster.objects.filter(_cache_description__isnull=False).count(), 4)
+        job = AsyncUpdate.objects.get(item_id=self.posters[0].pk, field_name='m_description')
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+
+    def test_thumbnail_unknown_resize(self):
+        with self.assertRaises(ValueError):
+            async_db_updates.thumbnail_process({
+                'content': imageData(), 'image_name': 'a.png', 'thumbnail_size': { 'resize': 'stretch' },
+            })
+
+class AsyncUpdateQueueTestCase(PostersTestCase):
+    def test_enqueued_on_save(self):
+        self.assertEqual(AsyncUpdate.get_queue_depth(), {
+            ('test.Poster', 'image', 'pending'): 5,
+            ('test.Poster', 'm_description', 'pending'): 5,
+        })
+        self.assertEqual(sorted(self.posters[0].get_pending_async_updates()), ['image', 'm_description'])
+
+    def test_nothing_to_enqueue(self):
+        async_db_updates.run_worker([models.Poster])
+        poster = models.Poster.objects.get(pk=self.posters[0].pk)
+        self.assertEqual(poster.get_pending_async_updates(), [])
+        with self.assertNumQueries(1):
+            poster.save()
+        self.assertEqual(AsyncUpdate.objects.count(), 0)
+        poster.m_description = u'Updated'
+        poster._cache_description = None
+        poster.save()
+        poster.update_all_related_caches()
+        self.assertEqual(AsyncUpdate.objects.filter(item_id=poster.pk, field_name='m_description').count(), 1)
+
+    def test_pop_locks(self):
+        jobs = AsyncUpdate.pop(limit=4)
+        self.assertEqual(len(jobs), 4)
+        self.assertTrue(all(job.status == 'locked' for job in jobs))
+        other_jobs = AsyncUpdate.pop(limit=20)
+        self.assertEqual(len(other_jobs), 6)
+        self.assertFalse(set(job.pk for job in jobs) & set(job.pk for job in other_jobs))
+        self.assertEqual(AsyncUpdate.pop(), [])
+        # Worker that crashed
+        AsyncUpdate.objects.filter(pk=jobs[0].pk).update(locked_until=timezone.now())
+        self.assertEqual([job.pk for job in AsyncUpdate.pop()], [jobs[0].pk])
+
+    def test_priority(self):
+        AsyncUpdate.objects.filter(item_id=self.posters[3].pk, field_name='image').update(priority=1)
+        job = AsyncUpdate.pop(limit=1)[0]
+        self.assertEqual((job.item_id, job.field_name), (self.posters[3].pk, 'image'))
+
+    def test_saved_while_locked(self):
+        job = AsyncUpdate.pop(limit=1)[0]
+        poster = job.model_class.objects.get(pk=job.item_id)
+        poster.save()
+        job.done()
+        self.assertEqual(AsyncUpdate.objects.get(pk=job.pk).status, 'pending')
+
+    def test_retry_with_backoff(self):
+        models.Poster.objects.filter(pk=self.posters[0].pk).update(m_description='fail')
+        job = AsyncUpdate.objects.get(item_id=self.posters[0].pk, field_name='m_description')
+        next_attempts = []
+        for attempt in range(1, AsyncUpdate.MAX_ATTEMPTS + 1):
+            AsyncUpdate.objects.filter(pk=job.pk).update(next_attempt=timezone.now())
+            async_db_updates.run_worker([models.Poster], field_name='m_description')
+            job = AsyncUpdate.objects.get(pk=job.pk)
+            self.assertEqual(job.attempts, attempt)
+            next_attempts.append(job.next_attempt - timezone.now())
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(next_attempts[0] > datetime.timedelta(seconds=50))
+        self.assertTrue(all(a < b for a, b in zip(next_attempts, next_attempts[1:])))
+        AsyncUpdate.objects.filter(pk=job.pk).update(next_attempt=timezone.now())
+        self.assertEqual(async_db_updates.run_worker([models.Poster], field_name='m_description'), 0)
+
+    def test_enqueue_all(self):
+        AsyncUpdate.objects.all().delete()
+        self.assertEqual(async_db_updates.enqueue_all([models.Poster], field_name='m_description'), 5)
+        self.assertEqual(AsyncUpdate.get_queue_depth(), {
+            ('test.Poster', 'm_description', 'pending'): 5,
+        })
+        self.assertEqual(async_db_updates.run_worker([models.Poster], field_name='m_description'), 5)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import sys, StringIO, smtplib
+from django.core import mail
+from django.test import TestCase
+from magi.management.commands import cron_notifications
+from magi import models as magi_models
+from test import models
+
+class CronNotificationsTestCase(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.users = []
+        for i, language in enumerate(['en', 'fr', 'en', 'es']):
+            user = models.User.objects.create(username=u'user{}'.format(i), email=u'user{}@example.com'.format(i))
+            user.preferences = magi_models.UserPreferences.objects.create(
+                user=user, i_language=magi_models.UserPreferences.get_i('language', language))
+            self.users.append(user)
+        self.users[2].preferences.invalid_email = True
+        self.users[2].preferences.save()
+        for user in self.users:
+            for follower in self.users[:2]:
+                self.notify(user, follower)
+        # Duplicate
+        self.notify(self.users[0], self.users[1])
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def notify(self, user, follower):
+        return magi_models.Notification.objects.create(
+            owner=user,
+            i_message=magi_models.Notification.get_i('message', 'follow'),
+            c_message_data=u'"{}"'.format(follower.username),
+            c_url_data=u'"{}","{}"'.format(follower.id, follower.username),
+        )
+
+    def test_send_notifications(self):
+        self.assertEqual(cron_notifications.send_notifications(batch_size=3, chunk_size=2), 6)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), [
+            u'user0@example.com', u'user0@example.com',
+            u'user1@example.com', u'user1@example.com',
+            u'user3@example.com', u'user3@example.com',
+        ])
+        self.assertFalse(magi_models.Notification.objects.filter(email_sent=False).exists())
+        self.assertEqual(cron_notifications.send_notifications(), 0)
+        self.assertEqual(len(mail.outbox), 6)
+
+    def test_send_notifications_workers(self):
+        self.assertEqual(cron_notifications.send_notifications(chunk_size=1, workers=3), 6)
+        self.assertEqual(len(mail.outbox), 6)
+
+    def test_one_context_per_language(self):
+        email_context = cron_notifications.emailContext
+        calls = []
+        def emailContextCounter():
+            calls.append(1)
+            return email_context()
+        cron_notifications.emailContext = emailContextCounter
+        try:
+            cron_notifications.send_notifications()
+        finally:
+            cron_notifications.emailContext = email_context
+        self.assertEqual(len(calls), 3)
+
+    def sendWithFailingConnection(self, error, **kwargs):
+        get_connection = cron_notifications.get_connection
+        class FailingConnection(object):
+            def __init__(self):
+                self.connection = get_connection()
+            def open(self):
+                return self.connection.open()
+            def close(self):
+                return self.connection.close()
+            def send_messages(self, messages):
+                if any(u'user0@example.com' in message.to for message in messages):
+                    raise error
+                return self.connection.send_messages(messages)
+        cron_notifications.get_connection = FailingConnection
+        try:
+            return cron_notifications.send_notifications(**kwargs)
+        finally:
+            cron_notifications.get_connection = get_connection
+
+    def test_failed_email_in_chunk(self):
+        self.assertEqual(self.sendWithFailingConnection(Exception('Connection lost'), chunk_size=100), 4)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), [
+            u'user1@example.com', u'user1@example.com',
+            u'user3@example.com', u'user3@example.com',
+        ])
+        # Including the duplicate of the failed email
+        self.assertEqual(magi_models.Notification.objects.filter(email_sent=False, owner=self.users[0]).count(), 3)
+        self.assertFalse(magi_models.Notification.objects.filter(email_sent=False).exclude(owner=self.users[0]).exists())
+        # Failed emails get sent the next time, once
+        self.assertEqual(cron_notifications.send_notifications(), 2)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertFalse(magi_models.Notification.objects.filter(email_sent=False).exists())
+
+    def test_duplicate_of_failed_email_in_next_batch(self):
+        self.assertEqual(self.sendWithFailingConnection(Exception('Connection lost'), batch_size=1), 4)
+        self.assertEqual(magi_models.Notification.objects.filter(email_sent=False, owner=self.users[0]).count(), 3)
+
+    def test_recipient_refused(self):
+        error = smtplib.SMTPRecipientsRefused({ u'user0@example.com': (550, 'No such mailbox') })
+        self.assertEqual(self.sendWithFailingConnection(error, batch_size=1), 4)
+        # Never sent again
+        self.assertFalse(magi_models.Notification.objects.filter(email_sent=False).exists())
+        self.assertTrue(cron_notifications.is_permanent_email_error(error))
+        self.assertFalse(cron_notifications.is_permanent_email_error(
+            smtplib.SMTPRecipientsRefused({ u'user0@example.com': (450, 'Mailbox busy') })))
+        self.assertFalse(cron_notifications.is_permanent_email_error(smtplib.SMTPSenderRefused(550, 'No', 'a@b.c')))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os, json, shutil, tempfile
+from django.test import TestCase
+from magi.import_data import BulkImporter, import_from_json, save_item
+from test import models
+
+def log(*args):
+    pass
+
+class BulkImporterTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create(username='abc', is_superuser=True)
+        models.Idol.objects.create(owner=self.user, name=u'Deby', japanese_name=u'デビー')
+        self.folder = tempfile.mkdtemp() + '/'
+        self.idols = {
+            'model': models.Idol,
+            'unique_fields': ['name'],
+            'fields': ['japanese_name', 'image'],
+            'mapping': { 'english_name': ['en', 'd_names'] },
+        }
+        self.units = {
+            'model': models.Unit,
+            'unique_fields': ['name'],
+            'fields': ['idols'],
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def importJson(self, name, details, items, **kwargs):
+        with open(self.folder + name + '.json', 'w') as f:
+            f.write(json.dumps(items))
+        import_from_json(self.folder, name, details, log_function=log, **kwargs)
+
+    def getIdols(self, total=20):
+        return [
+            { 'name': u'Idol {}'.format(i), 'japanese_name': u'アイドル {}'.format(i), 'english_name': u'Idol #{}'.format(i) }
+            for i in range(total)
+        ] + [{ 'name': u'Deby', 'japanese_name': u'デビ' }]
+
+    def assertSameAsSaveItem(self, items):
+        batched = { idol.name: (idol.japanese_name, idol.d_names) for idol in models.Idol.objects.all() }
+        models.Idol.objects.exclude(name=u'Deby').delete()
+        models.Idol.objects.filter(name=u'Deby').update(japanese_name=u'デビー', d_names=None)
+        self.importJson('idols', self.idols, items)
+        self.assertEqual(batched, { idol.name: (idol.japanese_name, idol.d_names) for idol in models.Idol.objects.all() })
+
+    def test_create_and_update(self):
+        items = self.getIdols()
+        # Existing items, default owner, last pk, savepoint, insert, new pks, update, release savepoint
+        with self.assertNumQueries(8):
+            self.importJson('idols', self.idols, items, batched=True)
+        self.assertEqual(models.Idol.objects.count(), 21)
+        self.assertEqual(models.Idol.objects.get(name=u'Deby').japanese_name, u'デビ')
+        self.assertEqual(models.Idol.objects.get(name=u'Idol 3').names, { 'en': u'Idol #3' })
+        self.assertSameAsSaveItem(items)
+
+    def test_nothing_changed(self):
+        self.importJson('idols', self.idols, self.getIdols(), batched=True)
+        # Only loads the existing items
+        with self.assertNumQueries(1):
+            self.importJson('idols', self.idols, self.getIdols(), batched=True)
+
+    def test_small_batches(self):
+        self.importJson('idols', self.idols, self.getIdols(), batched=True, batch_size=3)
+        self.assertEqual(sorted(models.Idol.objects.values_list('name', flat=True)), sorted(
+            item['name'] for item in self.getIdols()))
+
+    def test_duplicates_in_import(self):
+        importer = BulkImporter(self.idols, log_function=log)
+        importer.add({ 'name': u'Alpha' }, { 'japanese_name': u'アルファ' })
+        importer.add({ 'name': u'Alpha' }, { 'image': u'idols/alpha.png' })
+        importer.finish()
+        idol = models.Idol.objects.get(name=u'Alpha')
+        self.assertEqual((idol.japanese_name, unicode(idol.image)), (u'アルファ', u'idols/alpha.png'))
+
+    def test_dont_update(self):
+        importer = BulkImporter(self.idols, log_function=log, update=False)
+        importer.add({ 'name': u'Deby' }, { 'japanese_name': u'デビ', 'image': u'idols/deby.png' })
+        importer.finish()
+        idol = models.Idol.objects.get(name=u'Deby')
+        self.assertEqual((idol.japanese_name, unicode(idol.image)), (u'デビー', u'idols/deby.png'))
+
+    def test_manytomany(self):
+        self.importJson('idols', self.idols, self.getIdols(3), batched=True)
+        pks = dict(models.Idol.objects.values_list('name', 'pk'))
+        self.units['mapping'] = { 'members': lambda names: ('idols', [pks[name] for name in names]) }
+        units = [
+            { 'name': u'Unit A', 'members': [u'Deby', u'Idol 0'] },
+            { 'name': u'Unit B', 'members': [u'Idol 1', u'Idol 2'] },
+        ]
+        self.importJson('units', self.units, units, batched=True)
+        # Adding again doesn't create duplicates
+        units[0]['members'].append(u'Idol 2')
+        self.importJson('units', self.units, units, batched=True)
+        self.assertEqual(
+            sorted(models.Unit.objects.get(name=u'Unit A').idols.values_list('name', flat=True)),
+            [u'Deby', u'Idol 0', u'Idol 2'],
+        )
+        self.assertEqual(models.Unit.idols.through.objects.count(), 5)
+
+    def test_unique_values_normalized(self):
+        deby = models.Idol.objects.get(name=u'Deby')
+        details = dict(self.idols, unique_fields=['id'])
+        importer = BulkImporter(details, log_function=log)
+        importer.add({ 'id': unicode(deby.pk) }, { 'japanese_name': u'デビ' })
+        importer.finish()
+        self.assertEqual(models.Idol.objects.count(), 1)
+        self.assertEqual(models.Idol.objects.get(pk=deby.pk).japanese_name, u'デビ')
+
+    def test_new_pks_found_with_unique_fields(self):
+        manager_class = type(models.Idol.objects)
+        bulk_create = manager_class.bulk_create
+        def bulk_create_with_concurrent_insert(manager, objs, *args, **kwargs):
+            # Another process creates an idol at the same time
+            if manager.model is models.Idol:
+                models.Idol.objects.create(owner=self.user, name=u'Concurrent')
+            return bulk_create(manager, objs, *args, **kwargs)
+        manager_class.bulk_create = bulk_create_with_concurrent_insert
+        try:
+            importer = BulkImporter(self.idols, log_function=log)
+            for name in [u'Alpha', u'Beta']:
+                importer.add({ 'name': name }, { 'japanese_name': name.upper() })
+            importer.finish()
+        finally:
+            manager_class.bulk_create = bulk_create
+        for item in importer.all_items:
+            self.assertEqual(models.Idol.objects.get(pk=item.pk).name, item.name)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import json, shutil, tempfile, threading, time
+from collections import defaultdict
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from django.core.files.storage import default_storage
+from django.test import TestCase
+from magi.import_data import ImageDownloader, import_from_json
+from magi.urls import * # unused, just to make sure raw_context is updated
+from test import models
+
+def log(*args):
+    pass
+
+class ImagesRequestHandler(BaseHTTPRequestHandler):
+    """
+    /same/*.png: always the same image
+    /fail-once/*.png: error 500 the first time
+    /missing/*.png: error 404
+    /slow/*.png: answers after half a second
+    Any other path: a different image per path
+    """
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests[self.path] += 1
+            count = server.requests[self.path]
+        if self.path.startswith('/slow/'):
+            time.sleep(0.5)
+        if self.path.startswith('/missing/') or (self.path.startswith('/fail-once/') and count == 1):
+            self.send_response(404 if self.path.startswith('/missing/') else 500)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.end_headers()
+        self.wfile.write('same image' if self.path.startswith('/same/') else self.path)
+
+    def log_message(self, *args):
+        pass
+
+class ImageDownloaderTestCase(TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('localhost', 0), ImagesRequestHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = defaultdict(int)
+        # The client stops waiting for /slow/ on timeout
+        self.server.handle_error = lambda request, client_address: None
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = u'http://localhost:{}'.format(self.server.server_address[1])
+        self.media_root = tempfile.mkdtemp()
+        self.old_location, default_storage.location = default_storage.location, self.media_root
+        self.user = models.User.objects.create(username='abc', is_superuser=True)
+        self.folder = tempfile.mkdtemp() + '/'
+        self.details = {
+            'model': models.Idol,
+            'unique_fields': ['name'],
+            'fields': ['image'],
+            'download_images': True,
+        }
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        default_storage.location = self.old_location
+        shutil.rmtree(self.media_root)
+        shutil.rmtree(self.folder)
+
+    def importJson(self, items, **kwargs):
+        with open(self.folder + 'idols.json', 'w') as f:
+            f.write(json.dumps(items))
+        import_from_json(self.folder, 'idols', self.details, log_function=log, **kwargs)
+
+    def getImage(self, name):
+        idol = models.Idol.objects.get(name=name)
+        idol.image.open()
+        return idol.image.name, idol.image.read()
+
+    def test_import(self):
+        self.importJson([
+            { 'name': u'Idol {}'.format(i), 'image': u'{}/idols/{}.png'.format(self.url, i) }
+            for i in range(10)
+        ], image_workers=4)
+        for i in range(10):
+            self.assertEqual(self.getImage(u'Idol {}'.format(i))[1], u'/idols/{}.png'.format(i))
+        self.assertEqual(sum(self.server.requests.values()), 10)
+
+    def test_batched_import(self):
+        self.importJson([
+            { 'name': u'Idol {}'.format(i), 'image': u'{}/idols/{}.png'.format(self.url, i) }
+            for i in range(10)
+        ], image_workers=4, batched=True)
+        self.assertEqual(self.getImage(u'Idol 3')[1], u'/idols/3.png')
+
+    def test_same_content_stored_once(self):
+        self.importJson([
+            { 'name': u'Idol {}'.format(i), 'image': u'{}/same/{}.png'.format(self.url, i) }
+            for i in range(3)
+        ], image_workers=2)
+        names = set(self.getImage(u'Idol {}'.format(i)) for i in range(3))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(list(names)[0][1], 'same image')
+
+    def test_retry_and_failure(self):
+        downloader = ImageDownloader(workers=2, retry_delay=0, log_function=log)
+        idol = models.Idol.objects.create(owner=self.user, name=u'Deby')
+        missing = models.Idol.objects.create(owner=self.user, name=u'Missing')
+        downloader.add(idol, 'image', u'{}/fail-once/deby.png'.format(self.url))
+        downloader.add(missing, 'image', u'{}/missing/missing.png'.format(self.url))
+        self.assertEqual(downloader.finish(), 1)
+        self.assertEqual(self.getImage(u'Deby')[1], u'/fail-once/deby.png')
+        self.assertEqual(self.server.requests['/fail-once/deby.png'], 2)
+        # Not found doesn't get retried
+        self.assertEqual(self.server.requests['/missing/missing.png'], 1)
+        self.assertFalse(models.Idol.objects.get(name=u'Missing').image)
+
+    def test_timeout(self):
+        self.assertEqual(ImageDownloader(log_function=log).request_options, { 'timeout': 30 })
+        request_options = { 'timeout': 0.1 }
+        downloader = ImageDownloader(workers=2, retries=0, request_options=request_options, log_function=log)
+        idol = models.Idol.objects.create(owner=self.user, name=u'Slow')
+        downloader.add(idol, 'image', u'{}/slow/slow.png'.format(self.url))
+        self.assertEqual(downloader.finish(), 0)
+        self.assertFalse(models.Idol.objects.get(name=u'Slow').image)
+
+    def test_saved_as_downloads_complete(self):
+        downloader = ImageDownloader(workers=2, max_pending=2, retry_delay=0, log_function=log)
+        idols = [models.Idol.objects.create(owner=self.user, name=u'Idol {}'.format(i)) for i in range(6)]
+        for idol in idols:
+            downloader.add(idol, 'image', u'{}/idols/{}.png'.format(self.url, idol.name))
+            self.assertTrue(len(downloader.downloads) <= 2)
+        # Saved before finish, except the items that are still downloading
+        self.assertTrue(models.Idol.objects.exclude(image='').exclude(image__isnull=True).count() >= 3)
+        # Already downloaded and uploaded: not downloaded again
+        same = models.Idol.objects.create(owner=self.user, name=u'Same')
+        downloader.add(same, 'image', u'{}/idols/Idol 0.png'.format(self.url))
+        self.assertEqual(downloader.finish(), 6)
+        self.assertEqual(self.server.requests['/idols/Idol%200.png'], 1)
+        self.assertEqual(self.getImage(u'Same'), self.getImage(u'Idol 0'))
+        self.assertEqual(self.getImage(u'Idol 5')[1], u'/idols/Idol%205.png')
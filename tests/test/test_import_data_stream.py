@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import json, os, shutil, tempfile
+from django.db import connection
+from django.test import TestCase
+from magi.import_data import BulkImporter, dictfetchmany, import_from_json, import_from_sqlite, streamLocalJson
+from magi.utils import getSubField
+from test import models
+
+def log(*args):
+    pass
+
+class StreamImportTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create(username='abc', is_superuser=True)
+        self.folder = tempfile.mkdtemp() + '/'
+        self.path = self.folder + 'idols.json'
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, data, indent=None):
+        with open(self.path, 'w') as f:
+            f.write(json.dumps(data, indent=indent))
+
+    def assertSameAsLoad(self, data, results_location=None):
+        for indent in [None, 2]:
+            self.write(data, indent=indent)
+            expected = getSubField(data, results_location or [], default=[])
+            expected = expected.values() if isinstance(expected, dict) else expected
+            # Small chunks to cut values in the middle
+            for chunk_size in [1, 7, 64 * 1024]:
+                self.assertEqual(list(streamLocalJson(
+                    self.path, results_location=results_location, chunk_size=chunk_size)), expected)
+
+    def test_list(self):
+        self.assertSameAsLoad([
+            { 'name': u'Idol {}'.format(i), 'japanese_name': u'アイドル', 'points': 12345 * i, 'ratio': 1.5 }
+            for i in range(10)
+        ] + [123456789, True, None, u'"quoted" \\ string', [1, [2, 3]]])
+
+    def test_empty(self):
+        self.assertSameAsLoad([])
+        self.assertSameAsLoad({})
+
+    def test_dict(self):
+        self.assertSameAsLoad({ 'a': { 'name': u'A' }, 'b': { 'name': u'B' } })
+
+    def test_results_location(self):
+        data = {
+            'count': 3,
+            'skipped': { 'results': [1, 2] },
+            'pages': [{ 'results': [] }, { 'results': [{ 'name': u'Deby' }, { 'name': u'Alpha' }] }],
+        }
+        self.assertSameAsLoad(data, results_location=['pages', 1, 'results'])
+        self.assertEqual(list(streamLocalJson(self.path, results_location=['pages', 5, 'results'])), [])
+        self.assertEqual(list(streamLocalJson(self.path, results_location=['unknown'])), [])
+
+    def test_import_from_json(self):
+        self.write({ 'results': [{ 'name': u'Idol {}'.format(i) } for i in range(5)] })
+        import_from_json(self.folder, 'idols', {
+            'model': models.Idol,
+            'unique_fields': ['name'],
+            'results_location': ['results'],
+        }, log_function=log, stream=True, batched=True, batch_size=2)
+        self.assertEqual(models.Idol.objects.count(), 5)
+
+    def test_import_from_sqlite(self):
+        for i in range(5):
+            models.Idol.objects.create(owner=self.user, name=u'Idol {}'.format(i))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT name FROM test_idol ORDER BY id')
+            self.assertEqual([row['name'] for row in dictfetchmany(cursor, size=2)], [
+                u'Idol {}'.format(i) for i in range(5)])
+        import_from_sqlite('default', 'test_idol', {
+            'model': models.Unit,
+            'query': 'SELECT name FROM {table_name}',
+            'unique_fields': ['name'],
+        }, log_function=log, stream=True, batch_size=2)
+        self.assertEqual(models.Unit.objects.count(), 5)
+
+    def test_bulk_importer_stream(self):
+        for name in [u'Idol 1', u'Idol 3', u'Other']:
+            models.Idol.objects.create(owner=self.user, name=name)
+        details = { 'model': models.Idol, 'unique_fields': ['name'], 'fields': ['japanese_name'] }
+        importer = BulkImporter(details, log_function=log, stream=True, batch_size=2)
+        # Nothing loaded until the first batch
+        self.assertEqual(importer.all_items, [])
+        for i in range(5) + [3]:
+            importer.add({ 'name': u'Idol {}'.format(i) }, { 'japanese_name': u'アイドル {}'.format(i) })
+            # Only the items of the current batch are kept
+            self.assertTrue(len(importer.all_items) <= 2)
+            self.assertFalse(importer.to_update_caches)
+        importer.finish()
+        self.assertEqual(models.Idol.objects.count(), 6)
+        self.assertEqual(models.Idol.objects.get(name=u'Idol 3').japanese_name, u'アイドル 3')
+        self.assertEqual(importer.total_created, 3)
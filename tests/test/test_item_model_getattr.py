@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from magi.item_model import CachedItem, get_attribute_resolver, reset_attribute_resolvers
+from magi.utils import cacheRelExtra
+from test import models
+
+class ItemModelGetAttrTestCase(TestCase):
+    def setUp(self):
+        reset_attribute_resolvers()
+        self.item = models.IChoicesTest(
+            i_attribute=models.IChoicesTest.get_i('attribute', 'pure'),
+            i_rarity=models.IChoicesTest.get_i('rarity', 'SR'),
+        )
+        self.other_item = models.IChoicesTest(
+            i_attribute=models.IChoicesTest.get_i('attribute', 'cool'),
+        )
+
+    def test_resolved_once_per_class(self):
+        self.assertEqual(self.item.attribute, 'pure')
+        resolver = get_attribute_resolver(models.IChoicesTest, 'attribute')
+        self.assertEqual(self.other_item.attribute, 'cool')
+        self.assertIs(get_attribute_resolver(models.IChoicesTest, 'attribute'), resolver)
+
+    def test_same_values_when_resolved(self):
+        for _i in range(2):
+            self.assertEqual(self.item.rarity, 'SR')
+            self.assertEqual(self.item.t_rarity, 'SR')
+            self.assertTrue(self.item.has_rarity)
+            self.assertEqual(self.item.play_with, None)
+            self.assertFalse(self.item.has_play_with)
+            self.assertEqual(self.other_item.rarity, 'N')
+
+    def test_values_not_shared_between_instances(self):
+        self.assertEqual(self.item.attribute, 'pure')
+        self.item.i_attribute = models.IChoicesTest.get_i('attribute', 'smile')
+        self.assertEqual(self.item.attribute, 'smile')
+        self.assertEqual(self.other_item.attribute, 'cool')
+
+    def test_unknown_attribute(self):
+        for _i in range(2):
+            self.assertFalse(hasattr(self.item, 'something'))
+            self.assertFalse(hasattr(self.item, 't_something'))
+            self.assertFalse(hasattr(self.item, 'cached_something'))
+            self.assertEqual(getattr(self.item, 'display_name_item', None), None)
+        self.assertIsNone(get_attribute_resolver(models.IChoicesTest, 'something'))
+
+    def test_cached(self):
+        user = models.User.objects.create(username='abc')
+        idol = models.Idol.objects.create(owner=user, name=u'Deby', image=u'idols/deby.png')
+        card = models.Card.objects.create(owner=user, idol=idol)
+        card.update_cache('idol_name')
+        self.assertEqual(card.cached_idol_name, u'Deby')
+        self.assertTrue(card.idol.image_url.endswith(u'/idols/deby.png'))
+        other_card = models.Card.objects.create(owner=user)
+        self.assertEqual(other_card.cached_idol_name, None)
+        self.assertEqual(card.cached_idol_name, u'Deby')
+
+class CachedItemGetAttrTestCase(TestCase):
+    def setUp(self):
+        reset_attribute_resolvers()
+        self.gachas = [
+            cacheRelExtra({
+                'id': i,
+                'name': u'Gacha {}'.format(i),
+                'image': u'gacha/image.png',
+                'i_attribute': i,
+                'i_rarity': i,
+            }, CachedItem, model_class=models.Gacha)
+            for i in range(2)
+        ]
+
+    def test_same_values_when_resolved(self):
+        for _i in range(2):
+            gacha1, gacha2 = self.gachas
+            self.assertEqual(gacha1.attribute, 'smile')
+            self.assertEqual(gacha2.attribute, 'pure')
+            self.assertEqual(gacha2.t_rarity, 'R')
+            self.assertTrue(gacha2.has_rarity)
+            self.assertTrue(gacha1.image_url.endswith(u'/gacha/image.png'))
+            self.assertEqual(gacha1.t_name, u'Gacha 0')
+            self.assertEqual(gacha1.item_url, u'/gacha/0/Gacha-0/')
+            self.assertFalse(hasattr(gacha1, 'something'))
+            self.assertFalse(hasattr(gacha1, 'has_something'))
+
+    def test_values_from_model_class(self):
+        self.assertEqual(self.gachas[0].get_i('attribute', 'cool'), 2)
+        self.assertEqual(self.gachas[0].ATTRIBUTE_CHOICES, models.Gacha.ATTRIBUTE_CHOICES)
+
+    def test_depends_on_cached_fields(self):
+        gacha = self.gachas[0]
+        self.assertEqual(gacha.rarity, 'N')
+        del(gacha['i_rarity'])
+        self.assertFalse(hasattr(gacha, 'rarity'))
+        self.assertFalse(hasattr(gacha, 'has_rarity'))
+        self.assertEqual(self.gachas[1].rarity, 'R')
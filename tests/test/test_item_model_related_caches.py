@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import sys, json, StringIO
+from django.db import transaction
+from django.test import TestCase
+from magi.item_model import deferred_related_caches, get_pending_related_cache_updates, is_deferring_related_caches
+from magi.management.commands import async_db_updates
+from magi.utils import getRelatedCachesOfItems
+from magi import models as magi_models
+from test import models
+
+class RelatedCachesTestCase(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.user = models.User.objects.create(username='abc')
+        self.gachas = [
+            models.Gacha.objects.create(owner=self.user, name=u'Gacha {}'.format(i), image=u'gacha/image.png')
+            for i in range(4)
+        ]
+        self.decks = []
+        for i, gachas in enumerate([self.gachas, self.gachas[1:3], [], self.gachas[:1]]):
+            deck = models.Deck.objects.create(owner=self.user, name=u'Deck {}'.format(i))
+            deck.gachas.add(*gachas)
+            self.decks.append(deck)
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+class BatchedRelatedCachesTestCase(RelatedCachesTestCase):
+    def getCaches(self):
+        return {
+            deck.pk: (deck._cache_j_gachas, deck._cache_total_gachas)
+            for deck in models.Deck.objects.all()
+        }
+
+    def getCachesOneByOne(self):
+        models.Deck.objects.update(_cache_j_gachas=None, _cache_total_gachas=None)
+        for deck in models.Deck.objects.all():
+            deck.update_all_related_caches()
+        return self.getCaches()
+
+    def test_get_related_caches_of_items(self):
+        with self.assertNumQueries(2):
+            values = getRelatedCachesOfItems(models.Deck, self.decks, 'gachas')
+        self.assertEqual(values[self.decks[1].pk], ([
+            { 'id': gacha.pk, 'name': gacha.name, 'unicode': unicode(gacha), 'unicodes': gacha.unicodes }
+            for gacha in self.gachas[1:3]
+        ], 2))
+        self.assertEqual(values[self.decks[2].pk], ([], 0))
+        self.assertEqual(getRelatedCachesOfItems(models.Card, [], 'idol'), None)
+
+    def test_same_as_one_by_one(self):
+        expected = self.getCachesOneByOne()
+        models.Deck.objects.update(_cache_j_gachas=None, _cache_total_gachas=None)
+        models.Deck.update_all_related_caches_of_model(batched=True, chunk_size=3)
+        caches = self.getCaches()
+        self.assertEqual(json.loads(caches[self.decks[0].pk][0])[0]['name'], u'Gacha 0')
+        self.assertEqual(caches[self.decks[0].pk][1], 4)
+        # One by one, the total doesn't get saved when the cache is still empty
+        self.assertEqual(expected[self.decks[2].pk], (None, None))
+        expected[self.decks[2].pk] = (None, 0)
+        self.assertEqual(caches, expected)
+
+    def test_only_changed_items_saved(self):
+        models.Deck.update_all_related_caches_of_model(batched=True)
+        decks = list(models.Deck.objects.all())
+        # Related items, no update
+        with self.assertNumQueries(2):
+            self.assertEqual(models.Deck.update_related_caches_of_items(decks), 0)
+        self.decks[1].gachas.remove(self.gachas[1])
+        # Related items, savepoint, update, release savepoint
+        with self.assertNumQueries(5):
+            self.assertEqual(models.Deck.update_related_caches_of_items(decks), 1)
+        self.assertEqual(models.Deck.objects.get(pk=self.decks[1].pk)._cache_total_gachas, 1)
+
+class DeferredRelatedCachesTestCase(RelatedCachesTestCase):
+    def setUp(self):
+        super(DeferredRelatedCachesTestCase, self).setUp()
+        models.Deck.update_all_related_caches_of_model(batched=True)
+
+    def rename(self, gacha, name):
+        gacha.name = name
+        gacha.save()
+        gacha.update_all_related_caches()
+
+    def getNames(self, deck):
+        return [gacha['name'] for gacha in json.loads(models.Deck.objects.get(pk=deck.pk)._cache_j_gachas)]
+
+    def test_synchronous(self):
+        self.rename(self.gachas[1], u'Renamed')
+        self.assertEqual(self.getNames(self.decks[1]), [u'Renamed', u'Gacha 2'])
+
+    def test_deferred(self):
+        with deferred_related_caches():
+            self.rename(self.gachas[1], u'Renamed')
+            with deferred_related_caches():
+                self.rename(self.gachas[1], u'Renamed again')
+                self.rename(self.gachas[2], u'Renamed too')
+            # Not updated yet, and each deck only once
+            self.assertEqual(self.getNames(self.decks[1]), [u'Gacha 1', u'Gacha 2'])
+            self.assertEqual(sorted(get_pending_related_cache_updates()), [
+                (models.Deck, self.decks[0].pk, 'gachas'),
+                (models.Deck, self.decks[1].pk, 'gachas'),
+            ])
+        self.assertEqual(get_pending_related_cache_updates(), [])
+        self.assertEqual(self.getNames(self.decks[1]), [u'Renamed again', u'Renamed too'])
+        self.assertEqual(self.getNames(self.decks[0])[1], u'Renamed again')
+
+    def test_asynchronous(self):
+        with deferred_related_caches(asynchronous=True):
+            self.rename(self.gachas[1], u'Renamed')
+        self.assertEqual(magi_models.AsyncUpdate.objects.filter(
+            model_name='test.Deck', field_name='related_cache:gachas').count(), 2)
+        self.assertEqual(self.getNames(self.decks[1]), [u'Gacha 1', u'Gacha 2'])
+        self.assertEqual(async_db_updates.run_worker([models.Deck], workers=1), 2)
+        self.assertEqual(self.getNames(self.decks[1]), [u'Renamed', u'Gacha 2'])
+        self.assertEqual(magi_models.AsyncUpdate.objects.count(), 0)
+
+    def test_deferred_error(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                with deferred_related_caches():
+                    self.rename(self.gachas[1], u'Renamed')
+                    # Like after a database error, no query can run until the end of the atomic block
+                    transaction.set_rollback(True)
+                    raise ValueError('Rolled back')
+        # Not flushed, the original exception is raised and nothing is left on the thread
+        self.assertEqual(get_pending_related_cache_updates(), [])
+        self.assertFalse(is_deferring_related_caches())
+        self.assertEqual(self.getNames(self.decks[1]), [u'Gacha 1', u'Gacha 2'])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.sessions.backends.db import SessionStore
+from magi.urls import *
+from magi import urls
+from magi.magicollections import MagiCollection
+from magi.forms import MagiFiltersForm
+from test import models
+
+class CardFilterForm(MagiFiltersForm):
+    class Meta(MagiFiltersForm.Meta):
+        model = models.Card
+        fields = ()
+
+class CardCollection(MagiCollection):
+    queryset = models.Card.objects.all()
+    collectible = models.Gacha
+
+    class ListView(MagiCollection.ListView):
+        filter_form = CardFilterForm
+
+class CollectibleButtonsTestCase(TestCase):
+    def setUp(self):
+        urls._addToCollections('card', CardCollection)
+        self.collection = urls.collections['card']
+        self.user = models.User.objects.create(username='abc')
+        self.other_user = models.User.objects.create(username='def')
+        self.cards = [models.Card.objects.create(owner=self.user) for i in range(10)]
+        for i, (card, owner) in enumerate([
+                (self.cards[0], self.user),
+                (self.cards[0], self.user),
+                (self.cards[0], self.other_user),
+                (self.cards[2], self.user),
+                (self.cards[3], self.other_user),
+        ]):
+            models.Gacha.objects.create(owner=owner, card=card, name=u'Gacha {}'.format(i))
+
+    def tearDown(self):
+        for name in ['card', 'gacha']:
+            del(urls.collections[name])
+            urls.all_enabled.remove(name)
+        del(urls.collectible_collections['owner']['gacha'])
+
+    def getRequest(self):
+        request = RequestFactory().get('/cards/')
+        request.user = self.user
+        request.session = SessionStore()
+        request.LANGUAGE_CODE = 'en'
+        request.show_collect_button = True
+        return request
+
+    def getButtons(self, total_cards):
+        request = self.getRequest()
+        context = { 'request': request, 'uses_deprecated_to_fields': False, 'ajax': False, 'is_crawler': False }
+        view = self.collection.list_view
+        items = list(view.get_queryset(self.collection.queryset, {}, request).order_by('pk')[:total_cards])
+        with CaptureQueriesContext(connection) as queries:
+            self.collection.set_collectibles_totals(view, request, items)
+            buttons = [view.buttons_per_item(request, context, item) for item in items]
+        return buttons, len(queries)
+
+    def test_totals(self):
+        buttons, _total_queries = self.getButtons(10)
+        self.assertEqual([b['gacha']['badge'] for b in buttons], [2, 0, 1, 0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(buttons[0]['gacha']['url'].split('?')[0], u'/gachas/add/')
+        self.assertIn(u'card_id={}'.format(self.cards[1].pk), buttons[1]['gacha']['url'])
+        self.assertEqual(buttons[2]['gacha']['ajax_title'], u'{}: {}'.format(
+            unicode(self.collection.collectible_collections['gacha'].add_sentence), unicode(self.cards[2])))
+
+    def test_totals_in_queryset(self):
+        self.collection.list_view.collectibles_totals_per_page = False
+        try:
+            request = self.getRequest()
+            items = self.collection.list_view.get_queryset(self.collection.queryset, {}, request).order_by('pk')
+            self.assertEqual([item.total_gacha for item in items], [2, 0, 1, 0, 0, 0, 0, 0, 0, 0])
+        finally:
+            self.collection.list_view.collectibles_totals_per_page = True
+
+    def test_queries_dont_depend_on_total_items(self):
+        _buttons, queries_for_3 = self.getButtons(3)
+        _buttons, queries_for_10 = self.getButtons(10)
+        self.assertEqual(queries_for_3, queries_for_10)
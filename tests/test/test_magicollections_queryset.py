@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from django.db.models import Prefetch
+from django.test import TestCase
+from magi.default_settings import RAW_CONTEXT
+from magi.magicollections import MagiCollection
+from magi.urls import * # unused, just to make sure raw_context is updated
+from magi.utils import selectRelatedDictToStrings, resetQuerysetsOfRelatedItems
+from test import models
+
+class IdolCollection(MagiCollection):
+    queryset = models.Idol.objects.select_related('owner').prefetch_related('cards')
+
+class GachaCollection(MagiCollection):
+    queryset = models.Gacha.objects.all()
+
+class View(object):
+    view = 'list_view'
+    fields_preselected = [ 'card__idol' ]
+    fields_prefetched = []
+    fields_prefetched_together = []
+
+def registerCollections():
+    resetQuerysetsOfRelatedItems()
+    collections = { 'idol': IdolCollection(), 'gacha': GachaCollection() }
+    RAW_CONTEXT['magicollections'].update(collections)
+    return collections
+
+def unregisterCollections(collections):
+    resetQuerysetsOfRelatedItems()
+    for name in collections.keys():
+        del(RAW_CONTEXT['magicollections'][name])
+
+class CollectionGetQuerysetTestCase(TestCase):
+    def setUp(self):
+        self.collections = registerCollections()
+        user = models.User.objects.create(username='abc')
+        idol = models.Idol.objects.create(owner=user, name=u'Deby')
+        for i in range(3):
+            card = models.Card.objects.create(owner=user, idol=idol)
+            models.Gacha.objects.create(owner=user, name=u'Gacha {}'.format(i), card=card)
+
+    def tearDown(self):
+        unregisterCollections(self.collections)
+
+    def getQueryset(self):
+        return self.collections['gacha'].get_queryset(View())
+
+    def test_preselected(self):
+        queryset = self.getQueryset()
+        preselected = selectRelatedDictToStrings(queryset.query.select_related)
+        for lookup in [ 'card', 'card__idol', 'card__idol__owner' ]:
+            self.assertIn(lookup, preselected)
+        self.assertEqual([
+            lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+            for lookup in queryset._prefetch_related_lookups
+        ], [ 'card__idol__cards' ])
+        with self.assertNumQueries(2):
+            gachas = list(queryset)
+            self.assertEqual([len(gacha.card.idol.cards.all()) for gacha in gachas], [3, 3, 3])
+
+    def test_not_shared_between_querysets(self):
+        first, second = self.getQueryset(), self.getQueryset()
+        self.assertIsNot(first._prefetch_related_lookups[0], second._prefetch_related_lookups[0])
+        self.assertIsNot(first._prefetch_related_lookups[0].queryset, second._prefetch_related_lookups[0].queryset)
+        # Evaluating the first one doesn't change the second one
+        list(first)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(second)), 3)
+        self.assertEqual(
+            self.collections['idol'].queryset._prefetch_related_lookups, [ 'cards' ])
+
+    def test_prefetched(self):
+        View.fields_prefetched = [ 'cards' ]
+        try:
+            queryset = self.collections['idol'].get_queryset(View(), queryset=models.Idol.objects.all())
+        finally:
+            View.fields_prefetched = []
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(queryset)[0].cards.all()), 3)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import re
+from collections import OrderedDict
+from django.test import TestCase
+from django.utils import translation
+from magi.magidisplay import (
+    MagiDisplayText,
+    MagiDisplayList,
+    MagiDisplayDescriptionList,
+    MagiDisplayGrid,
+    MagiDisplayTable,
+    MagiDisplayAlert,
+    _MagiDisplayText,
+)
+from magi.magidisplay import MagiDisplayTableTitle
+
+class MagiDisplayCompiledTemplatesTestCase(TestCase):
+    def setUp(self):
+        translation.activate('en')
+
+    def toHTML(self, display_class, value, **kwargs):
+        display_class.reset_compiled_templates()
+        first = display_class.to_html(None, value, **kwargs)
+        # Second time uses the compiled templates
+        self.assertEqual(display_class.to_html(None, value, **kwargs), first)
+        return re.sub(r'\s*([<>])\s*', r'\1', re.sub(r'\s+', u' ', first))
+
+    def test_text(self):
+        self.assertEqual(
+            self.toHTML(MagiDisplayText, u'<b>Honoka</b>', text_icon='idol', text_badge=2),
+            u'<i class="flaticon-idol"></i><span>&lt;b&gt;Honoka&lt;/b&gt;</span><span class="badge progress-bar-main">2</span>',
+        )
+        self.assertEqual(self.toHTML(MagiDisplayText, u'Honoka'), u'<span>Honoka</span>')
+
+    def test_list(self):
+        self.assertEqual(
+            self.toHTML(MagiDisplayList, OrderedDict([('fly', u'Fly'), ('dance', u'Dance')]), inline=True),
+            u'<div class="list-wrapper with-bullet"><ul><li data-list-key="fly" class="inline-block padding10 padding-novertical"><span>Fly</span></li><li data-list-key="dance" class="inline-block padding10 padding-novertical"><span>Dance</span></li></ul></div>',
+        )
+
+    def test_description_list(self):
+        self.assertEqual(
+            self.toHTML(MagiDisplayDescriptionList, OrderedDict([('name', { 'verbose': u'Name', 'value': u'Deby' })])),
+            u'<dl><dt data-key="name"><span>Name</span></dt><dd><span>Deby</span></dd></dl>',
+        )
+
+    def test_grid(self):
+        html = self.toHTML(MagiDisplayGrid, [u'a', u'b', u'c'], per_line=2)
+        self.assertEqual(html.count(u'class="col-sm-6'), 3)
+        self.assertEqual(html.count(u'</div><div class="row row-align-right">'), 1)
+
+    def test_table(self):
+        self.assertEqual(
+            self.toHTML(MagiDisplayTable, [[MagiDisplayTableTitle(u'Title'), None], [u'a', 1]]),
+            u'<div class="flex-table with-border table-rounded text-center"><div class="flex-tr"><div class="flex-th flex-collapse-sm"><span>Title</span></div><div class="flex-td flex-collapse-sm"></div></div><div class="flex-tr"><div class="flex-td flex-collapse-sm"><span>a</span></div><div class="flex-td flex-collapse-sm"><span>1</span></div></div></div>',
+        )
+
+    def test_alert_dict_parameter(self):
+        html = self.toHTML(MagiDisplayAlert, u'Message', alert_button={ 'url': u'/', 'verbose': u'Go' })
+        self.assertIn(u'<a href="/" class="btn btn-main btn-lg btn-block" target="_blank">Go<i class="flaticon-link"></i>', html)
+
+    def test_callable_template(self):
+        class _Display(_MagiDisplayText):
+            def template(self, parameters):
+                return u'<b>{display_value}</b> {text_badge}'
+        display = _Display()
+        self.assertEqual(self.toHTML(display, u'x', text_badge=1), u'<b>x</b><span class="badge progress-bar-main">1</span>')
+        self.assertIsNone(display.get_compiled_templates()['used_parameters'])
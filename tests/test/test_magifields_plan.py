@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.contrib.auth.models import AnonymousUser
+from magi.urls import *
+from magi import urls
+from magi.magicollections import MagiCollection
+from magi.magifields import MagiFields, MagiCharField
+from test import models
+
+class IdolCollection(MagiCollection):
+    queryset = models.Idol.objects.all()
+
+    class ItemView(MagiCollection.ItemView):
+        fields_order = ['name', 'owner']
+
+class IdolFields(MagiFields):
+    warning = MagiCharField(value=u'Only available in the shop.')
+
+class UncachedIdolFields(IdolFields):
+    cache_unbound_fields = False
+
+class MagiFieldsPlanTestCase(TestCase):
+    def setUp(self):
+        urls._addToCollections('idol', IdolCollection)
+        self.collection = urls.collections['idol']
+        user = models.User.objects.create(username='abc')
+        self.request = RequestFactory().get('/idol/1/')
+        self.request.user = AnonymousUser()
+        self.request.LANGUAGE_CODE = 'en'
+        self.context = { 'request': self.request, 'uses_deprecated_to_fields': False, 'ajax': False, 'is_crawler': False }
+        self.idols = [models.Idol.objects.create(owner=user, name=u'Idol {}'.format(i)) for i in range(3)]
+        for idol in self.idols:
+            idol.request = self.request
+
+    def tearDown(self):
+        del(urls.collections['idol'])
+        urls.all_enabled.remove('idol')
+
+    def getFields(self, fields_class, idol, **kwargs):
+        fields = fields_class(self.collection.item_view, idol, self.context, **kwargs)
+        return fields, [
+            (field_name, type(field), field.item.pk, field.value)
+            for field_name, field in fields.items()
+        ]
+
+    def test_same_fields_as_uncached(self):
+        for idol in self.idols:
+            fields, cached = self.getFields(IdolFields, idol)
+            uncached_fields, uncached = self.getFields(UncachedIdolFields, idol)
+            self.assertEqual(cached, uncached)
+            self.assertEqual(fields.excluded, uncached_fields.excluded)
+            self.assertEqual(fields.skipped, uncached_fields.skipped)
+        self.assertEqual(cached[0][0], 'name')
+        self.assertIn('warning', [field_name for field_name, _cls, _pk, _value in cached])
+
+    def test_plan_reused(self):
+        IdolFields(self.collection.item_view, self.idols[0], self.context)
+        calls = []
+        class CountedIdolFields(IdolFields):
+            def set_model_fields(self):
+                calls.append(1)
+                super(CountedIdolFields, self).set_model_fields()
+        CountedIdolFields(self.collection.item_view, self.idols[0], self.context)
+        CountedIdolFields(self.collection.item_view, self.idols[1], self.context)
+        self.assertEqual(len(calls), 1)
+        # Different options get their own plan
+        fields, _values = self.getFields(CountedIdolFields, self.idols[1], only_fields=['name'])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(list(fields.keys()), ['name'])
+        # Fields are never shared between items
+        first = CountedIdolFields(self.collection.item_view, self.idols[0], self.context)
+        second = CountedIdolFields(self.collection.item_view, self.idols[1], self.context)
+        self.assertIsNot(first.fields['name'], second.fields['name'])
+        self.assertEqual(first.fields['name'].value, u'Idol 0')
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import sys, datetime, StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from magi.management.commands import purge_old_items
+from magi import models as magi_models
+from test import models
+
+class PurgeOldItemsTestCase(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.user = models.User.objects.create(username='abc')
+        now = timezone.now()
+        for i in range(25):
+            notification = magi_models.Notification.objects.create(
+                owner=self.user, i_message=0, c_message_data=u'"abc"', seen=(i % 5 != 0))
+            # Old enough for every 2 notifications
+            if i % 2 == 0:
+                magi_models.Notification.objects.filter(pk=notification.pk).update(
+                    creation=now - datetime.timedelta(days=365))
+        self.to_keep = list(magi_models.Notification.objects.exclude(
+            seen=True, creation__lt=now - datetime.timedelta(days=30 * 6)).values_list('pk', flat=True))
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def test_dry_run(self):
+        self.assertEqual(purge_old_items.purge('notification', dry_run=True), 10)
+        self.assertEqual(magi_models.Notification.objects.count(), 25)
+
+    def test_purge(self):
+        self.assertEqual(purge_old_items.purge('notification', chunk_size=3), 10)
+        self.assertEqual(sorted(magi_models.Notification.objects.values_list('pk', flat=True)), sorted(self.to_keep))
+        self.assertEqual(purge_old_items.purge('notification', chunk_size=3), 0)
+
+    def test_delete_in_chunks(self):
+        queryset = magi_models.Notification.objects.filter(seen=False)
+        with self.assertNumQueries(4):
+            self.assertEqual(purge_old_items.delete_in_chunks(queryset, chunk_size=3), 5)
+        self.assertEqual(magi_models.Notification.objects.count(), 20)
+
+    def test_command(self):
+        call_command('purge_old_items', 'notification', dry_run=True)
+        self.assertEqual(magi_models.Notification.objects.count(), 25)
+        call_command('purge_old_items', chunk_size=4, sleep=0.01)
+        self.assertEqual(magi_models.Notification.objects.count(), 15)
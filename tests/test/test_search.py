@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import sys, json, StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from magi.forms import MagiFiltersForm
+from magi.search import getSearchTerms, getItemSearchTerms, rebuildSearchIndex
+from magi import models as magi_models
+from test import models
+
+class IdolSearchFiltersForm(MagiFiltersForm):
+    search_fields = ['name', 'd_names', 'japanese_name']
+
+    class Meta(MagiFiltersForm.Meta):
+        model = models.Idol
+        fields = ()
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        models.Idol.SEARCH_INDEX_FIELDS = ['name', 'd_names']
+        self.user = models.User.objects.create(username='abc')
+        self.idols = [
+            models.Idol.objects.create(
+                owner=self.user, name=name, japanese_name=japanese_name,
+                d_names=json.dumps(d_names) if d_names else None)
+            for name, japanese_name, d_names in [
+                    (u'Honoka Kousaka', u'高坂穂乃果', { 'fr': u'Honoka la honorable' }),
+                    (u'Kotori Minami', u'南ことり', None),
+                    (u'Umi Sonoda', None, { 'ja': u'園田海未', 'fr': u'Umi de la mer' }),
+                    (u'Hanayo Koizumi', None, None),
+            ]
+        ]
+        self.form = IdolSearchFiltersForm.__new__(IdolSearchFiltersForm)
+
+    def tearDown(self):
+        del(models.Idol.SEARCH_INDEX_FIELDS)
+        sys.stdout = self.stdout
+
+    def search(self, value):
+        return list(self.form._search_to_queryset(models.Idol.objects.all(), None, value))
+
+    def getIndex(self, idol):
+        return dict(magi_models.SearchIndex.objects_of_model(models.Idol).filter(
+            item_id=idol.pk).values_list('term', 'weight'))
+
+    def test_terms(self):
+        self.assertEqual(getSearchTerms(u'Umi, de la MER!'), [u'umi', u'de', u'la', u'mer'])
+        self.assertEqual(getSearchTerms(None), [])
+        self.assertEqual(getItemSearchTerms(self.idols[0]), {
+            u'honoka': 2, u'kousaka': 1, u'la': 1, u'honorable': 1,
+        })
+
+    def test_index_on_save_and_delete(self):
+        self.assertEqual(self.getIndex(self.idols[1]), { u'kotori': 1, u'minami': 1 })
+        self.idols[1].name = u'Kotori Kotori'
+        self.idols[1].save()
+        self.assertEqual(self.getIndex(self.idols[1]), { u'kotori': 2 })
+        self.idols[1].delete()
+        self.assertEqual(self.getIndex(self.idols[1]), {})
+
+    def test_search(self):
+        # Start of words, in any field, any order, case insensitive
+        self.assertEqual(self.search(u'kou hono'), [self.idols[0]])
+        self.assertEqual(self.search(u'MER'), [self.idols[2]])
+        self.assertEqual(self.search(u'umi sonoda nope'), [])
+        # Not indexed: still searched with icontains
+        self.assertEqual(self.search(u'ことり'), [self.idols[1]])
+
+    def test_rank(self):
+        queryset = self.form._search_to_queryset(models.Idol.objects.all(), None, u'ho')
+        self.assertEqual(
+            [(idol.name, idol.search_rank) for idol in queryset.order_by('-search_rank')],
+            [(u'Honoka Kousaka', 3)],
+        )
+        queryset = self.form._search_to_queryset(models.Idol.objects.all(), None, u'k')
+        self.assertEqual(
+            [idol.name for idol in queryset.order_by('-search_rank', 'pk')],
+            [u'Honoka Kousaka', u'Kotori Minami', u'Hanayo Koizumi'],
+        )
+
+    def test_rebuild(self):
+        magi_models.SearchIndex.objects.all().delete()
+        models.Idol.objects.filter(pk=self.idols[3].pk).update(name=u'Hanayo')
+        self.assertEqual(rebuildSearchIndex(models.Idol, chunk_size=3), 4)
+        self.assertEqual(self.getIndex(self.idols[3]), { u'hanayo': 1 })
+        self.assertEqual(self.search(u'kotori'), [self.idols[1]])
+        call_command('rebuild_search_index', 'test.Idol')
+        self.assertEqual(magi_models.SearchIndex.objects.count(), 13)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from django import forms
+from django.test import TestCase
+from magi.forms import MagiFiltersForm, MagiFilter
+from magi.item_model import i_choices
+from magi.tools import getPresentChoices, getPresentChoicesWithOneQuery
+from test import models
+
+class IChoicesTestFiltersForm(MagiFiltersForm):
+    any_power_filter = MagiFilter(selectors=['i_power', 'i_super_power'])
+    attribute_name_filter = MagiFilter(to_queryset=lambda form, queryset, request, value: queryset.filter(
+        i_attribute=models.IChoicesTest.get_i('attribute', value)))
+
+    class Meta(MagiFiltersForm.Meta):
+        model = models.IChoicesTest
+        fields = ()
+
+class CCSVTestFiltersForm(MagiFiltersForm):
+    class Meta(MagiFiltersForm.Meta):
+        model = models.CCSVTest
+        fields = ()
+
+def getFiltersForm(form_class, fields):
+    # Only what's needed to filter, without a request or a collection
+    form = form_class.__new__(form_class)
+    form.fields = OrderedDict(fields)
+    return form
+
+class FilterFormChoicesTestCase(TestCase):
+    def setUp(self):
+        for attribute, power, super_power, rarity in [
+                ('smile', 0, 0, 'N'),
+                ('smile', 1, 0, 'R'),
+                ('cool', 0, 0, 'SR'),
+        ]:
+            models.IChoicesTest.objects.create(
+                i_attribute=models.IChoicesTest.get_i('attribute', attribute),
+                i_power=power, i_super_power=super_power,
+                i_rarity=models.IChoicesTest.get_i('rarity', rarity),
+            )
+        for abilities in [['fly', 'sing'], ['sing'], []]:
+            item = models.CCSVTest()
+            item.save_c('abilities', abilities)
+            item.save()
+        self.i_form = getFiltersForm(IChoicesTestFiltersForm, [
+            ('i_attribute', forms.ChoiceField(choices=i_choices(models.IChoicesTest.ATTRIBUTE_CHOICES))),
+            ('i_rarity', forms.ChoiceField(choices=i_choices(['N', 'R', 'SR']), initial=None)),
+            ('any_power', forms.ChoiceField(choices=[(0, 'Happy'), (1, 'Cool'), (2, 'Rock')])),
+            ('attribute_name', forms.ChoiceField(choices=[(c, c) for c in models.IChoicesTest.ATTRIBUTE_CHOICES])),
+        ])
+        self.c_form = getFiltersForm(CCSVTestFiltersForm, [
+            ('c_abilities', forms.MultipleChoiceField(choices=models.CCSVTest.ABILITIES_CHOICES)),
+        ])
+
+    def assertSameAsPerChoice(self, form, queryset, field_name, expected, num_queries=1):
+        """
+        num_queries: queries to get the present values, plus one per choice not found.
+        """
+        choices = list(form.fields[field_name].choices)
+        num_queries += len([choice for choice, verbose in choices if choice != '' and choice not in expected])
+        per_choice = [
+            choice for choice, verbose in choices
+            if form.filter_queryset(queryset, { field_name: choice }, None).count()
+        ]
+        self.assertEqual(per_choice, expected)
+        with self.assertNumQueries(num_queries):
+            self.assertEqual(getPresentChoices(form, queryset, field_name, choices), expected)
+
+    def test_i_choices(self):
+        self.assertSameAsPerChoice(self.i_form, models.IChoicesTest.objects.all(), 'i_attribute', [0, 2])
+
+    def test_c_choices(self):
+        self.assertSameAsPerChoice(self.c_form, models.CCSVTest.objects.all(), 'c_abilities', ['fly', 'sing'])
+
+    def test_multiple_selectors(self):
+        self.assertSameAsPerChoice(self.i_form, models.IChoicesTest.objects.all(), 'any_power', [0, 1], num_queries=2)
+
+    def test_other_fields_initial(self):
+        self.i_form.fields['i_rarity'].initial = models.IChoicesTest.get_i('rarity', 'SR')
+        self.assertSameAsPerChoice(self.i_form, models.IChoicesTest.objects.all(), 'i_attribute', [2])
+
+    def test_database_case_rules(self):
+        item = models.CCSVTest()
+        item.save_c('abilities', ['Heal'])
+        item.save()
+        queryset = models.CCSVTest.objects.all()
+        choices = list(self.c_form.fields['c_abilities'].choices)
+        # Not found in the values, so the database decides
+        self.assertEqual(getPresentChoicesWithOneQuery(self.c_form, queryset, 'c_abilities', choices), ['fly', 'sing'])
+        self.assertEqual(getPresentChoices(self.c_form, queryset, 'c_abilities', choices), [
+            choice for choice, verbose in choices
+            if self.c_form.filter_queryset(queryset, { 'c_abilities': choice }, None).exists()
+        ])
+
+    def test_to_queryset_fallback(self):
+        choices = list(self.i_form.fields['attribute_name'].choices)
+        queryset = models.IChoicesTest.objects.all()
+        self.assertEqual(getPresentChoicesWithOneQuery(self.i_form, queryset, 'attribute_name', choices), None)
+        with self.assertNumQueries(3):
+            self.assertEqual(getPresentChoices(self.i_form, queryset, 'attribute_name', choices), ['smile', 'cool'])
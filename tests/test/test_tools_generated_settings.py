@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import os, sys, shutil, tempfile, StringIO
+from django.test import TestCase
+from magi.urls import *
+from magi import urls
+from magi.magicollections import MagiCollection
+from magi.forms import MagiFiltersForm
+from magi.tools import (
+    generateSettingsSections,
+    getCachedFilterFormChoicesInputs,
+    getGeneratedSettingsFingerprint,
+    getMagiCirclesGeneratedSettingsSections,
+    loadGeneratedSettingsCache,
+    saveGeneratedSettingsCache,
+)
+from magi import models as magi_models
+from test import models
+
+class CardFilterForm(MagiFiltersForm):
+    cache_choices = ['idol']
+
+    class Meta(MagiFiltersForm.Meta):
+        model = models.Card
+        fields = ('idol',)
+
+class CardCollection(MagiCollection):
+    queryset = models.Card.objects.all()
+
+    class ListView(MagiCollection.ListView):
+        filter_form = CardFilterForm
+
+class GeneratedSettingsSectionsTestCase(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.user = models.User.objects.create(username='abc')
+        self.idol = models.Idol.objects.create(owner=self.user, name=u'Deby')
+        self.calls = []
+        self.sections = [
+            {
+                'name': 'idols',
+                'generate': self.generateIdols,
+                'inputs': [models.Idol],
+            },
+            {
+                'name': 'idols_news',
+                'generate': lambda state: self.call('idols_news', {
+                    'latest_news': [{ 'title': name } for name in state['idol_names']],
+                }),
+                'inputs': [],
+                'depends_on': ['idols'],
+            },
+            {
+                'name': 'always',
+                'generate': lambda state: self.call('always', { 'settings': { 'ALWAYS': True } }),
+            },
+        ]
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.cache_dir, 'generated_settings_sections.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        sys.stdout = self.stdout
+
+    def call(self, name, output):
+        self.calls.append(name)
+        return output
+
+    def generateIdols(self, state):
+        names = list(models.Idol.objects.values_list('name', flat=True))
+        return self.call('idols', {
+            'settings': { 'IDOLS': names },
+            'imports': ['from collections import OrderedDict'],
+            'state': { 'idol_names': names },
+        })
+
+    def generate(self, force=False):
+        self.calls = []
+        generated_settings, imports, state, cache = generateSettingsSections(
+            self.sections, cache=loadGeneratedSettingsCache(self.cache_file), force=force)
+        saveGeneratedSettingsCache(cache, self.cache_file)
+        return generated_settings, imports, state
+
+    def test_fingerprint(self):
+        fingerprint = getGeneratedSettingsFingerprint([models.Idol])
+        self.assertEqual(fingerprint, getGeneratedSettingsFingerprint([models.Idol]))
+        models.Idol.objects.create(owner=self.user, name=u'Alpha')
+        self.assertNotEqual(fingerprint, getGeneratedSettingsFingerprint([models.Idol]))
+        self.assertEqual(len(getGeneratedSettingsFingerprint([], per='day')), 1)
+
+    def test_fingerprint_hashed_fields(self):
+        inputs = [(models.Idol, [], ['name'])]
+        fingerprint = getGeneratedSettingsFingerprint(inputs)
+        self.assertEqual(fingerprint, getGeneratedSettingsFingerprint(inputs))
+        # Edited in place: same total and max pk
+        self.idol.name = u'Debby'
+        self.idol.save()
+        self.assertNotEqual(fingerprint, getGeneratedSettingsFingerprint(inputs))
+        self.assertEqual(getGeneratedSettingsFingerprint([models.Idol])[0][:3], fingerprint[0][:3])
+
+    def test_cached_filter_form_choices_inputs(self):
+        urls._addToCollections('card', CardCollection)
+        try:
+            inputs = dict([(model, hashed) for model, _fields, hashed in getCachedFilterFormChoicesInputs()])
+        finally:
+            del(urls.collections['card'])
+            urls.all_enabled.remove('card')
+        self.assertEqual(inputs[models.Card], ['idol_id'])
+        # Idol names are used as choices
+        self.assertIn('name', inputs[models.Idol])
+
+    def test_staff_configuration_edited(self):
+        configuration = magi_models.StaffConfiguration.objects.create(
+            owner=self.user, key='donate_image', verbose_key='Donate image', value=u'a.png')
+        section = [
+            section for section in getMagiCirclesGeneratedSettingsSections({})
+            if section['name'] == 'staff_configurations'
+        ][0]
+        generate = section['generate']
+        def _generate(state):
+            output = generate(state)
+            return self.call('staff_configurations', output)
+        self.sections = [dict(section, generate=_generate)]
+        _settings, _imports, state = self.generate()
+        self.assertEqual(self.calls, ['staff_configurations'])
+        self.assertEqual(state['staff_configurations']['donate_image'], u'a.png')
+        self.generate()
+        self.assertEqual(self.calls, [])
+        configuration.value = u'b.png'
+        configuration.save()
+        _settings, _imports, state = self.generate()
+        self.assertEqual(self.calls, ['staff_configurations'])
+        self.assertEqual(state['staff_configurations']['donate_image'], u'b.png')
+
+    def test_only_changed_sections(self):
+        generated_settings, imports, state = self.generate()
+        self.assertEqual(self.calls, ['idols', 'idols_news', 'always'])
+        self.assertEqual(generated_settings, { 'IDOLS': [u'Deby'], 'ALWAYS': True })
+        self.assertEqual(imports, ['from collections import OrderedDict'])
+        self.assertEqual(state['latest_news'], [{ 'title': u'Deby' }])
+
+        # Nothing changed: outputs of previous run are used
+        self.assertEqual(self.generate(), (generated_settings, imports, state))
+        self.assertEqual(self.calls, ['always'])
+
+        # Input changed: the section and the ones that depend on it get generated again
+        models.Idol.objects.create(owner=self.user, name=u'Alpha')
+        generated_settings, imports, state = self.generate()
+        self.assertEqual(self.calls, ['idols', 'idols_news', 'always'])
+        self.assertEqual(sorted(generated_settings['IDOLS']), [u'Alpha', u'Deby'])
+        self.assertEqual(len(state['latest_news']), 2)
+
+    def test_force(self):
+        self.generate()
+        self.generate(force=True)
+        self.assertEqual(self.calls, ['idols', 'idols_news', 'always'])
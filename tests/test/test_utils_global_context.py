@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+from django.utils.translation import get_language, activate as translation_activate
+from magi.urls import * # unused, just to make sure raw_context is updated
+from magi import utils
+
+def getRequest(path='/', language='en'):
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    request.LANGUAGE_CODE = language
+    return request
+
+class GlobalContextTestCase(TestCase):
+    def setUp(self):
+        self.old_language = get_language()
+        utils.resetStaticGlobalContexts()
+
+    def tearDown(self):
+        translation_activate(self.old_language)
+        utils.resetStaticGlobalContexts()
+
+    def test_static_context_memoized(self):
+        context = utils.globalContext(getRequest())
+        self.assertEqual(context['current_language'], 'en')
+        self.assertIn('javascript_translated_terms_json', context)
+        self.assertIn('#switchLanguage', context['cuteform_fields'])
+        self.assertNotIn('seasonal_to_context', context)
+        self.assertIs(
+            utils._staticGlobalContext('en', 'page')['javascript_translated_terms_json'],
+            context['javascript_translated_terms_json'],
+        )
+
+    def test_mutable_values_not_shared(self):
+        context = utils.globalContext(getRequest())
+        context['js_variables']['abc'] = True
+        context['cuteform_fields']['#abc'] = {}
+        context['corner_popups']['abc'] = {}
+        context['page_title'] = u'Abc'
+        context = utils.globalContext(getRequest())
+        self.assertEqual(context['js_variables'], {})
+        self.assertNotIn('#abc', context['cuteform_fields'])
+        self.assertEqual(context['corner_popups'], {})
+        self.assertEqual(context['page_title'], None)
+
+    def test_per_language(self):
+        translation_activate('fr')
+        context = utils.globalContext(getRequest(language='fr'))
+        self.assertEqual(context['current_language'], 'fr')
+        translation_activate('en')
+        self.assertEqual(utils.globalContext(getRequest())['current_language'], 'en')
+
+    def test_email(self):
+        context = utils.emailContext()
+        self.assertIn('consider_donating_sentence', context)
+        self.assertNotIn('javascript_translated_terms_json', context)
+        self.assertFalse(context['is_authenticated'])
+
+    def test_invalidated_when_generated_settings_change(self):
+        utils.globalContext(getRequest())
+        with override_settings(SEASONAL_SETTINGS={ 'test': { 'js_variables': { 'season': 'test' } } }):
+            # Same generated settings: still uses the static context computed before
+            self.assertEqual(utils.globalContext(getRequest())['js_variables'], {})
+            with override_settings(GENERATED_DATE=1):
+                self.assertEqual(utils.globalContext(getRequest())['js_variables'], { 'season': 'test' })
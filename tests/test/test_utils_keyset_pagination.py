@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import datetime
+from django.test import TestCase
+from django.utils import timezone
+from magi.utils import getKeysetOrdering, getKeysetCursor, getKeysetCondition
+from test import models
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = models.User.objects.create(username='abc')
+        idol = models.Idol.objects.create(owner=self.user, name=u'Deby')
+        now = timezone.now().replace(microsecond=123456)
+        # With ties and NULLs
+        for days in [3, None, 1, 3, None, 2, 1, 5, None, 3]:
+            models.Card.objects.create(owner=self.user, idol=idol, _cache_idol_last_update=(
+                None if days is None else now - datetime.timedelta(days=days)))
+
+    def getPages(self, queryset, page_size=3):
+        keyset_ordering = getKeysetOrdering(queryset, ['_cache_idol_last_update'])
+        queryset = queryset.order_by(*[
+            u'{}{}'.format('-' if descending else '', field.name) for field, descending in keyset_ordering])
+        pages, cursor = [], None
+        while True:
+            page = queryset
+            if cursor:
+                page = page.filter(getKeysetCondition(keyset_ordering, cursor))
+            page = list(page[:page_size])
+            if not page:
+                return pages, list(queryset)
+            pages += page
+            cursor = getKeysetCursor(page[-1], keyset_ordering)
+
+    def test_ordering(self):
+        queryset = models.Card.objects.order_by('-_cache_idol_last_update')
+        self.assertEqual(
+            [(field.name, descending) for field, descending in getKeysetOrdering(
+                queryset, ['_cache_idol_last_update'])],
+            [('_cache_idol_last_update', True), ('id', True)],
+        )
+        self.assertEqual(len(getKeysetOrdering(models.Card.objects.order_by('pk'), [])), 1)
+        self.assertEqual(getKeysetOrdering(queryset, ['creation']), None)
+        self.assertEqual(getKeysetOrdering(models.Card.objects.order_by('?'), ['creation']), None)
+
+    def test_same_as_offset(self):
+        for ordering in ['-_cache_idol_last_update', '_cache_idol_last_update']:
+            pages, expected = self.getPages(models.Card.objects.order_by(ordering))
+            self.assertEqual(pages, expected)
+            self.assertEqual(len(pages), 10)
+
+    def test_new_items_dont_shift_pages(self):
+        queryset = models.Card.objects.order_by('-_cache_idol_last_update')
+        keyset_ordering = getKeysetOrdering(queryset, ['_cache_idol_last_update'])
+        queryset = queryset.order_by('-_cache_idol_last_update', '-id')
+        first_page = list(queryset[:3])
+        cursor = getKeysetCursor(first_page[-1], keyset_ordering)
+        models.Card.objects.create(owner=self.user, idol=first_page[0].idol, _cache_idol_last_update=timezone.now())
+        # With an offset, the last item of the first page would be shown again
+        self.assertEqual(list(queryset[3:6])[0], first_page[-1])
+        self.assertEqual(
+            list(queryset.filter(getKeysetCondition(keyset_ordering, cursor))[:3]),
+            list(queryset[4:7]),
+        )
+
+    def test_invalid_cursor(self):
+        keyset_ordering = getKeysetOrdering(models.Card.objects.order_by('pk'), [])
+        self.assertEqual(getKeysetCondition(keyset_ordering, u'nope'), None)
+        self.assertEqual(getKeysetCondition(keyset_ordering, u'WzEsIDJd'), None) # [1, 2]
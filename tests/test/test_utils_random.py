@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import random
+from django.test import TestCase
+from magi import utils
+from magi.utils import getRandomItem
+from test import models
+
+class RandomItemTestCase(TestCase):
+    def setUp(self):
+        random.seed(42)
+        utils._random_pools.clear()
+        self.user = models.User.objects.create(username='abc')
+        self.idols = [
+            models.Idol.objects.create(owner=self.user, name=u'Idol {}'.format(i), japanese_name=(u'アイドル' if i % 3 == 0 else None))
+            for i in range(12)
+        ]
+        self.japanese = [idol for idol in self.idols if idol.japanese_name]
+
+    def assertRandom(self, queryset, expected, num_queries=None, **kwargs):
+        picked = set()
+        for i in range(60):
+            if num_queries is None:
+                picked.add(getRandomItem(queryset, **kwargs))
+                continue
+            with self.assertNumQueries(num_queries):
+                picked.add(getRandomItem(queryset, **kwargs))
+        self.assertEqual(picked, set(expected))
+
+    def test_without_filters(self):
+        # First pk, last pk, item
+        self.assertRandom(models.Idol.objects.all(), self.idols, 3)
+
+    def test_filtered_small(self):
+        # Count, item
+        self.assertRandom(models.Idol.objects.filter(japanese_name__isnull=False), self.japanese, 2)
+
+    def test_filtered_with_pk(self):
+        self.assertRandom(
+            models.Idol.objects.filter(japanese_name__isnull=False), self.japanese, small_count=2)
+
+    def test_filtered_clustered(self):
+        # Matching items all at the start of the table: still random, not always the last one
+        queryset = models.Idol.objects.filter(pk__in=[idol.pk for idol in self.idols[:3]], name__isnull=False)
+        picked = [getRandomItem(queryset, small_count=1) for i in range(300)]
+        self.assertEqual(set(picked), set(self.idols[:3]))
+        self.assertTrue(picked.count(self.idols[2]) < 150)
+
+    def test_empty(self):
+        self.assertEqual(getRandomItem(models.Idol.objects.filter(name=u'Nope')), None)
+        self.assertEqual(getRandomItem(models.Idol.objects.none(), pool_size=5), None)
+        models.Idol.objects.all().delete()
+        self.assertEqual(getRandomItem(models.Idol.objects.all()), None)
+
+    def test_pool(self):
+        queryset = models.Idol.objects.filter(japanese_name__isnull=False)
+        with self.assertNumQueries(2):
+            getRandomItem(queryset, pool_size=3)
+        pool = utils._random_pools.values()[0][1]
+        self.assertEqual(len(pool), 3)
+        self.assertRandom(queryset, [idol for idol in self.japanese if idol.pk in pool], 1, pool_size=3)
+        # Deleted item in the pool: another item, and a new pool next time
+        models.Idol.objects.filter(pk__in=pool).delete()
+        self.assertIn(getRandomItem(queryset, pool_size=3), [idol for idol in self.japanese if idol.pk not in pool])
+        self.assertEqual(utils._random_pools, {})
+
+    def test_pools_max(self):
+        for i in range(utils.RANDOM_POOLS_MAX + 5):
+            getRandomItem(models.Idol.objects.filter(pk__gte=i), pool_size=3)
+        self.assertTrue(len(utils._random_pools) <= utils.RANDOM_POOLS_MAX)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import sys, StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from magi.item_model import update_translation_index, rebuild_translation_index
+from magi.utils import filterByTranslatedValue, FilterByMode
+from magi import models as magi_models
+from test import test_utils_filterbytranslatedvalue as base
+from test import models
+
+class FilterByTranslationIndexTestCase(base.FilterByTranslationTestCase):
+    """
+    Same results as when searching in the JSON, except it's always strict.
+    """
+    def setUp(self):
+        models.TranslatedNames.INDEXED_TRANSLATED_FIELDS = ['name']
+        super(FilterByTranslationIndexTestCase, self).setUp()
+
+    def tearDown(self):
+        del(models.TranslatedNames.INDEXED_TRANSLATED_FIELDS)
+
+    def test_contains_strict(self):
+        # Even without strict, ru value isn't returned
+        self.assertEqual(self._toNameList(filterByTranslatedValue(
+            self.queryset, 'name',
+            language='ja',
+            value=u'world',
+            mode=FilterByMode.Contains,
+        )), [])
+
+    def test_endswith_strict(self):
+        self.assertEqual(self._toNameList(filterByTranslatedValue(
+            self.queryset, 'name',
+            language='ja',
+            value=u'world!',
+            mode=FilterByMode.EndsWith,
+        )), [])
+
+    def test_no_json_search(self):
+        queryset = filterByTranslatedValue(
+            self.queryset, 'name', language='ja', value=u'あいうえお', mode=FilterByMode.Exact)
+        where = unicode(queryset.query).split('WHERE', 1)[1]
+        self.assertNotIn('d_names', where)
+        self.assertIn('normalized_value', where)
+
+    def test_case_insensitive(self):
+        self.assertEqual(self._toNameList(filterByTranslatedValue(
+            self.queryset, 'name',
+            language='ru',
+            value=u'WELCOME to the world!',
+            mode=FilterByMode.Exact,
+            case_insensitive=True,
+        )), ['hello world'])
+        self.assertEqual(self._toNameList(filterByTranslatedValue(
+            self.queryset, 'name',
+            language='ru',
+            value=u'WELCOME',
+            mode=FilterByMode.StartsWith,
+            case_insensitive=True,
+        )), ['hello world'])
+
+class TranslationIndexTestCase(TestCase):
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        models.TranslatedNames.INDEXED_TRANSLATED_FIELDS = ['name']
+        self.item = models.TranslatedNames.objects.create(name='abcdef')
+        self.item.add_d('names', 'ja', u'あいうえお')
+        self.item.add_d('names', 'ru', u'абв')
+        self.item.save()
+
+    def tearDown(self):
+        del(models.TranslatedNames.INDEXED_TRANSLATED_FIELDS)
+        sys.stdout = self.stdout
+
+    def getIndex(self):
+        return sorted(magi_models.TranslationIndex.objects.values_list(
+            'item_id', 'field_name', 'language', 'value'))
+
+    def test_updated_on_save(self):
+        self.assertEqual(self.getIndex(), [
+            (self.item.pk, u'name', u'ja', u'あいうえお'),
+            (self.item.pk, u'name', u'ru', u'абв'),
+        ])
+        self.item.add_d('names', 'ja', u'かきくけこ')
+        self.item.remove_d('names', 'ru')
+        self.item.save()
+        self.assertEqual(self.getIndex(), [(self.item.pk, u'name', u'ja', u'かきくけこ')])
+        # Nothing changed
+        with self.assertNumQueries(1):
+            self.assertEqual(update_translation_index([self.item]), (0, 0))
+        self.item.delete()
+        self.assertEqual(self.getIndex(), [])
+
+    def test_rebuild(self):
+        models.TranslatedNames.objects.filter(pk=self.item.pk).update(d_names=None)
+        other_item = models.TranslatedNames.objects.create(name='ghi', d_names=u'{"ja": "ジ"}')
+        magi_models.TranslationIndex.objects.all().delete()
+        self.assertEqual(rebuild_translation_index(models.TranslatedNames, chunk_size=1), 1)
+        self.assertEqual(self.getIndex(), [(other_item.pk, u'name', u'ja', u'ジ')])
+        magi_models.TranslationIndex.objects.all().delete()
+        call_command('rebuild_translation_index', 'test.TranslatedNames')
+        self.assertEqual(self.getIndex(), [(other_item.pk, u'name', u'ja', u'ジ')])
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from django.core.cache import cache
+from django.test import TestCase
+from magi.utils import getCachedCount
+from magi.views_collections import _paginate
+from test import models
+
+class PaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = models.User.objects.create(username='abc')
+        self.idols = [
+            models.Idol.objects.create(owner=self.user, name=u'Idol {}'.format(i))
+            for i in range(7)
+        ]
+        self.queryset = models.Idol.objects.order_by('pk')
+
+    def test_exact(self):
+        items, total, is_exact = _paginate(self.queryset, 1, 3, total_results=7)
+        self.assertEqual((list(items), total, is_exact), (self.idols[3:6], 7, True))
+
+    def test_has_next_page(self):
+        with self.assertNumQueries(1):
+            items, total, is_exact = _paginate(self.queryset, 0, 3)
+        # Only known that there are more than 3
+        self.assertEqual((items, total, is_exact), (self.idols[:3], 4, False))
+        # Last page: exact
+        self.assertEqual(_paginate(self.queryset, 2, 3), (self.idols[6:], 7, True))
+        self.assertEqual(_paginate(self.queryset, 1, 4), (self.idols[4:], 7, True))
+        # Page after the last one: counted
+        with self.assertNumQueries(2):
+            self.assertEqual(_paginate(self.queryset, 5, 3), ([], 7, True))
+
+    def test_after_cursor(self):
+        queryset = self.queryset.filter(pk__gt=self.idols[3].pk)
+        self.assertEqual(_paginate(queryset, 2, 2, after_cursor=True), (self.idols[4:6], 7, False))
+        self.assertEqual(list(_paginate(queryset, 2, 2, total_results=7, after_cursor=True)[0]), self.idols[4:6])
+        # Empty page after the cursor
+        queryset = self.queryset.filter(pk__gt=self.idols[6].pk)
+        self.assertEqual(_paginate(queryset, 5, 3, after_cursor=True), ([], 15, False))
+        self.assertEqual(_paginate(queryset, 5, 3, after_cursor=True, count_queryset=self.queryset), ([], 7, True))
+
+    def test_cached_count(self):
+        queryset = models.Idol.objects.filter(name__startswith=u'Idol')
+        with self.assertNumQueries(1):
+            self.assertEqual(getCachedCount(queryset), (7, True))
+            # From the cache: may be outdated
+            self.assertEqual(getCachedCount(queryset), (7, False))
+        # Per filters
+        self.assertEqual(getCachedCount(queryset.filter(pk=self.idols[0].pk)), (1, True))
+        self.assertEqual(getCachedCount(models.Idol.objects.none()), (0, True))
+        # Until it expires
+        expired_queryset = models.Idol.objects.filter(name__startswith=u'I')
+        self.assertEqual(getCachedCount(expired_queryset, timeout=0), (7, True))
+        models.Idol.objects.create(owner=self.user, name=u'Idol 7')
+        self.assertEqual(getCachedCount(queryset), (7, False))
+        self.assertEqual(getCachedCount(expired_queryset), (8, True))
+
+    def test_estimated_total(self):
+        # Outdated count from the cache: an estimate until the last page
+        self.assertEqual(_paginate(self.queryset, 0, 3, total_results=5, total_results_is_exact=False), (self.idols[:3], 5, False))
+        self.assertEqual(_paginate(self.queryset, 1, 3, total_results=5, total_results_is_exact=False), (self.idols[3:6], 7, False))
+        self.assertEqual(_paginate(self.queryset, 2, 3, total_results=5, total_results_is_exact=False), (self.idols[6:], 7, True))